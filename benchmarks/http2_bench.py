@@ -0,0 +1,112 @@
+"""Compares HTTP/1.1 and HTTP/2 transports of the AsyncKaraboProxy for many
+concurrent small reads (get_device_config_path).
+
+A local h2-capable server (hypercorn, serving both HTTP/1.1 and HTTP/2
+over cleartext) answers every request after a fixed delay, emulating the
+WebProxy. Requires: pip install hypercorn 'httpx[http2]'
+
+Usage: python benchmarks/http2_bench.py [--requests N] [--concurrency C]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..",
+                       "src")
+sys.path.insert(0, SRC_DIR)
+
+PROPERTY_RESPONSE = b'{"value": 28, "timestamp": 1720508183.5, "tid": 0}'
+
+
+async def app(scope, receive, send):
+    """ASGI application answering every request with a property value."""
+    if scope["type"] != "http":
+        return
+    await asyncio.sleep(float(os.environ.get("BENCH_SERVER_DELAY", "0.005")))
+    await send({"type": "http.response.start", "status": 200,
+                "headers": [(b"content-type", b"application/json")]})
+    await send({"type": "http.response.body", "body": PROPERTY_RESPONSE})
+
+
+def serve(port: int):
+    from hypercorn.asyncio import serve as hypercorn_serve
+    from hypercorn.config import Config
+    config = Config()
+    config.bind = [f"127.0.0.1:{port}"]
+    config.loglevel = "ERROR"
+    config.h2_max_concurrent_streams = 1000
+    # Don't recycle connections during the benchmark
+    config.keep_alive_max_requests = 10 ** 9
+    asyncio.run(hypercorn_serve(app, config))
+
+
+async def run_client(transport, url: str, requests: int,
+                     concurrency: int) -> list:
+    from karabo_proxy.async_karabo_proxy import AsyncKaraboProxy
+
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def read(index: int):
+        async with semaphore:
+            start = time.perf_counter()
+            await client.get_device_config_path(f"DEVICE_{index % 50}",
+                                                "flushInterval")
+            latencies.append(time.perf_counter() - start)
+
+    async with AsyncKaraboProxy(url, transport=transport) as client:
+        # Warm up the connections
+        await asyncio.gather(*(read(i) for i in range(concurrency)))
+        latencies.clear()
+        start = time.perf_counter()
+        await asyncio.gather(*(read(i) for i in range(requests)))
+        elapsed = time.perf_counter() - start
+    return elapsed, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--port", type=int, default=8686)
+    parser.add_argument("--serve", action="store_true",
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        serve(args.port)
+        return
+
+    from karabo_proxy.transports.aiohttp_transport import AiohttpTransport
+    from karabo_proxy.transports.httpx_transport import HttpxAsyncTransport
+
+    server = subprocess.Popen(
+        [sys.executable, __file__, "--serve", "--port", str(args.port)])
+    time.sleep(2)
+    url = f"http://127.0.0.1:{args.port}"
+    transports = {
+        # aiohttp's default pool has at most 100 connections
+        "HTTP/1.1 aiohttp": lambda: AiohttpTransport(),
+        "HTTP/1.1 httpx": lambda: HttpxAsyncTransport(),
+        "HTTP/2 httpx": lambda: HttpxAsyncTransport(http2=True),
+    }
+    try:
+        print(f"{args.requests} reads, {args.concurrency} concurrent")
+        print(f"{'transport':<20}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+        for name, factory in transports.items():
+            elapsed, latencies = asyncio.run(run_client(
+                factory(), url, args.requests, args.concurrency))
+            latencies.sort()
+            p50 = statistics.median(latencies) * 1000
+            p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+            print(f"{name:<20}{args.requests / elapsed:>10.0f}"
+                  f"{p50:>10.1f}{p99:>10.1f}")
+    finally:
+        server.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Measures the time and memory taken by importing Karabo-Proxy and
+creating its clients, each scenario in a fresh interpreter.
+
+Usage: python benchmarks/import_time.py [--repeat N]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..",
+                       "src")
+
+SCENARIOS = {
+    "import karabo_proxy": "import karabo_proxy",
+    "sync client (requests)": (
+        "from karabo_proxy import SyncKaraboProxy\n"
+        "SyncKaraboProxy('http://localhost')"),
+    "sync client (urllib3)": (
+        "from karabo_proxy import SyncKaraboProxy\n"
+        "SyncKaraboProxy('http://localhost', transport='urllib3')"),
+    "async client (aiohttp)": (
+        "from karabo_proxy import AsyncKaraboProxy\n"
+        "AsyncKaraboProxy('http://localhost')"),
+    "both clients": (
+        "from karabo_proxy import AsyncKaraboProxy, SyncKaraboProxy\n"
+        "SyncKaraboProxy('http://localhost')\n"
+        "AsyncKaraboProxy('http://localhost')"),
+}
+
+# Reports the wall time of the statements and the peak resident memory of
+# the process.
+_PROBE = """
+import resource, sys, time
+start = time.perf_counter()
+{statements}
+elapsed = time.perf_counter() - start
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(elapsed, rss_kb, len(sys.modules))
+"""
+
+
+def run_scenario(statements: str) -> tuple:
+    output = subprocess.check_output(
+        [sys.executable, "-c", _PROBE.format(statements=statements)],
+        cwd=SRC_DIR, text=True)
+    elapsed, rss_kb, modules = output.split()
+    return float(elapsed), int(rss_kb), int(modules)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    # Baseline of an interpreter that imports nothing
+    _, base_rss_kb, base_modules = run_scenario("pass")
+    print(f"{'scenario':<26}{'median ms':>10}{'+RSS KiB':>10}"
+          f"{'+modules':>10}")
+    for name, statements in SCENARIOS.items():
+        runs = [run_scenario(statements) for _ in range(args.repeat)]
+        median_ms = statistics.median(run[0] for run in runs) * 1000
+        rss_kb = max(run[1] for run in runs) - base_rss_kb
+        modules = runs[0][2] - base_modules
+        print(f"{name:<26}{median_ms:>10.1f}{rss_kb:>10}{modules:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,5 +6,24 @@
 # Karabo itself is licensed under the terms of the MPL 2.0 license.
 # flake8: noqa
 
-from .async_karabo_proxy import AsyncKaraboProxy
-from .sync_karabo_proxy import SyncKaraboProxy
+import importlib
+
+# The clients are imported on first access, so that importing the package
+# doesn't import the HTTP libraries of both clients.
+_LAZY_ATTRIBUTES = {
+    "AsyncKaraboProxy": ".async_karabo_proxy",
+    "SyncKaraboProxy": ".sync_karabo_proxy",
+}
+
+__all__ = list(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        module = importlib.import_module(_LAZY_ATTRIBUTES[name], __name__)
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,119 @@
+#
+# Alignment of property values of several devices on train ids (the tid of
+# PropertyInfo).
+#
+import bisect
+from dataclasses import dataclass, field
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+from .data.device_config import PropertyInfo
+
+# (device_id, property name)
+PropertyKey = Tuple[str, str]
+
+
+@dataclass
+class AlignedFrame:
+    """Values of several properties belonging to the same train."""
+    # The train of the frame: the latest tid among the values
+    tid: Optional[int]
+    values: Dict[PropertyKey, PropertyInfo] = field(default_factory=dict)
+    # Are all the values within the tolerance of the tid of the frame?
+    aligned: bool = False
+    # Reasons of the properties that could not be read
+    errors: Dict[PropertyKey, str] = field(default_factory=dict)
+    # Number of read rounds it took to build the frame
+    rounds: int = 0
+
+    @property
+    def spread(self) -> Optional[int]:
+        """The difference between the latest and the earliest tids."""
+        if not self.values:
+            return None
+        tids = [prop.tid for prop in self.values.values()]
+        return max(tids) - min(tids)
+
+
+def laggards(frame: AlignedFrame, keys: Sequence[PropertyKey],
+             tolerance: int) -> List[PropertyKey]:
+    """Updates the tid and the alignment of a frame and returns the keys to
+    read again: the ones missing or behind the frame's tid by more than the
+    tolerance."""
+    frame.tid = max((prop.tid for prop in frame.values.values()),
+                    default=None)
+    lagging = [key for key in keys
+               if key not in frame.values
+               or frame.values[key].tid < frame.tid - tolerance]
+    frame.aligned = not lagging
+    return lagging
+
+
+def align_samples(histories: Dict[Hashable, Sequence[PropertyInfo]],
+                  tolerance: int = 0) -> List[AlignedFrame]:
+    """Aligns histories of property values - e.g. from a recorder - on
+    train ids.
+
+    For each value of the first history, the values of the other histories
+    nearest in tid are looked up; a frame is returned if they are all within
+    tolerance of it. Histories must be sorted by tid. The lookups are
+    vectorized if NumPy is available.
+    """
+    if not histories:
+        return []
+    keys = list(histories)
+    reference = histories[keys[0]]
+    ref_tids = [prop.tid for prop in reference]
+    matches = {keys[0]: list(range(len(reference)))}
+    within = [True] * len(reference)
+    for key in keys[1:]:
+        tids = [prop.tid for prop in histories[key]]
+        indices, ok = _nearest(tids, ref_tids, tolerance)
+        matches[key] = indices
+        within = [w and o for w, o in zip(within, ok)]
+    frames = []
+    for i, ref in enumerate(reference):
+        if within[i]:
+            frames.append(AlignedFrame(
+                tid=ref.tid, aligned=True,
+                values={key: histories[key][matches[key][i]]
+                        for key in keys}))
+    return frames
+
+
+def _numpy():
+    """NumPy, imported on first use so that importing the clients doesn't
+    import it, or None if it is not installed."""
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def _nearest(tids: List[int], targets: List[int],
+             tolerance: int) -> Tuple[List[int], List[bool]]:
+    """Indices of the tids nearest to each target, and whether they are
+    within the tolerance."""
+    if not tids:
+        return [0] * len(targets), [False] * len(targets)
+    np = _numpy()
+    if np is not None:
+        tids_array = np.asarray(tids)
+        targets_array = np.asarray(targets)
+        right = np.clip(np.searchsorted(tids_array, targets_array),
+                        0, len(tids) - 1)
+        left = np.clip(right - 1, 0, len(tids) - 1)
+        use_left = (np.abs(tids_array[left] - targets_array)
+                    <= np.abs(tids_array[right] - targets_array))
+        indices = np.where(use_left, left, right)
+        ok = np.abs(tids_array[indices] - targets_array) <= tolerance
+        return indices.tolist(), ok.tolist()
+    indices, ok = [], []
+    for target in targets:
+        right = min(bisect.bisect_left(tids, target), len(tids) - 1)
+        left = max(right - 1, 0)
+        index = (left if abs(tids[left] - target) <= abs(tids[right] - target)
+                 else right)
+        indices.append(index)
+        ok.append(abs(tids[index] - target) <= tolerance)
+    return indices, ok
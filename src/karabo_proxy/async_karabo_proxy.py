@@ -1,114 +1,390 @@
+import asyncio
 import json
-from dataclasses import asdict
-from typing import Any, Dict, Optional
+import time
+from typing import (
+    Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Mapping,
+    Optional, Tuple, Union)
 
-from aiohttp import ClientResponse, ClientSession
-
-from .data.device_config import DeviceConfigInfo, PropertyInfo, PropertyValue
+from .alignment import AlignedFrame, PropertyKey, laggards
+from .batch import (
+    DEFAULT_MAX_CONCURRENCY, AsyncKeyedLock, aiter_batch, arun_batch,
+    injected_values, write_responses)
+from .concurrency import AdaptiveConcurrency, ConcurrencyStats
+from .data.device_config import (
+    DeviceConfigInfo, InjectedPropertyValues, PropertyInfo, PropertyValue)
 from .data.topology import DevicesInfo, TopologyInfo
 from .data.web_proxy_responses import WriteResponse
+from .decoding import (
+    DECODING_COMPACT, DECODING_DICT, DECODING_LAZY, DecodeOffload, KeyLayouts,
+    LazyDeviceConfig, LazySchema, check_decoding, compact_configuration)
+from .encoding import EncodedPayload, encode_json
+from .hedging import Hedger, HedgingPolicy, HedgingStats
 from .message_format import (
     error_401_put, error_403_put, error_422_put, error_on_operation,
-    invalid_response_format)
+    error_timeout, injected_property_exists, invalid_response_format)
+from .property_cache import PropertyCache
+from .rate_limit import (
+    INJECTED, READ, SLOT, WRITE, RateLimiter, RateLimits, RateLimitStats,
+    request_category)
+from .read_planner import PATHS, ReadPlanner, ReadPlannerStats, properties_of
+from .scheduler import (
+    Priority, RequestScheduler, SchedulerStats, current_priority, priority)
+from .schema_cache import DEVICES_INFO_TTL, SchemaCache, schema_cache_key
+from .snapshot import (
+    ConfigurationSnapshot, restore_changes, snapshot_values,
+    writable_properties)
+from .subscriptions import (
+    SUBSCRIBE_AUTO, SUBSCRIBE_SSE, WEBSOCKET_PATH, Subscription,
+    check_subscribe_mode, event_stream_url, subscribe_message)
+from .tracing import Tracer, instrument
+from .transports import (
+    AsyncTransport, PushChannel, TimeoutArg, TransportResponse, WarmUpMetrics,
+    as_timeout, create_async_transport)
+
+# Priority of the requests, by category, outside of a priority block
+_DEFAULT_PRIORITIES = {
+    SLOT: Priority.HIGH,
+    WRITE: Priority.HIGH,
+    READ: Priority.NORMAL,
+    INJECTED: Priority.NORMAL,
+}
 
 
 class AsyncKaraboProxy:
 
-    def __init__(self, base_url: str):
+    def __init__(self, base_url: str,
+                 schema_cache: Optional[SchemaCache] = None,
+                 transport: Union[str, AsyncTransport, None] = None,
+                 timeout: TimeoutArg = None,
+                 property_cache: Optional[PropertyCache] = None,
+                 tracer: Optional[Tracer] = None,
+                 rate_limits: Optional[RateLimits] = None,
+                 scheduler: Optional[RequestScheduler] = None,
+                 concurrency: Optional[AdaptiveConcurrency] = None,
+                 decoding: str = DECODING_DICT,
+                 read_planner: Optional[ReadPlanner] = None,
+                 hedging: Optional[HedgingPolicy] = None,
+                 decode_offload: Optional[DecodeOffload] = None):
+        """Parameters:
+        base_url(str): the URL of the WebProxy instance.
+
+        schema_cache(SchemaCache): optional on-disk cache for the schemas
+        retrieved by get_device_schema.
+
+        transport(str or AsyncTransport): the HTTP transport to use, either
+        an instance or the name of a backend - "aiohttp" (default),
+        "httpx" or "http2" (httpx multiplexing requests over HTTP/2 with
+        fallback to HTTP/1.1). The backend library is only imported when
+        needed.
+
+        timeout(Timeout or float): the default timeouts of the requests -
+        a Timeout with total, connect and read timeouts or the total timeout
+        in seconds. Every method accepts a timeout argument overriding the
+        default for that call. A request that times out raises TimeoutError.
+        Without any timeout, the defaults of the backend apply.
+
+        property_cache(PropertyCache): optional in-memory cache serving
+        repeated get_device_config_path reads within a staleness bound.
+
+        tracer(Tracer): records spans of the operations of the client and of
+        their phases, saved to a Chrome trace file when the client is
+        closed. Without a tracer, tracing has no overhead.
+
+        rate_limits(RateLimits): token bucket limits of the rates of the
+        reads, writes, slot executions and injected property operations.
+        Requests exceeding their limit wait for their turn or, in reject
+        mode, raise RateLimitExceeded.
+
+        scheduler(RequestScheduler): limits the requests in flight and
+        serves the waiting ones by priority - slot executions and writes
+        first, then reads and, last, the snapshot operations. Requests sent
+        within a karabo_proxy.scheduler.priority block get its priority.
+
+        concurrency(AdaptiveConcurrency): adapts the number of operations in
+        flight of the batch operations to the latency of the requests,
+        raising it while the latency stays flat and lowering it when the
+        latency grows or requests time out or fail with a server error.
+
+        decoding(str): how device configurations are decoded - "dict"
+        (default), "compact", which stores the property names once for
+        all the devices of a class and only the values, timestamps and tids
+        per device, or "lazy", which returns views of the responses - for
+        schemas too - decoding a property when it is first accessed. See
+        karabo_proxy.decoding.
+
+        read_planner(ReadPlanner): chooses how get_device_properties reads
+        several properties from the latencies of the past reads; a default
+        planner is used if not given.
+
+        hedging(HedgingPolicy): opt-in hedging of the read requests - a read
+        that takes longer than most do is duplicated, possibly to a replica
+        WebProxy, and the first response is used. Cuts the tail latency of
+        the reads at the cost of some extra requests, bounded by the budget
+        of the policy.
+
+        decode_offload(DecodeOffload): decodes the responses above a size
+        threshold - e.g. the topology of a large installation - in a thread
+        or a process pool, so that their decoding doesn't block the event
+        loop. Without it, all responses are decoded in the event loop.
+        """
         self.base_url = base_url
+        self._schema_cache = schema_cache
+        self._property_cache = property_cache
+        self._rate_limiter = None
+        if rate_limits is not None:
+            self._rate_limiter = RateLimiter(rate_limits)
+        self._scheduler = scheduler
+        self._concurrency = concurrency
+        self._decoding = check_decoding(decoding)
+        self._read_planner = read_planner or ReadPlanner()
+        self._decode_offload = decode_offload
+        self._key_layouts = KeyLayouts()
+        self._devices_info: Dict[str, Dict[str, Any]] = {}
+        self._devices_info_time: Optional[float] = None
+        self._timeout = as_timeout(timeout)
+        self._device_locks = AsyncKeyedLock()
+        self._transport = create_async_transport(transport)
         self._headers = {
             "content-type": "application/json"}
         if not self.base_url.endswith("/"):
             # ensures the base_url ends with a path separator; this will be
             # assumed throughout the class
             self.base_url = f"{self.base_url}/"
+        self._hedger = None
+        if hedging is not None:
+            self._hedger = Hedger(hedging, self.base_url)
+        self._tracer = tracer
+        if tracer is not None:
+            self._transport.tracer = tracer
+            instrument(self, tracer)
+
+    async def __aenter__(self) -> "AsyncKaraboProxy":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """Closes the connections kept alive by the client - and saves
+        its trace, if any."""
+        await self._transport.close()
+        if self._decode_offload is not None:
+            self._decode_offload.shutdown()
+        if self._tracer is not None:
+            self._tracer.save()
+
+    async def warm_up(self, connections: int = 4,
+                      timeout: TimeoutArg = None) -> WarmUpMetrics:
+        """Opens keep-alive connections to the WebProxy - resolving its host
+        name - ahead of the first requests, with as many concurrent HEAD
+        requests. The connections kept are limited by the connection pool of
+        the transport.
+
+        Returns:
+        WarmUpMetrics: the connections opened and the time it took.
+        """
+        async def open_connection(_: int) -> float:
+            start = time.monotonic()
+            await self._request("HEAD", self.base_url, None, "warming up",
+                                timeout)
+            return time.monotonic() - start
+
+        metrics = WarmUpMetrics()
+        start = time.monotonic()
+        results = await arun_batch(range(connections), open_connection,
+                                   connections)
+        metrics.elapsed = time.monotonic() - start
+        for result in results.values():
+            if isinstance(result, Exception):
+                metrics.errors.append(str(result))
+            else:
+                metrics.latencies.append(result)
+        metrics.latencies.sort()
+        metrics.connections = len(metrics.latencies)
+        return metrics
+
+    @property
+    def hedging_stats(self) -> Optional[HedgingStats]:
+        """Counts of the hedged requests, if hedging is enabled."""
+        if self._hedger is None:
+            return None
+        return self._hedger.stats
+
+    @property
+    def read_planner_stats(self) -> ReadPlannerStats:
+        """The strategies chosen for the reads of several properties, and
+        the last plan."""
+        return self._read_planner.stats
+
+    @property
+    def rate_limit_stats(self) -> Dict[str, RateLimitStats]:
+        """The calls and wait times per rate limited category of
+        requests."""
+        if self._rate_limiter is None:
+            return {}
+        return self._rate_limiter.stats
+
+    @property
+    def concurrency_stats(self) -> Optional[ConcurrencyStats]:
+        """The adaptive concurrency of the batch operations, if enabled."""
+        if self._concurrency is None:
+            return None
+        return self._concurrency.stats
+
+    @property
+    def scheduler_stats(self) -> Dict[str, SchedulerStats]:
+        """The queue depths and wait times per priority class."""
+        if self._scheduler is None:
+            return {}
+        return {p.name: stats for p, stats in self._scheduler.stats.items()}
 
     def set_access_token(self, access_token: str):
         self._headers["Authorization"] = f"Bearer {access_token}"
 
-    async def get_topology(self) -> TopologyInfo:
+    async def get_topology(
+            self, timeout: TimeoutArg = None) -> TopologyInfo:
         """Retrieves the topology of the topic containing the connected
         WebProxy."""
-        async with ClientSession(headers=self._headers) as session:
-            async with session.get(f"{self.base_url}topology.json") as resp:
-                data = await self._handle_get_response(
-                    resp, "getting topology")
-                try:
-                    topology_info = TopologyInfo(**data)
-                    return topology_info
-                except TypeError as te:
-                    raise RuntimeError(invalid_response_format(str(te)))
+        data = await self._get(f"{self.base_url}topology.json",
+                               "getting topology", timeout)
+        try:
+            topology_info = TopologyInfo(**data)
+            return topology_info
+        except TypeError as te:
+            raise RuntimeError(invalid_response_format(str(te)))
 
-    async def get_devices(self) -> DevicesInfo:
+    async def get_devices(
+            self, timeout: TimeoutArg = None) -> DevicesInfo:
         """Retrieves the devices in the topic containing the connected
         WebProxy."""
-        async with ClientSession(headers=self._headers) as session:
-            async with session.get(f"{self.base_url}devices.json") as resp:
-                data = await self._handle_get_response(
-                    resp, "getting devices")
-                try:
-                    devices_info = DevicesInfo(**data)
-                    return devices_info
-                except TypeError as te:
-                    raise RuntimeError(invalid_response_format(str(te)))
+        data = await self._get(f"{self.base_url}devices.json",
+                               "getting devices", timeout)
+        try:
+            devices_info = DevicesInfo(**data)
+            return devices_info
+        except TypeError as te:
+            raise RuntimeError(invalid_response_format(str(te)))
 
     async def get_device_configuration(
-            self, device_id: str) -> DeviceConfigInfo:
+            self, device_id: str,
+            timeout: TimeoutArg = None) -> DeviceConfigInfo:
         """Retrieves the configuration of a specified device."""
-        async with ClientSession(headers=self._headers) as session:
-            async with session.get(
-                    f"{self.base_url}devices/{device_id}/config.json") as resp:
-                data = await self._handle_get_response(
-                    resp, "getting device configuration")
+        start = time.monotonic()
+        if self._decoding == DECODING_LAZY:
+            device_config = await self._get(
+                f"{self.base_url}devices/{device_id}/config.json",
+                "getting device configuration", timeout,
+                LazyDeviceConfig.decode)
+        else:
+            data = await self._get(
+                f"{self.base_url}devices/{device_id}/config.json",
+                "getting device configuration", timeout)
+            if self._decoding == DECODING_COMPACT:
+                device_config = compact_configuration(data,
+                                                      self._key_layouts)
+            else:
                 try:
                     device_config = dict(**data)
-                    return device_config
                 except TypeError as te:
                     raise RuntimeError(invalid_response_format(str(te)))
+        self._read_planner.observe_full(
+            device_id, time.monotonic() - start, len(device_config))
+        return device_config
 
     async def set_device_configuration(
             self, device_id: str,
-            properties: Dict[str, PropertyValue]) -> WriteResponse:
+            properties: Union[Dict[str, PropertyValue], EncodedPayload],
+            timeout: TimeoutArg = None) -> WriteResponse:
         """Sets a given set of properties of a specified device (if the
-        device is reconfigurable)"""
-        async with ClientSession(headers=self._headers) as session:
-            async with session.put(
-                f"{self.base_url}devices/{device_id}/config.json",
-                    json=properties) as resp:
-                return await self._handle_write_response(
-                    resp, "set configuration", device_id)
+        device is reconfigurable). Vector values may be NumPy arrays; an
+        EncodedPayload of the properties is sent as is."""
+        try:
+            return await self._write(
+                "PUT", f"{self.base_url}devices/{device_id}/config.json",
+                properties, "set configuration", device_id, timeout)
+        finally:
+            if self._property_cache is not None:
+                if isinstance(properties, dict):
+                    for property_name in properties:
+                        self._property_cache.invalidate(device_id,
+                                                        property_name)
+                else:
+                    self._property_cache.invalidate(device_id)
 
     async def get_device_config_path(
-            self, device_id: str, property_name: str) -> PropertyInfo:
+            self, device_id: str, property_name: str,
+            timeout: TimeoutArg = None,
+            max_age: Optional[float] = None) -> PropertyInfo:
         """Retrieves the value and time attributes of a specified device
-        property."""
-        async with ClientSession(headers=self._headers) as session:
-            async with session.get(
-                    f"{self.base_url}devices/"
-                    f"{device_id}.{property_name}/config.json") as resp:
-                data = await self._handle_get_response(
-                    resp, "getting device property")
-                try:
-                    property_info = PropertyInfo(**data)
-                    return property_info
-                except TypeError as te:
-                    raise RuntimeError(invalid_response_format(str(te)))
+        property.
+
+        If the client has a property cache, a value retrieved at most
+        max_age seconds ago - by default the max_age of the cache - is
+        returned from the cache.
+        """
+        cache = self._property_cache
+        if cache is not None:
+            cached = cache.get((device_id, property_name), max_age)
+            if cached is not None:
+                return cached
+            generation = cache.generation()
+        start = time.monotonic()
+        data = await self._get(
+            f"{self.base_url}devices/{device_id}.{property_name}/config.json",
+            "getting device property", timeout)
+        self._read_planner.observe_path(time.monotonic() - start)
+        try:
+            property_info = PropertyInfo(**data)
+        except TypeError as te:
+            raise RuntimeError(invalid_response_format(str(te)))
+        if cache is not None:
+            cache.put((device_id, property_name), property_info, generation,
+                      start)
+        return property_info
+
+    async def get_device_properties(
+            self, device_id: str, property_names: Iterable[str],
+            timeout: TimeoutArg = None) -> Dict[str, PropertyInfo]:
+        """Retrieves the values and time attributes of several properties of
+        a device, either with a request per property, sent concurrently, or
+        with a single request for the whole configuration - whichever the
+        read planner of the client predicts to be cheaper.
+
+        Raises:
+        RuntimeError if a property is not in the configuration of the
+        device.
+        """
+        property_names = list(dict.fromkeys(property_names))
+        plan = self._read_planner.plan(device_id, len(property_names))
+        if plan.strategy == PATHS:
+            values = await asyncio.gather(*(
+                self.get_device_config_path(device_id, name, timeout,
+                                            max_age=0)
+                for name in property_names))
+            return dict(zip(property_names, values))
+        config = await self.get_device_configuration(device_id, timeout)
+        return properties_of(device_id, config, property_names)
 
     async def set_device_config_path(
             self, device_id: str, property_name: str,
-            property_value: PropertyValue) -> WriteResponse:
+            property_value: Union[PropertyValue, EncodedPayload],
+            timeout: TimeoutArg = None) -> WriteResponse:
         """Sets a property of a specified device (if the device is
-        reconfigurable)."""
-        async with ClientSession(headers=self._headers) as session:
-            async with session.put(
-                f"{self.base_url}devices/"
-                f"{device_id}.{property_name}/config.json",
-                    json=property_value) as resp:
-                return await self._handle_write_response(
-                    resp, "set property", f"{device_id}.{property_name}")
+        reconfigurable). A vector value may be a NumPy array; an
+        EncodedPayload of the value is sent as is."""
+        url = (f"{self.base_url}devices/{device_id}.{property_name}"
+               "/config.json")
+        try:
+            return await self._write(
+                "PUT", url, property_value, "set property",
+                f"{device_id}.{property_name}", timeout)
+        finally:
+            if self._property_cache is not None:
+                self._property_cache.invalidate(device_id, property_name)
 
     async def get_device_schema(
-            self, device_id: str) -> Dict[str, Dict[str, Any]]:
+            self, device_id: str,
+            timeout: TimeoutArg = None) -> Dict[str, Dict[str, Any]]:
         """Retrieves the schema of a specified device.
 
         Parameters:
@@ -132,37 +408,82 @@ class AsyncKaraboProxy:
             }
          ...
         }
+
+        If the client has a schema cache, the schema is looked up in the
+        cache first and, on a cache hit, returned as a read-only mapping with
+        the same structure.
+
+        With lazy decoding, the schema is returned as a read-only LazySchema
+        mapping decoding the attributes of a property when first accessed.
         """
-        async with ClientSession(headers=self._headers) as session:
-            async with session.get(
-                    f"{self.base_url}devices/{device_id}/schema.json") as resp:
-                data = await self._handle_get_response(
-                    resp, "getting device schema")
-                try:
-                    schema = dict(**data)
-                    return schema
-                except TypeError as te:
-                    raise RuntimeError(invalid_response_format(str(te)))
+        cache_key = None
+        if self._schema_cache is not None:
+            cache_key = await self._get_schema_cache_key(device_id,
+                                                         timeout)
+            if cache_key is not None:
+                cached_schema = self._schema_cache.get(*cache_key)
+                if cached_schema is not None:
+                    self._read_planner.observe_size(device_id,
+                                                    len(cached_schema))
+                    return cached_schema
+        if self._decoding == DECODING_LAZY:
+            schema = await self._get(
+                f"{self.base_url}devices/{device_id}/schema.json",
+                "getting device schema", timeout, LazySchema.decode)
+        else:
+            data = await self._get(
+                f"{self.base_url}devices/{device_id}/schema.json",
+                "getting device schema", timeout)
+            try:
+                schema = dict(**data)
+            except TypeError as te:
+                raise RuntimeError(invalid_response_format(str(te)))
+        if cache_key is not None:
+            self._schema_cache.put(*cache_key, schema)
+        self._read_planner.observe_size(device_id, len(schema))
+        return schema
+
+    async def _get_schema_cache_key(
+            self, device_id: str,
+            timeout: TimeoutArg = None) -> Optional[Tuple[str, str]]:
+        """Returns the key of the schema of a device in the schema cache. The
+        devices' instance info is fetched once and reused for up to
+        DEVICES_INFO_TTL seconds - also for devices missing from it, whose
+        schemas are not cached until it is fetched again."""
+        now = time.monotonic()
+        if (self._devices_info_time is None
+                or now - self._devices_info_time > DEVICES_INFO_TTL):
+            self._devices_info = (await self.get_devices(timeout)).devices
+            self._devices_info_time = now
+        instance_info = self._devices_info.get(device_id)
+        if instance_info is None:
+            return None
+        return schema_cache_key(instance_info)
 
     async def execute_slot(
             self, device_id: str, slot_name: str,
             slot_params: Optional[
-                Dict[str, PropertyValue]] = None) -> WriteResponse:
+                Dict[str, PropertyValue]] = None,
+            timeout: TimeoutArg = None) -> WriteResponse:
         """Executes a device slot. Supports both parameterless slots (commands)
         and slots with parameters. The results of the slot execution (if any)
         will be available as a dictionay in the field 'reply' of the response
         """
-        async with ClientSession(headers=self._headers) as session:
-            async with session.put(
+        try:
+            return await self._write(
+                "PUT",
                 f"{self.base_url}devices/{device_id}/slot/{slot_name}.json",
-                    json=slot_params) as resp:
-                return await self._handle_write_response(
-                    resp, f"execute slot {slot_name}", device_id)
+                slot_params, f"execute slot {slot_name}", device_id, timeout)
+        finally:
+            # A slot may change any property of its device
+            if self._property_cache is not None:
+                self._property_cache.invalidate(device_id)
 
 # region Injected Property endpoints
 
     async def add_injected_property(
-            self, property_name: str, property_type: str) -> WriteResponse:
+            self, property_name: str, property_type: str,
+            timeout: TimeoutArg = None) -> WriteResponse:
         """Adds a property to the set of injected properties of the WebProxy
         instance.
 
@@ -183,16 +504,14 @@ class AsyncKaraboProxy:
         RuntimeError if the property name is invalid, the property type is not
         supported or the user is not authorized for the operation.
         """
-        async with ClientSession(headers=self._headers) as session:
-            async with session.post(
-                    f"{self.base_url}property/"
-                    f"{property_name}/config.json",
-                    json={"valueType": property_type}) as resp:
-                return await self._handle_write_response(
-                    resp, "inject property", property_name)
+        return await self._write(
+            "POST", f"{self.base_url}property/{property_name}/config.json",
+            {"valueType": property_type}, "inject property", property_name,
+            timeout)
 
     async def get_injected_property(
-            self, property_name: str) -> PropertyInfo:
+            self, property_name: str,
+            timeout: TimeoutArg = None) -> PropertyInfo:
         """Retrieves the value of a specified injected property.
 
         Parameters:
@@ -205,20 +524,19 @@ class AsyncKaraboProxy:
         Raises:
         RuntimeError if property_name is not a known injected property.
         """
-        async with ClientSession(headers=self._headers) as session:
-            async with session.get(
-                    f"{self.base_url}property/"
-                    f"{property_name}/config.json") as resp:
-                data = await self._handle_get_response(
-                    resp, "getting injected property value")
-                try:
-                    injected_property = PropertyInfo(**data)
-                    return injected_property
-                except TypeError as te:
-                    raise RuntimeError(invalid_response_format(str(te)))
+        data = await self._get(
+            f"{self.base_url}property/{property_name}/config.json",
+            "getting injected property value", timeout)
+        try:
+            injected_property = PropertyInfo(**data)
+            return injected_property
+        except TypeError as te:
+            raise RuntimeError(invalid_response_format(str(te)))
 
     async def set_injected_property(
-            self, property_name: str, property: PropertyInfo) -> WriteResponse:
+            self, property_name: str,
+            property: Union[PropertyInfo, EncodedPayload],
+            timeout: TimeoutArg = None) -> WriteResponse:
         """Sets the value and timing attributes of a property previously
         injected into the WebProxy instance.
 
@@ -226,7 +544,8 @@ class AsyncKaraboProxy:
         property_name(str): the name of the injected property.
 
         property(PropertyInfo): the value and timing attributes to be set for
-        the injected property
+        the injected property. The value may be a NumPy array. An
+        EncodedPayload of a PropertyInfo is sent as is.
 
         Returns:
         WriteResponse: was the operation successful? If not, what was the
@@ -236,16 +555,14 @@ class AsyncKaraboProxy:
         RuntimeError if the injected property was not found, the property type
         is not supported or the user is not authorized for the operation.
         """
-        async with ClientSession(headers=self._headers) as session:
-            async with session.put(
-                    f"{self.base_url}property/"
-                    f"{property_name}/config.json",
-                    json=asdict(property)) as resp:
-                return await self._handle_write_response(
-                    resp, "set injected property value", property_name)
-
-    async def delete_injected_property(self,
-                                       property_name: str) -> WriteResponse:
+        return await self._write(
+            "PUT", f"{self.base_url}property/{property_name}/config.json",
+            property, "set injected property value", property_name,
+            timeout)
+
+    async def delete_injected_property(
+            self, property_name: str,
+            timeout: TimeoutArg = None) -> WriteResponse:
         """Removes the specified property from the set of properties injected
         into the WebProxy instance.
 
@@ -260,22 +577,578 @@ class AsyncKaraboProxy:
         RuntimeError if the injected property was not found, or the user is
         not authorized for the operation.
         """
-        async with ClientSession(headers=self._headers) as session:
-            async with session.delete(
-                    f"{self.base_url}property/"
-                    f"{property_name}/config.json") as resp:
-                return await self._handle_write_response(
-                    resp, "delete injected property", property_name)
+        return await self._write(
+            "DELETE", f"{self.base_url}property/{property_name}/config.json",
+            None, "delete injected property", property_name, timeout)
+
+    async def add_injected_properties(
+            self, properties: Mapping[str, str], ensure: bool = False,
+            max_concurrency: Optional[int] = None,
+            deadline: Optional[float] = None, timeout: TimeoutArg = None
+    ) -> Dict[str, WriteResponse]:
+        """Adds several properties to the set of injected properties of the
+        WebProxy instance concurrently.
+
+        Parameters:
+        properties(Mapping[str, str]): the types of the properties to add by
+        name - see add_injected_property.
+
+        ensure(bool): skips the properties already injected, reported as
+        successful, so that adding the properties is idempotent. Costs a read
+        of each property; the type of the existing properties isn't checked.
+        Only a property the WebProxy reports as not found is added: the
+        properties whose read fails otherwise - e.g. times out or isn't
+        authorized - are reported as unsuccessful.
+
+        max_concurrency(int): the maximum number of properties being added
+        at any time. Defaults to DEFAULT_MAX_CONCURRENCY or, with adaptive
+        concurrency, to its maximum limit.
+
+        deadline(float): the maximum duration of the whole operation, in
+        seconds. The properties not added by then are reported as
+        unsuccessful responses.
+
+        timeout(Timeout or float): the timeouts of each request.
+
+        Returns:
+        Dict[str, WriteResponse]: the results by property name. Errors are
+        reported as unsuccessful responses.
+        """
+        async def add(property_name: str) -> WriteResponse:
+            if ensure and await self._is_injected(property_name, timeout):
+                return WriteResponse(
+                    success=True,
+                    reason=injected_property_exists(property_name))
+            return await self.add_injected_property(
+                property_name, properties[property_name], timeout)
+
+        return await self._write_injected_properties(
+            properties, add, max_concurrency, deadline)
+
+    async def get_injected_properties(
+            self, property_names: Iterable[str],
+            max_concurrency: Optional[int] = None,
+            deadline: Optional[float] = None, timeout: TimeoutArg = None
+    ) -> InjectedPropertyValues:
+        """Retrieves the values of several injected properties concurrently.
+
+        Parameters are the ones of add_injected_properties.
+
+        Returns:
+        InjectedPropertyValues: the values by property name and the reasons
+        of the properties that could not be read.
+        """
+        async def get(property_name: str) -> PropertyInfo:
+            return await self.get_injected_property(property_name, timeout)
+
+        results = await arun_batch(
+            dict.fromkeys(property_names), get,
+            self._max_concurrency(max_concurrency), deadline,
+            self._concurrency)
+        return injected_values(results)
+
+    async def set_injected_properties(
+            self, properties: Mapping[str, Union[PropertyInfo,
+                                                 EncodedPayload]],
+            max_concurrency: Optional[int] = None,
+            deadline: Optional[float] = None, timeout: TimeoutArg = None
+    ) -> Dict[str, WriteResponse]:
+        """Sets the values and timing attributes of several injected
+        properties concurrently.
+
+        Parameters:
+        properties(Mapping[str, PropertyInfo]): the values to set by property
+        name - see set_injected_property.
+
+        The other parameters and the results are the ones of
+        add_injected_properties.
+        """
+        async def set_property(property_name: str) -> WriteResponse:
+            return await self.set_injected_property(
+                property_name, properties[property_name], timeout)
+
+        return await self._write_injected_properties(
+            properties, set_property, max_concurrency, deadline)
+
+    async def delete_injected_properties(
+            self, property_names: Iterable[str],
+            max_concurrency: Optional[int] = None,
+            deadline: Optional[float] = None, timeout: TimeoutArg = None
+    ) -> Dict[str, WriteResponse]:
+        """Removes several injected properties concurrently. The parameters
+        and the results are the ones of add_injected_properties."""
+        async def delete(property_name: str) -> WriteResponse:
+            return await self.delete_injected_property(property_name,
+                                                       timeout)
+
+        return await self._write_injected_properties(
+            property_names, delete, max_concurrency, deadline)
+
+    async def _write_injected_properties(
+            self, property_names: Iterable[str],
+            write: Callable[[str], Awaitable[WriteResponse]],
+            max_concurrency: Optional[int],
+            deadline: Optional[float]) -> Dict[str, WriteResponse]:
+        results = await arun_batch(
+            dict.fromkeys(property_names), write,
+            self._max_concurrency(max_concurrency), deadline,
+            self._concurrency)
+        return write_responses(results)
+
+# endregion
+
+# region Batch operations
+
+    async def get_configuration_snapshot(
+            self, device_ids: Iterable[str],
+            max_concurrency: Optional[int] = None,
+            deadline: Optional[float] = None, timeout: TimeoutArg = None
+    ) -> ConfigurationSnapshot:
+        """Captures the configurations of a set of devices, retrieved
+        concurrently.
+
+        Parameters:
+        device_ids(Iterable[str]): the devices to capture.
+
+        max_concurrency(int): the maximum number of configurations being
+        retrieved at any time. Defaults to DEFAULT_MAX_CONCURRENCY or, with
+        adaptive concurrency, to its maximum limit.
+
+        deadline(float): the maximum duration of the whole operation, in
+        seconds. The configurations not retrieved by then are
+        reported as errors of the snapshot.
+
+        timeout(Timeout or float): the timeouts of each request.
+
+        Returns:
+        ConfigurationSnapshot: the property values of the devices. Devices
+        whose configuration could not be retrieved are in the errors of the
+        snapshot.
+        """
+        async def get_configuration(device_id: str) -> DeviceConfigInfo:
+            with priority(Priority.LOW, override=False):
+                return await self.get_device_configuration(device_id,
+                                                           timeout)
+
+        snapshot = ConfigurationSnapshot(configurations={})
+        results = await arun_batch(device_ids, get_configuration,
+                                   self._max_concurrency(max_concurrency),
+                                   deadline, self._concurrency)
+        for device_id, result in results.items():
+            if isinstance(result, Exception):
+                snapshot.errors[device_id] = str(result)
+            else:
+                snapshot.configurations[device_id] = snapshot_values(result)
+        return snapshot
+
+    async def restore_configuration_snapshot(
+            self, snapshot: ConfigurationSnapshot,
+            max_concurrency: Optional[int] = None,
+            deadline: Optional[float] = None, timeout: TimeoutArg = None
+    ) -> Dict[str, WriteResponse]:
+        """Restores the configurations of the devices in a snapshot.
+
+        Only the reconfigurable properties whose live values differ from the
+        snapshot are written, in a single request per device.
+
+        Parameters:
+        snapshot(ConfigurationSnapshot): the configurations to restore.
+
+        max_concurrency(int): the maximum number of devices being restored
+        at any time. Defaults to DEFAULT_MAX_CONCURRENCY or, with adaptive
+        concurrency, to its maximum limit.
+
+        deadline(float): the maximum duration of the whole operation, in
+        seconds. The devices not restored by then are reported
+        as unsuccessful writes.
+
+        timeout(Timeout or float): the timeouts of each request.
+
+        Returns:
+        Dict[str, WriteResponse]: the results of the writes by device id.
+        Devices whose live configuration already matches the snapshot are not
+        included.
+        """
+        async def restore_device(device_id: str) -> Optional[WriteResponse]:
+            with priority(Priority.LOW, override=False):
+                live_config, schema = await asyncio.gather(
+                    self.get_device_configuration(device_id, timeout),
+                    self.get_device_schema(device_id, timeout))
+                changes = restore_changes(snapshot.configurations[device_id],
+                                          snapshot_values(live_config),
+                                          writable_properties(schema))
+                if not changes:
+                    return None
+                return await self.set_device_configuration(device_id, changes,
+                                                           timeout)
+
+        results = {}
+        restored = await arun_batch(
+            snapshot.configurations, restore_device,
+            self._max_concurrency(max_concurrency), deadline,
+            self._concurrency)
+        for device_id, result in restored.items():
+            if isinstance(result, Exception):
+                results[device_id] = WriteResponse(success=False,
+                                                   reason=str(result))
+            elif result is not None:
+                results[device_id] = result
+        return results
+
+    async def execute_slots(
+            self, device_ids: Iterable[str], slot_name: str,
+            slot_params: Optional[Dict[str, PropertyValue]] = None,
+            max_concurrency: Optional[int] = None,
+            deadline: Optional[float] = None, timeout: TimeoutArg = None
+    ) -> Dict[str, WriteResponse]:
+        """Executes the same slot on several devices concurrently.
+
+        Parameters:
+        device_ids(Iterable[str]): the devices whose slot should be executed.
+
+        slot_name(str): the slot to execute.
+
+        slot_params(dict): the parameters of the slot, if any.
+
+        max_concurrency(int): the maximum number of slot executions in flight
+        at any time. No device ever has more than one slot execution of a
+        batch operation of this client in flight. Defaults to
+        DEFAULT_MAX_CONCURRENCY or, with adaptive concurrency, to its maximum
+        limit.
+
+        deadline(float): the maximum duration of the whole operation, in
+        seconds. The slot executions not completed by then are
+        reported as unsuccessful responses.
+
+        timeout(Timeout or float): the timeouts of each request.
+
+        Returns:
+        Dict[str, WriteResponse]: the results of the slot executions, with
+        their replies, by device id. Errors reaching the WebProxy are reported
+        as unsuccessful responses.
+        """
+        device_ids = list(dict.fromkeys(device_ids))
+        results = {device_id: result async for device_id, result in
+                   self.iter_execute_slots(device_ids, slot_name,
+                                           slot_params, max_concurrency,
+                                           deadline, timeout)}
+        return {device_id: results[device_id] for device_id in device_ids}
+
+    async def iter_execute_slots(
+            self, device_ids: Iterable[str], slot_name: str,
+            slot_params: Optional[Dict[str, PropertyValue]] = None,
+            max_concurrency: Optional[int] = None,
+            deadline: Optional[float] = None, timeout: TimeoutArg = None
+    ) -> AsyncIterator[Tuple[str, WriteResponse]]:
+        """Executes the same slot on several devices concurrently, like
+        execute_slots, yielding (device_id, WriteResponse) pairs as the slot
+        executions complete.
+        """
+        async def execute(device_id: str) -> WriteResponse:
+            async with self._device_locks.hold(device_id):
+                return await self.execute_slot(device_id, slot_name,
+                                               slot_params, timeout)
+
+        async for device_id, result in aiter_batch(
+                dict.fromkeys(device_ids), execute,
+                self._max_concurrency(max_concurrency), deadline,
+                self._concurrency):
+            if isinstance(result, Exception):
+                result = WriteResponse(success=False, reason=str(result))
+            yield device_id, result
+
+    async def read_aligned(
+            self, keys: Iterable[PropertyKey], tolerance: int = 0,
+            deadline: float = 1.0, retry_interval: float = 0.05,
+            max_concurrency: Optional[int] = None,
+            timeout: TimeoutArg = None) -> AlignedFrame:
+        """Reads several device properties concurrently and aligns them on
+        train id.
+
+        The properties behind the latest train read by more than the
+        tolerance are read again until all of them are aligned or the
+        deadline expires.
+
+        Parameters:
+        keys(Iterable[Tuple[str, str]]): the (device_id, property name) pairs
+        to read.
+
+        tolerance(int): the maximum difference, in trains, between the tids
+        of the values of an aligned frame.
+
+        deadline(float): the maximum duration of the read, in seconds.
+
+        retry_interval(float): the pause between two rounds of reads, in
+        seconds.
+
+        max_concurrency(int): the maximum number of reads in flight at any
+        time. Defaults to DEFAULT_MAX_CONCURRENCY or, with adaptive
+        concurrency, to its maximum limit.
+
+        timeout(Timeout or float): the timeouts of each request.
+
+        Returns:
+        AlignedFrame: the latest values read, with their train, whether they
+        are aligned and the errors of the properties that could not be read.
+        """
+        async def read(key: PropertyKey) -> PropertyInfo:
+            return await self.get_device_config_path(*key, timeout=timeout,
+                                                     max_age=0)
+
+        keys = list(dict.fromkeys(keys))
+        frame = AlignedFrame(tid=None)
+        end = time.monotonic() + deadline
+        to_read = keys
+        while to_read and time.monotonic() < end:
+            if frame.rounds:
+                await asyncio.sleep(
+                    max(min(retry_interval, end - time.monotonic()), 0.0))
+            frame.rounds += 1
+            results = await arun_batch(
+                to_read, read, self._max_concurrency(max_concurrency),
+                max(end - time.monotonic(), 0), self._concurrency)
+            for key, result in results.items():
+                if isinstance(result, Exception):
+                    frame.errors[key] = str(result)
+                else:
+                    frame.values[key] = result
+                    frame.errors.pop(key, None)
+            to_read = laggards(frame, keys, tolerance)
+        return frame
+
+    def _max_concurrency(self, max_concurrency: Optional[int]) -> int:
+        """The maximum number of operations in flight of a batch operation:
+        the given one or, by default, DEFAULT_MAX_CONCURRENCY - or the
+        maximum limit of the adaptive concurrency, if enabled."""
+        if max_concurrency is not None:
+            return max_concurrency
+        if self._concurrency is not None:
+            return self._concurrency.max_limit
+        return DEFAULT_MAX_CONCURRENCY
+
+# endregion
+
+# region Subscriptions
+
+    def subscribe(self, keys: Iterable[PropertyKey],
+                  mode: str = SUBSCRIBE_AUTO, poll_interval: float = 1.0,
+                  reconnect_delay: float = 1.0,
+                  max_concurrency: Optional[int] = None,
+                  timeout: TimeoutArg = None) -> Subscription:
+        """Subscribes to the changes of device properties, pushed by the
+        WebProxy over a websocket or a server-sent events stream if it - and
+        the transport - offers them, or polled otherwise.
+
+        Parameters:
+        keys(Iterable[Tuple[str, str]]): the (device_id, property path) pairs
+        to subscribe to.
+
+        mode(str): "auto" (default) tries a websocket, then a server-sent
+        events stream; "websocket" and "sse" only try theirs. All modes fall
+        back to polling - the only method of "polling".
+
+        poll_interval(float): the period of the polls, in seconds.
+
+        reconnect_delay(float): the pause before reopening a push channel
+        that was lost, in seconds.
+
+        max_concurrency(int): the maximum number of devices read
+        concurrently by a poll. Defaults to DEFAULT_MAX_CONCURRENCY or, with
+        adaptive concurrency, to its maximum limit.
+
+        timeout(Timeout or float): the timeouts of the reads and of the
+        opening of the push channels.
+
+        Returns:
+        Subscription: an asynchronous iterator, and context manager, of the
+        PropertyChanges - the current values of the properties first. See
+        karabo_proxy.subscriptions.
+        """
+        keys = list(dict.fromkeys(keys))
+
+        async def open_channel(mode: str) -> PushChannel:
+            return await self._open_push_channel(mode, keys, timeout)
+
+        async def read(device_id: str,
+                       paths: List[str]) -> Dict[str, PropertyInfo]:
+            return await self.get_device_properties(device_id, paths,
+                                                    timeout)
+
+        return Subscription(keys, open_channel, read,
+                            check_subscribe_mode(mode), poll_interval,
+                            reconnect_delay,
+                            self._max_concurrency(max_concurrency),
+                            self._concurrency)
+
+    async def _open_push_channel(self, mode: str, keys: List[PropertyKey],
+                                 timeout: TimeoutArg) -> PushChannel:
+        """Opens the push channel of a subscription mode, subscribed to the
+        changes of the given properties."""
+        timeout = as_timeout(timeout) or self._timeout
+        if mode == SUBSCRIBE_SSE:
+            opening = self._transport.open_event_stream(
+                event_stream_url(self.base_url, keys), self._headers,
+                timeout)
+        else:
+            opening = self._transport.open_websocket(
+                f"{self.base_url}{WEBSOCKET_PATH}", self._headers, timeout)
+        try:
+            if timeout is not None and timeout.total is not None:
+                channel = await asyncio.wait_for(opening, timeout.total)
+            else:
+                channel = await opening
+        except (asyncio.TimeoutError, TimeoutError) as te:
+            raise TimeoutError(
+                error_timeout("opening a subscription")) from te
+        if mode != SUBSCRIBE_SSE:
+            try:
+                await channel.send(subscribe_message(keys))
+            except BaseException:
+                await channel.close()
+                raise
+        return channel
 
 # endregion
 
-    async def _handle_get_response(self,
-                                   resp: ClientResponse,
-                                   operation_name: str) -> Dict[str, Any]:
+    async def _is_injected(self, property_name: str,
+                           timeout: TimeoutArg = None) -> bool:
+        """Whether a property is among the injected ones. Only the not found
+        response of the WebProxy means it isn't: other errors are raised."""
+        operation_name = "getting injected property value"
+        resp = await self._request(
+            "GET", f"{self.base_url}property/{property_name}/config.json",
+            None, operation_name, timeout)
+        if resp.status == 404:
+            return False
+        self._handle_get_response(resp, operation_name)
+        return True
+
+    async def _get(self, url: str, operation_name: str,
+                   timeout: TimeoutArg = None,
+                   decode: Callable[[bytes], Any] = json.loads) -> Any:
+        """Sends a GET request and returns its json payload decoded by
+        decode - off the event loop for the large payloads, if a decode
+        offload is set."""
+        resp = await self._request("GET", url, None, operation_name, timeout)
+        offload = self._decode_offload
+        if (offload is not None and resp.status == 200
+                and offload.offloads(resp.body)):
+            return await self._decode_offloaded(decode, resp.body)
+        return self._handle_get_response(resp, operation_name, decode)
+
+    async def _decode_offloaded(self, decode: Callable[[bytes], Any],
+                                body: bytes) -> Any:
+        try:
+            return await self._decode_offload.decode(decode, body)
+        except Exception as e:
+            raise RuntimeError(invalid_response_format(str(e)))
+
+    async def _write(self, method: str, url: str, payload: Any,
+                     operation_name: str, operand_id: str,
+                     timeout: TimeoutArg = None) -> WriteResponse:
+        """Sends a write request - POST, PUT or DELETE - with an optional json
+        payload."""
+        body = None
+        if payload is not None:
+            body = encode_json(payload)
+        resp = await self._request(method, url, body, operation_name,
+                                   timeout)
+        return self._handle_write_response(resp, operation_name, operand_id)
+
+    async def _request(self, method: str, url: str, body: Optional[bytes],
+                       operation_name: str,
+                       timeout: TimeoutArg) -> TransportResponse:
+        """Sends a request with the given or the default timeouts; the total
+        timeout, which includes the time waiting for the rate limiter and
+        the scheduler, is enforced here for all transports. GETs are hedged
+        if hedging is enabled."""
+        timeout = as_timeout(timeout) or self._timeout
+        path = url[len(self.base_url):]
+        if self._scheduler is not None:
+            request_priority = current_priority()
+            if request_priority is None:
+                request_priority = _DEFAULT_PRIORITIES[
+                    request_category(method, path)]
+
+        async def limited(send: Callable[[], Awaitable[TransportResponse]]
+                          ) -> TransportResponse:
+            if self._rate_limiter is not None:
+                await self._rate_limiter.async_acquire(method, path)
+            if self._scheduler is not None:
+                return await self._scheduled(send, request_priority)
+            return await send()
+
+        if method == "GET" and self._hedger is not None:
+            sent = False
+
+            def send(base_url: str) -> Awaitable[TransportResponse]:
+                nonlocal sent
+
+                def send_to_url() -> Awaitable[TransportResponse]:
+                    return self._transport.request(
+                        method, f"{base_url}{path}", self._headers, body,
+                        timeout)
+
+                if not sent:
+                    # The first request was given its token and slot
+                    sent = True
+                    return send_to_url()
+                # The duplicate is rate limited and scheduled too
+                return limited(send_to_url)
+
+            def send_request() -> Awaitable[TransportResponse]:
+                return self._hedger.request(send, self.base_url)
+        else:
+            def send_request() -> Awaitable[TransportResponse]:
+                return self._transport.request(method, url, self._headers,
+                                               body, timeout)
+
+        # The latency observed by the adaptive concurrency is the time spent
+        # in the transport, not waiting for a token or a scheduler slot
+        started: Optional[float] = None
+        # Whether the request was cancelled while in the transport
+        cancelled = False
+
+        async def timed_request() -> TransportResponse:
+            nonlocal started, cancelled
+            started = time.monotonic()
+            try:
+                return await send_request()
+            except asyncio.CancelledError:
+                cancelled = True
+                raise
+
+        request = limited(timed_request)
+        try:
+            if timeout is not None and timeout.total is not None:
+                response = await asyncio.wait_for(request, timeout.total)
+            else:
+                response = await request
+        except (asyncio.TimeoutError, TimeoutError) as te:
+            if self._concurrency is not None and started is not None:
+                self._concurrency.observe(started,
+                                          time.monotonic() - started, True)
+            if cancelled:
+                # The total timeout expired while in the transport
+                self._transport.timed_out(method, url, body, started)
+            raise TimeoutError(error_timeout(operation_name)) from te
+        if self._concurrency is not None:
+            self._concurrency.observe(started, time.monotonic() - started,
+                                      response.status >= 500)
+        return response
+
+    async def _scheduled(
+            self, send_request: Callable[[], Awaitable[TransportResponse]],
+            request_priority: Priority) -> TransportResponse:
+        async with self._scheduler.slot(request_priority):
+            return await send_request()
+
+    def _handle_get_response(
+            self, resp: TransportResponse, operation_name: str,
+            decode: Callable[[bytes], Any] = json.loads) -> Any:
         if resp.status == 200:
-            resp_body = await resp.text()
             try:
-                data = json.loads(resp_body)
+                data = decode(resp.body)
                 return data
             except Exception as e:
                 raise RuntimeError(invalid_response_format(str(e)))
@@ -283,9 +1156,9 @@ class AsyncKaraboProxy:
             # For some endpoints the WebProxy returns errors with a json
             # payload with a detail field. Retrieve any existing detail to
             # to provide better information to the user
-            reason = str(resp.reason)
+            reason = resp.reason
             try:
-                payload = json.loads(await resp.text())
+                payload = json.loads(resp.body)
                 if "detail" in payload:
                     reason = f"{reason} - {payload['detail']}"
             finally:
@@ -293,16 +1166,15 @@ class AsyncKaraboProxy:
                                                       resp.status,
                                                       reason))
 
-    async def _handle_write_response(self,
-                                     resp: ClientResponse,
-                                     operation_name: str,
-                                     operand_id: str) -> WriteResponse:
+    def _handle_write_response(self,
+                               resp: TransportResponse,
+                               operation_name: str,
+                               operand_id: str) -> WriteResponse:
         """Handles the response of a write operation - POST, PUT or DELETE
         HTTP verbs"""
         if resp.status == 200:
-            resp_body = await resp.text()
             try:
-                data = json.loads(resp_body)
+                data = json.loads(resp.body)
                 return WriteResponse(**data)
             except Exception as e:
                 return WriteResponse(success=False,
@@ -324,7 +1196,7 @@ class AsyncKaraboProxy:
                 success=False,
                 reason=(error_on_operation(operation_name,
                                            resp.status,
-                                           str(resp.reason))))
+                                           resp.reason)))
 
 
 async def main():
@@ -395,5 +1267,4 @@ async def main():
 
 
 if __name__ == "__main__":
-    import asyncio
     asyncio.run(main())
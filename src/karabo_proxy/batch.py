@@ -0,0 +1,248 @@
+#
+# Helpers for running an operation on many keys (e.g. device ids) with
+# bounded concurrency, used by the batch operations of both clients.
+#
+# Failures of individual keys do not interrupt a batch: the exception raised
+# for a key is returned as its result. Likewise, when the deadline of a batch
+# expires, the keys whose operation didn't complete get a TimeoutError as
+# their result.
+#
+# asyncio is imported by the asynchronous helpers only, so that the sync
+# client doesn't import it.
+#
+import concurrent.futures
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from contextlib import asynccontextmanager, contextmanager
+from typing import (
+    TYPE_CHECKING, Any, AsyncIterator, Awaitable, Callable, Dict, Hashable,
+    Iterable, Iterator, List, Optional, Tuple, TypeVar, Union)
+
+from .data.device_config import InjectedPropertyValues, PropertyInfo
+from .data.web_proxy_responses import WriteResponse
+from .message_format import batch_deadline_expired
+
+if TYPE_CHECKING:
+    from .concurrency import AdaptiveConcurrency
+
+K = TypeVar("K", bound=Hashable)
+R = TypeVar("R")
+
+# Number of requests in flight of a batch operation if not specified
+DEFAULT_MAX_CONCURRENCY = 8
+
+
+async def aiter_batch(
+        keys: Iterable[K], operation: Callable[[K], Awaitable[R]],
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        deadline: Optional[float] = None,
+        limiter: Optional["AdaptiveConcurrency"] = None
+) -> AsyncIterator[Tuple[K, Union[R, Exception]]]:
+    """Runs an asynchronous operation for each key, with at most
+    max_concurrency operations in flight, and yields (key, result) pairs in
+    order of completion.
+
+    If the batch takes longer than deadline seconds, the operations still in
+    flight are cancelled and the keys not yet completed are yielded with a
+    TimeoutError.
+
+    With a limiter, the operations also wait for a slot of the limiter: the
+    operations in flight are bounded by its adaptive limit - shared with
+    the other batches using it - and by max_concurrency."""
+    import asyncio
+
+    if limiter is not None:
+        operation = _limited(operation, limiter)
+    keys = iter(keys)
+    pending: Dict[asyncio.Future, K] = {}
+    exhausted = False
+    end = None if deadline is None else time.monotonic() + deadline
+    try:
+        while True:
+            while not exhausted and len(pending) < max_concurrency:
+                try:
+                    key = next(keys)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending[asyncio.ensure_future(
+                    _capture_exception(operation(key)))] = key
+            if not pending:
+                return
+            done, _ = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED,
+                timeout=None if end is None else end - time.monotonic())
+            if not done:
+                break
+            for task in done:
+                yield pending.pop(task), task.result()
+        # The deadline expired
+        for task in pending:
+            task.cancel()
+        expired = TimeoutError(batch_deadline_expired(deadline))
+        for key in [*pending.values(), *keys]:
+            yield key, expired
+        pending.clear()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def arun_batch(
+        keys: Iterable[K], operation: Callable[[K], Awaitable[R]],
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        deadline: Optional[float] = None,
+        limiter: Optional["AdaptiveConcurrency"] = None
+) -> Dict[K, Union[R, Exception]]:
+    """Runs an asynchronous operation for each key, with at most
+    max_concurrency operations in flight, and returns the results by key, in
+    the order of the keys. See aiter_batch for the deadline and the
+    limiter."""
+    keys = list(keys)
+    results = {key: result async for key, result in aiter_batch(
+        keys, operation, max_concurrency, deadline, limiter)}
+    return {key: results[key] for key in keys}
+
+
+def iter_batch(
+        keys: Iterable[K], operation: Callable[[K], R],
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        deadline: Optional[float] = None
+) -> Iterator[Tuple[K, Union[R, Exception]]]:
+    """Runs a blocking operation for each key in a pool of max_concurrency
+    threads and yields (key, result) pairs in order of completion.
+
+    If the batch takes longer than deadline seconds, the keys not yet
+    completed are yielded with a TimeoutError. Operations that haven't
+    started are cancelled; running ones can't be interrupted and are left to
+    finish in the background, so they should have timeouts of their own."""
+    executor = ThreadPoolExecutor(max_workers=max_concurrency)
+    futures: Dict[Future, K] = {}
+    try:
+        futures = {executor.submit(operation, key): key for key in keys}
+        try:
+            for future in as_completed(futures, timeout=deadline):
+                yield futures.pop(future), _future_result(future)
+        except concurrent.futures.TimeoutError:
+            # The deadline expired
+            expired = TimeoutError(batch_deadline_expired(deadline))
+            for future, key in list(futures.items()):
+                del futures[future]
+                if future.done() and not future.cancelled():
+                    yield key, _future_result(future)
+                else:
+                    future.cancel()
+                    yield key, expired
+    finally:
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+def run_batch(
+        keys: Iterable[K], operation: Callable[[K], R],
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        deadline: Optional[float] = None
+) -> Dict[K, Union[R, Exception]]:
+    """Runs a blocking operation for each key in a pool of max_concurrency
+    threads and returns the results by key, in the order of the keys. See
+    iter_batch for the deadline."""
+    keys = list(keys)
+    results = dict(iter_batch(keys, operation, max_concurrency, deadline))
+    return {key: results[key] for key in keys}
+
+
+class AsyncKeyedLock:
+    """Mutual exclusion of coroutines per key. The lock of a key is only kept
+    while it is held or waited for."""
+
+    def __init__(self):
+        # key -> [lock, number of holders and waiters]
+        self._locks: Dict[Hashable, List[Any]] = {}
+
+    @asynccontextmanager
+    async def hold(self, key: Hashable) -> AsyncIterator[None]:
+        import asyncio
+
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+
+
+class KeyedLock:
+    """Mutual exclusion of threads per key. The lock of a key is only kept
+    while it is held or waited for."""
+
+    def __init__(self):
+        self._guard = threading.Lock()
+        # key -> [lock, number of holders and waiters]
+        self._locks: Dict[Hashable, List[Any]] = {}
+
+    @contextmanager
+    def hold(self, key: Hashable) -> Iterator[None]:
+        with self._guard:
+            entry = self._locks.get(key)
+            if entry is None:
+                entry = self._locks[key] = [threading.Lock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[key]
+
+
+def write_responses(
+        results: Dict[K, Union[WriteResponse, Exception]]
+) -> Dict[K, WriteResponse]:
+    """The results of a batch of writes, with the exceptions reported as
+    unsuccessful responses."""
+    return {key: (WriteResponse(success=False, reason=str(result))
+                  if isinstance(result, Exception) else result)
+            for key, result in results.items()}
+
+
+def injected_values(
+        results: Dict[str, Union[PropertyInfo, Exception]]
+) -> InjectedPropertyValues:
+    """The results of a batch of reads of injected properties."""
+    values = InjectedPropertyValues()
+    for property_name, result in results.items():
+        if isinstance(result, Exception):
+            values.errors[property_name] = str(result)
+        else:
+            values.values[property_name] = result
+    return values
+
+
+def _future_result(future: Future) -> Union[Any, Exception]:
+    exception = future.exception()
+    return future.result() if exception is None else exception
+
+
+def _limited(operation: Callable[[K], Awaitable[R]],
+             limiter: "AdaptiveConcurrency") -> Callable[[K], Awaitable[R]]:
+    async def limited_operation(key: K) -> R:
+        async with limiter.slot():
+            return await operation(key)
+    return limited_operation
+
+
+async def _capture_exception(
+        awaitable: Awaitable[R]) -> Union[R, Exception]:
+    try:
+        return await awaitable
+    except Exception as e:
+        return e
@@ -0,0 +1,288 @@
+#
+# The karabo-proxy command line tool: dumps the topology, schemas and
+# configurations of many devices as NDJSON - one json record per line,
+# written as the results arrive - and loads dumped configurations back.
+#
+# Records:
+#   {"type": "topology", "data": {...}}
+#   {"type": "schema", "device_id": ..., "data": {...}}
+#   {"type": "configuration", "device_id": ..., "data": {property: {"value",
+#    "timestamp", "tid"}}}
+#   {"type": "error", "device_id": ..., "operation": ..., "reason": ...}
+#   {"type": "result", "device_id": ..., "success": ..., "reason": ...}
+#
+import argparse
+import asyncio
+import dataclasses
+import fnmatch
+import json
+import os
+import sys
+import time
+from typing import (
+    IO, Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple)
+
+from .async_karabo_proxy import AsyncKaraboProxy
+from .batch import DEFAULT_MAX_CONCURRENCY, aiter_batch
+from .encoding import encode_json
+from .rate_limit import RateLimit, RateLimits
+from .snapshot import ConfigurationSnapshot, snapshot_values
+
+# Environment variables providing defaults for --url and --token
+URL_VARIABLE = "KARABO_PROXY_URL"
+TOKEN_VARIABLE = "KARABO_PROXY_TOKEN"
+
+SCHEMA = "schema"
+CONFIGURATION = "configuration"
+
+# A device to load: its line in the input and its property values
+_LoadItem = Tuple[int, str, Dict[str, Any]]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Runs the command line tool; returns its exit status."""
+    args = _parser().parse_args(argv)
+    if not args.url:
+        print(f"karabo-proxy: the URL of the WebProxy is needed: pass --url "
+              f"or set {URL_VARIABLE}", file=sys.stderr)
+        return 2
+    try:
+        return asyncio.run(args.run(args))
+    except KeyboardInterrupt:
+        return 130
+
+
+def _parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="karabo-proxy",
+        description="Dumps and loads device data through a Karabo WebProxy.")
+    parser.add_argument(
+        "--url", default=os.environ.get(URL_VARIABLE),
+        help=f"URL of the WebProxy (default: ${URL_VARIABLE})")
+    parser.add_argument(
+        "--token", default=os.environ.get(TOKEN_VARIABLE),
+        help=f"access token of the writes (default: ${TOKEN_VARIABLE})")
+    parser.add_argument("--transport", help="HTTP transport backend")
+    parser.add_argument("--timeout", type=float,
+                        help="timeout of each request, in seconds")
+    parser.add_argument(
+        "-j", "--max-concurrency", type=int,
+        default=DEFAULT_MAX_CONCURRENCY,
+        help="maximum number of devices processed concurrently (default: "
+             f"{DEFAULT_MAX_CONCURRENCY})")
+    parser.add_argument(
+        "--rate", type=float,
+        help="maximum number of requests per second - reads for dump, "
+             "writes for load")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    dump = commands.add_parser(
+        "dump", help="dump the topology, schemas and configurations of "
+                     "devices as NDJSON")
+    dump.add_argument("--topology", action="store_true",
+                      help="dump the topology")
+    dump.add_argument("--schemas", action="store_true",
+                      help="dump the schemas of the devices")
+    dump.add_argument(
+        "--configurations", action="store_true",
+        help="dump the configurations of the devices - the default without "
+             "--schemas")
+    dump.add_argument(
+        "-d", "--device", action="append", dest="devices", default=[],
+        help="a device to dump - may be repeated; by default all the "
+             "devices of the topic")
+    dump.add_argument(
+        "-p", "--pattern", action="append", dest="patterns", default=[],
+        help="dump the devices whose id matches a shell-style pattern - may "
+             "be repeated")
+    dump.add_argument("-o", "--output", default="-",
+                      help="output file (default: standard output)")
+    dump.set_defaults(run=dump_command)
+
+    load = commands.add_parser(
+        "load", help="restore the configurations of a dump: only the "
+                     "reconfigurable properties that changed are written")
+    load.add_argument("input", nargs="?", default="-",
+                      help="NDJSON dump (default: standard input)")
+    load.add_argument("-o", "--output", default="-",
+                      help="output file of the results (default: standard "
+                           "output)")
+    load.set_defaults(run=load_command)
+    return parser
+
+
+def _client(args: argparse.Namespace, rate_limits: RateLimits
+            ) -> AsyncKaraboProxy:
+    client = AsyncKaraboProxy(args.url, transport=args.transport,
+                              timeout=args.timeout, rate_limits=rate_limits)
+    if args.token:
+        client.set_access_token(args.token)
+    return client
+
+
+def _rate_limit(rate: Optional[float]) -> Optional[RateLimit]:
+    if rate is None:
+        return None
+    return RateLimit(rate=rate, burst=max(int(rate), 1))
+
+
+class _RecordWriter:
+    """Writes records as NDJSON lines, flushed as they are written so that
+    consumers get them as they arrive."""
+
+    def __init__(self, output: IO[bytes]):
+        self._output = output
+        self.records = 0
+        self.errors = 0
+
+    def write(self, record: Dict[str, Any]):
+        self._output.write(encode_json(record) + b"\n")
+        self._output.flush()
+        self.records += 1
+        if record["type"] == "error" or record.get("success") is False:
+            self.errors += 1
+
+
+def _open_output(path: str) -> IO[bytes]:
+    return sys.stdout.buffer if path == "-" else open(path, "wb")
+
+
+async def dump_command(args: argparse.Namespace) -> int:
+    """Dumps the requested data, the devices concurrently."""
+    kinds = [kind for kind, requested in ((SCHEMA, args.schemas),
+                                          (CONFIGURATION,
+                                           args.configurations))
+             if requested]
+    if not kinds and (not args.topology or args.devices or args.patterns):
+        # The configurations, unless only the topology is requested
+        kinds = [CONFIGURATION]
+    start = time.monotonic()
+    output = _open_output(args.output)
+    writer = _RecordWriter(output)
+    try:
+        async with _client(args, RateLimits(
+                reads=_rate_limit(args.rate))) as client:
+            device_ids = args.devices
+            if args.topology:
+                topology = await client.get_topology()
+                writer.write({"type": "topology",
+                              "data": dataclasses.asdict(topology)})
+            if kinds and (args.patterns or not device_ids):
+                listed = (await client.get_devices()).devices
+                device_ids = [*device_ids, *_matching(listed, args.patterns)]
+            async for record in dump_devices(client, device_ids, kinds,
+                                             args.max_concurrency):
+                writer.write(record)
+    finally:
+        if output is not sys.stdout.buffer:
+            output.close()
+    print(f"karabo-proxy: dumped {writer.records} records, {writer.errors} "
+          f"errors, in {time.monotonic() - start:.1f} s", file=sys.stderr)
+    return 1 if writer.errors else 0
+
+
+def _matching(device_ids: Iterable[str], patterns: List[str]) -> List[str]:
+    if not patterns:
+        return list(device_ids)
+    return [device_id for device_id in device_ids
+            if any(fnmatch.fnmatchcase(device_id, pattern)
+                   for pattern in patterns)]
+
+
+async def dump_devices(
+        client: AsyncKaraboProxy, device_ids: Iterable[str],
+        kinds: List[str], max_concurrency: int = DEFAULT_MAX_CONCURRENCY
+) -> AsyncIterator[Dict[str, Any]]:
+    """Retrieves the schemas and/or configurations of devices concurrently
+    and yields their records as they are retrieved. The device ids are
+    consumed as needed, so that only max_concurrency results are held at any
+    time."""
+    async def retrieve(key: Tuple[str, str]) -> Any:
+        device_id, kind = key
+        if kind == SCHEMA:
+            return await client.get_device_schema(device_id)
+        return await client.get_device_configuration(device_id)
+
+    keys = ((device_id, kind) for device_id in dict.fromkeys(device_ids)
+            for kind in kinds)
+    async for (device_id, kind), result in aiter_batch(
+            keys, retrieve, max_concurrency):
+        if isinstance(result, Exception):
+            yield {"type": "error", "device_id": device_id,
+                   "operation": kind, "reason": str(result)}
+        else:
+            yield {"type": kind, "device_id": device_id,
+                   "data": dict(result)}
+
+
+async def load_command(args: argparse.Namespace) -> int:
+    """Loads the configurations of a dump, the devices concurrently."""
+    start = time.monotonic()
+    source = sys.stdin if args.input == "-" else open(args.input)
+    output = _open_output(args.output)
+    writer = _RecordWriter(output)
+    try:
+        async with _client(args, RateLimits(
+                writes=_rate_limit(args.rate))) as client:
+            async for record in load_devices(client, source,
+                                             args.max_concurrency):
+                writer.write(record)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout.buffer:
+            output.close()
+    print(f"karabo-proxy: loaded {writer.records - writer.errors} devices, "
+          f"{writer.errors} failed, in {time.monotonic() - start:.1f} s",
+          file=sys.stderr)
+    return 1 if writer.errors else 0
+
+
+async def load_devices(
+        client: AsyncKaraboProxy, lines: Iterable[str],
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY
+) -> AsyncIterator[Dict[str, Any]]:
+    """Restores the configuration records of NDJSON lines concurrently and
+    yields a result record per device as they complete. The lines are read
+    as needed, so that only max_concurrency configurations are held at any
+    time; the records of other types are skipped."""
+    async def restore(item: _LoadItem) -> str:
+        line_number, device_id, values = item
+        if device_id is None:
+            raise RuntimeError(f"line {line_number}: {values}")
+        snapshot = ConfigurationSnapshot(configurations={device_id: values})
+        results = await client.restore_configuration_snapshot(snapshot)
+        if device_id not in results:
+            return "unchanged"
+        if not results[device_id].success:
+            raise RuntimeError(results[device_id].reason)
+        return results[device_id].reason
+
+    async for (_, device_id, _), result in aiter_batch(
+            _configurations(lines), restore, max_concurrency):
+        if isinstance(result, Exception):
+            yield {"type": "result", "device_id": device_id,
+                   "success": False, "reason": str(result)}
+        else:
+            yield {"type": "result", "device_id": device_id,
+                   "success": True, "reason": result}
+
+
+def _configurations(lines: Iterable[str]) -> Iterator[_LoadItem]:
+    """The configuration records of NDJSON lines, as (line number,
+    device_id, values) - an invalid line as (line number, None, reason)."""
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            if record.get("type") != CONFIGURATION:
+                continue
+            yield line_number, record["device_id"], snapshot_values(
+                record["data"])
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            yield line_number, None, f"invalid record: {e}"
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+#
+# Adaptive concurrency of the batch operations: the number of operations in
+# flight is raised while the latency of the WebProxy stays flat and lowered
+# when it grows, or when requests time out or fail with a server error
+# (additive increase, multiplicative decrease).
+#
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Deque, Optional
+
+
+@dataclass
+class ConcurrencyStats:
+    # Operations in flight and waiting for a slot
+    in_flight: int = 0
+    waiting: int = 0
+    # Completed requests observed, and those signalling an overload
+    requests: int = 0
+    overloads: int = 0
+    increases: int = 0
+    decreases: int = 0
+    # The lowest latency observed recently, in seconds
+    baseline: Optional[float] = None
+
+
+class AdaptiveConcurrency:
+    """Limits the batch operations in flight to a limit adapted to the
+    latency of the requests of the client.
+
+    Each request completing within tolerance times the baseline latency adds
+    1 / limit to the limit - about 1 per round of limit requests. A slower
+    request, a timeout or a 5xx response multiplies the limit by backoff,
+    at most once per round: the requests sent before a decrease don't
+    decrease it again.
+
+    A limiter is meant for one WebProxy; clients of the same WebProxy may
+    share it.
+
+    Parameters:
+    initial_limit(int): the limit before any request completed.
+
+    min_limit(int), max_limit(int): the bounds of the limit.
+
+    tolerance(float): the latency growth, relative to the baseline, taken as
+    a sign of an overloaded WebProxy.
+
+    backoff(float): the factor applied to the limit on an overload.
+
+    baseline_drift(float): the fraction of the difference with a slower
+    latency added to the baseline on each request, so that the baseline
+    follows lasting changes of the WebProxy latency.
+    """
+
+    def __init__(self, initial_limit: int = 8, min_limit: int = 1,
+                 max_limit: int = 64, tolerance: float = 2.0,
+                 backoff: float = 0.5, baseline_drift: float = 0.01):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.baseline_drift = baseline_drift
+        self.stats = ConcurrencyStats()
+        self._limit = float(min(max(initial_limit, min_limit), max_limit))
+        self._last_decrease = float("-inf")
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Waits until the operations in flight are below the limit and holds
+        a slot for the duration of the block."""
+        stats = self.stats
+        if stats.in_flight >= self.limit or self._waiters:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            stats.waiting += 1
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # Given a slot right before being cancelled
+                    stats.in_flight -= 1
+                    self._wake_up()
+                elif waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    stats.waiting -= 1
+                raise
+        else:
+            stats.in_flight += 1
+        try:
+            yield
+        finally:
+            stats.in_flight -= 1
+            self._wake_up()
+
+    def observe(self, started: float, latency: float, overloaded: bool):
+        """Adapts the limit to a completed request.
+
+        Parameters:
+        started(float): when the request was sent, as given by
+        time.monotonic.
+
+        latency(float): the duration of the request, in seconds.
+
+        overloaded(bool): whether the request timed out or got a server
+        error.
+        """
+        stats = self.stats
+        stats.requests += 1
+        if not overloaded:
+            if stats.baseline is None or latency < stats.baseline:
+                stats.baseline = latency
+            else:
+                stats.baseline += (latency - stats.baseline) * \
+                    self.baseline_drift
+            overloaded = latency > self.tolerance * stats.baseline
+        if overloaded:
+            stats.overloads += 1
+            if started >= self._last_decrease:
+                self._limit = max(self._limit * self.backoff, self.min_limit)
+                self._last_decrease = time.monotonic()
+                stats.decreases += 1
+        elif self._limit < self.max_limit:
+            limit = self.limit
+            self._limit = min(self._limit + 1 / self._limit, self.max_limit)
+            if self.limit > limit:
+                stats.increases += 1
+                self._wake_up()
+
+    def _wake_up(self):
+        """Hands the free slots to the waiters, in order."""
+        while self._waiters and self.stats.in_flight < self.limit:
+            waiter = self._waiters.popleft()
+            self.stats.waiting -= 1
+            if not waiter.done():
+                self.stats.in_flight += 1
+                waiter.set_result(None)
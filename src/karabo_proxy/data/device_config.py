@@ -1,4 +1,4 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Dict, List, Union
 
 PropertyValue = Union[
@@ -14,3 +14,11 @@ class PropertyInfo:
 
 
 DeviceConfigInfo = Dict[str, PropertyInfo]
+
+
+@dataclass
+class InjectedPropertyValues:
+    """Values of injected properties read together."""
+    values: Dict[str, PropertyInfo] = field(default_factory=dict)
+    # Reasons of the properties that could not be read
+    errors: Dict[str, str] = field(default_factory=dict)
@@ -0,0 +1,464 @@
+#
+# Decoding of the device configurations returned by the WebProxy.
+#
+# By default, configurations are plain dicts with a dict of value, timestamp
+# and tid per property. In the compact mode, the property names of a
+# configuration are interned in a key layout shared with all configurations
+# with the same names - i.e. of devices of the same class - and only the
+# values, timestamps and tids are stored per device.
+#
+# In the lazy mode, configurations and schemas are views of the json text of
+# the response: only the position of the value of each property is indexed
+# and the value is decoded when the property is first accessed.
+#
+# Independently of the mode, the async client can decode the large responses
+# off its event loop, in a thread or a process pool - see DecodeOffload. Its
+# modules - asyncio, pickle and the process pools - are imported on first
+# use, so that the sync client doesn't import them.
+#
+import json
+import re
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import (
+    Any, Callable, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple,
+    Union)
+
+from .data.device_config import PropertyInfo, PropertyValue
+from .message_format import invalid_response_format
+
+# Decoding modes of the device configurations - and schemas, for the lazy
+# mode
+DECODING_DICT = "dict"
+DECODING_COMPACT = "compact"
+DECODING_LAZY = "lazy"
+DECODING_MODES = (DECODING_DICT, DECODING_COMPACT, DECODING_LAZY)
+
+# The attributes of a property in a device configuration
+_PROPERTY_FIELDS = frozenset(("value", "timestamp", "tid"))
+
+
+def check_decoding(decoding: str) -> str:
+    if decoding not in DECODING_MODES:
+        raise ValueError(f"Unknown decoding '{decoding}': supported "
+                         f"decodings are {', '.join(DECODING_MODES)}.")
+    return decoding
+
+
+class KeyLayout:
+    """The interned property names of configurations and the position of
+    each name."""
+    __slots__ = ("names", "index")
+
+    def __init__(self, names: Sequence[str]):
+        self.names: Tuple[str, ...] = tuple(sys.intern(n) for n in names)
+        self.index: Dict[str, int] = {n: i for i, n in enumerate(self.names)}
+
+
+class KeyLayouts:
+    """Registry of the key layouts shared by the compact configurations,
+    bounded in size with least recently used eviction."""
+
+    def __init__(self, max_layouts: int = 1024):
+        self.max_layouts = max_layouts
+        self._layouts: "OrderedDict[Tuple[str, ...], KeyLayout]"
+        self._layouts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._layouts)
+
+    def get(self, names: Tuple[str, ...]) -> KeyLayout:
+        """The layout of the given names, created if needed."""
+        with self._lock:
+            layout = self._layouts.get(names)
+            if layout is None:
+                layout = self._layouts[names] = KeyLayout(names)
+                if len(self._layouts) > self.max_layouts:
+                    self._layouts.popitem(last=False)
+            else:
+                self._layouts.move_to_end(names)
+            return layout
+
+
+class CompactDeviceConfig(Mapping[str, Dict[str, Any]]):
+    """A device configuration storing the values, timestamps and tids of its
+    properties in sequences ordered by a shared key layout.
+
+    Behaves as the read-only dict returned by get_device_configuration:
+    config[name] builds the {"value", "timestamp", "tid"} dict of the
+    property on each access. value and property_info are cheaper accessors.
+    """
+    __slots__ = ("layout", "values", "timestamps", "tids")
+
+    def __init__(self, layout: KeyLayout, values: list,
+                 timestamps: array, tids: array):
+        self.layout = layout
+        self.values = values
+        self.timestamps = timestamps
+        self.tids = tids
+
+    def __getitem__(self, name: str) -> Dict[str, Any]:
+        i = self.layout.index[name]
+        return {"value": self.values[i], "timestamp": self.timestamps[i],
+                "tid": self.tids[i]}
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.layout.names)
+
+    def __len__(self) -> int:
+        return len(self.layout.names)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self.layout.index
+
+    def value(self, name: str) -> PropertyValue:
+        return self.values[self.layout.index[name]]
+
+    def property_info(self, name: str) -> PropertyInfo:
+        i = self.layout.index[name]
+        return PropertyInfo(value=self.values[i],
+                            timestamp=self.timestamps[i], tid=self.tids[i])
+
+    def property_values(self) -> Dict[str, PropertyValue]:
+        """The values of the properties by name."""
+        return dict(zip(self.layout.names, self.values))
+
+    def __repr__(self) -> str:
+        return f"CompactDeviceConfig({len(self)} properties)"
+
+
+def compact_configuration(
+        data: Dict[str, Any],
+        layouts: KeyLayouts) -> Mapping[str, Dict[str, Any]]:
+    """Converts a decoded configuration to a CompactDeviceConfig. A
+    configuration with properties that don't have exactly a value, a
+    timestamp and a tid is returned as is.
+
+    Raises:
+    RuntimeError if the configuration is not a json object.
+    """
+    if not isinstance(data, dict):
+        raise RuntimeError(invalid_response_format(
+            f"expected a json object, got {type(data).__name__}"))
+    values = []
+    timestamps = array("d")
+    tids = array("q")
+    try:
+        for info in data.values():
+            if info.keys() != _PROPERTY_FIELDS:
+                return data
+            values.append(info["value"])
+            timestamps.append(info["timestamp"])
+            tids.append(info["tid"])
+    except (AttributeError, TypeError, OverflowError):
+        return data
+    return CompactDeviceConfig(layouts.get(tuple(data)), values, timestamps,
+                               tids)
+
+
+# Regular expressions of the lazy views. The names of the members are
+# matched by _NAME and their scalar values - strings, numbers and literals -
+# by _SCALAR, without validating them. The objects and arrays are skipped by
+# the json decoder, which validates them: a single call in C is cheaper than
+# scanning their brackets in Python. Indexing a configuration or a schema
+# costs about 1.5 to 2.5 times the CPU time of json.loads: the gain is in
+# memory, as only the objects of the properties accessed are kept.
+_WS = r"[ \t\n\r]*"
+_STRING = r'"[^"\\]*(?:\\.[^"\\]*)*"'
+_NAME = re.compile(rf"{_WS}({_STRING}){_WS}:{_WS}")
+_SCALAR = re.compile(rf"{_STRING}|[-+.\w]+")
+_OBJECT_START = re.compile(rf"{_WS}\{{{_WS}")
+_ENTRY_END = re.compile(rf"{_WS}([,}}])")
+_TRAILER = re.compile(rf"{_WS}\Z")
+_decoder = json.JSONDecoder()
+
+
+def index_json_object(text: str) -> Dict[str, Tuple[int, int]]:
+    """The (start, end) positions of the values of the members of a json
+    object, by name, without decoding the values.
+
+    Raises:
+    ValueError if the text is not a json object.
+    """
+    index, end = _scan_object(text, 0, False)
+    if _TRAILER.match(text, end) is None:
+        raise ValueError(f"Extra data at char {end}")
+    return index
+
+
+def decode_incrementally(body: Union[bytes, str]) -> Any:
+    """Decodes a json document as json.loads does, but objects member by
+    member: the values of the members are decoded separately, and the
+    nested objects recursively. Slower than json.loads, but a thread
+    decoding a large document this way lets the other threads run - e.g.
+    an event loop - as the decoding is not a single call holding the GIL.
+    """
+    if isinstance(body, bytes):
+        body = body.decode("utf-8")
+    if _OBJECT_START.match(body) is None:
+        return json.loads(body)
+    data, end = _scan_object(body, 0, True)
+    if _TRAILER.match(body, end) is None:
+        raise ValueError(f"Extra data at char {end}")
+    return data
+
+
+def _scan_object(text: str, position: int,
+                 decode: bool) -> Tuple[Dict[str, Any], int]:
+    """Scans the json object at position. Returns, by name, the (start, end)
+    positions of the values of its members - or the decoded values if
+    decode - and the end of the object."""
+    match = _OBJECT_START.match(text, position)
+    if match is None:
+        raise ValueError(f"Expecting a json object at char {position}")
+    position = match.end()
+    members = {}
+    if text.startswith("}", position):
+        return members, position + 1
+    while True:
+        match = _NAME.match(text, position)
+        if match is None:
+            raise ValueError(f"Expecting a member at char {position}")
+        name = match.group(1)
+        name = name[1:-1] if "\\" not in name else json.loads(name)
+        start = match.end()
+        if decode:
+            if text.startswith("{", start):
+                members[name], end = _scan_object(text, start, True)
+            else:
+                members[name], end = _decoder.raw_decode(text, start)
+        else:
+            if text.startswith(("{", "["), start):
+                end = _decoder.raw_decode(text, start)[1]
+            else:
+                match = _SCALAR.match(text, start)
+                if match is None:
+                    raise ValueError(f"Expecting a value at char {start}")
+                end = match.end()
+            members[name] = (start, end)
+        match = _ENTRY_END.match(text, end)
+        if match is None:
+            raise ValueError(f"Expecting ',' or '}}' at char {end}")
+        position = match.end()
+        if match.group(1) == "}":
+            return members, position
+
+
+class LazyJsonObject(Mapping[str, Any]):
+    """Read-only view of a json object that decodes the value of a member
+    when it is first accessed. Iterating over the names - and len, in and
+    keys - decodes nothing.
+
+    Raises:
+    RuntimeError on access to a value that is not valid json - invalid
+    objects and arrays are detected when the text is indexed.
+    """
+
+    def __init__(self, text: str, index: Dict[str, Tuple[int, int]]):
+        self._text = text
+        self._index = index
+        self._decoded: Dict[str, Any] = {}
+
+    @classmethod
+    def decode(cls, body: Union[bytes, str]) -> "LazyJsonObject":
+        """Indexes a json object, as received in the body of a response."""
+        if isinstance(body, bytes):
+            body = body.decode("utf-8")
+        return cls(body, index_json_object(body))
+
+    def __getitem__(self, name: str) -> Any:
+        try:
+            return self._decoded[name]
+        except KeyError:
+            start, end = self._index[name]
+        try:
+            value = json.loads(self._text[start:end])
+        except ValueError as e:
+            raise RuntimeError(invalid_response_format(str(e)))
+        return self._decoded.setdefault(name, value)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._index
+
+    @property
+    def decoded(self) -> int:
+        """The number of members decoded so far."""
+        return len(self._decoded)
+
+    def __repr__(self) -> str:
+        return (f"{type(self).__name__}({len(self)} members, "
+                f"{self.decoded} decoded)")
+
+
+class LazyDeviceConfig(LazyJsonObject):
+    """A device configuration decoding the value, timestamp and tid of a
+    property when it is first accessed."""
+
+    def value(self, name: str) -> PropertyValue:
+        return self[name]["value"]
+
+    def property_info(self, name: str) -> PropertyInfo:
+        return PropertyInfo(**self[name])
+
+
+class LazySchema(LazyJsonObject):
+    """A device schema decoding the attributes of a property when it is
+    first accessed."""
+
+
+class DecodeOffload:
+    """Decodes the large responses of the async client off its event loop,
+    keeping the latency of the other tasks of the loop bounded while a
+    large topology or configuration is decoded.
+
+    In a thread pool - the default - the responses are decoded as they would
+    be in the event loop, e.g. with json.loads. json.loads holds the GIL for
+    the whole decoding though: the event loop keeps running before and after
+    it, not during it. With incremental, json documents are decoded with
+    decode_incrementally instead, which releases the GIL between members
+    but costs about twice the CPU time: decoding a 21 MB topology took 0.9 s
+    with json.loads, during which the event loop was blocked for 0.8 s, and
+    1.8 s incrementally, with the event loop blocked for at most 0.13 s.
+
+    In a process pool, the decoding doesn't compete with the event loop for
+    the GIL at all; the decoded objects are split in chunks of about
+    chunk_entries entries, pickled in the worker, and the event loop
+    unpickles one chunk at a time, yielding in between.
+
+    Parameters:
+    threshold(int): the size, in bytes, from which a response is decoded
+    off the event loop. Smaller responses are decoded in the loop, which is
+    faster.
+
+    processes(bool): whether to decode in a process pool rather than in a
+    thread pool.
+
+    max_workers(int): the number of threads or processes of the pool.
+
+    chunk_entries(int): the approximate number of entries of the chunks of
+    the objects decoded in a process.
+
+    incremental(bool): whether json documents are decoded incrementally in
+    a thread pool, trading CPU time for the latency of the event loop.
+    """
+
+    def __init__(self, threshold: int = 1 << 20, processes: bool = False,
+                 max_workers: int = 1, chunk_entries: int = 2000,
+                 incremental: bool = False):
+        self.threshold = threshold
+        self.processes = processes
+        self.max_workers = max_workers
+        self.chunk_entries = chunk_entries
+        self.incremental = incremental
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+
+    def offloads(self, body: bytes) -> bool:
+        """Whether a response body is decoded off the event loop."""
+        return len(body) >= self.threshold
+
+    async def decode(self, decode: Callable[[bytes], Any],
+                     body: bytes) -> Any:
+        """Decodes a response body with decode in the pool. The errors of
+        decode are raised as is."""
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        if not self.processes:
+            if self.incremental and decode is json.loads:
+                decode = decode_incrementally
+            return await loop.run_in_executor(self._pool(), decode, body)
+        chunks = await loop.run_in_executor(
+            self._pool(), _decode_chunks, decode, body, self.chunk_entries)
+        return await _reassemble(chunks)
+
+    def shutdown(self):
+        """Shuts the pool down, if started; it is restarted if needed."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def _pool(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                if self.processes:
+                    from concurrent.futures import ProcessPoolExecutor
+                    self._executor = ProcessPoolExecutor(self.max_workers)
+                else:
+                    self._executor = ThreadPoolExecutor(
+                        self.max_workers, thread_name_prefix="decoding")
+            return self._executor
+
+
+# A chunk of a decoded object: the path of the object the chunk belongs to
+# and its pickled entries - or None as path and a pickled object that isn't
+# a dict
+_Chunk = Tuple[Optional[Tuple[str, ...]], bytes]
+
+
+def _decode_chunks(decode: Callable[[bytes], Any], body: bytes,
+                   chunk_entries: int) -> List[_Chunk]:
+    """Decodes in a worker process and splits a decoded dict in chunks."""
+    import pickle
+
+    data = decode(body)
+    if type(data) is not dict:
+        return [(None, pickle.dumps(data, pickle.HIGHEST_PROTOCOL))]
+    chunks: List[_Chunk] = []
+    _split(data, (), chunk_entries, chunks)
+    return chunks
+
+
+def _split(data: Dict[str, Any], path: Tuple[str, ...], chunk_entries: int,
+           chunks: List[_Chunk]):
+    """Appends the chunks of a dict - its large dict members split in turn
+    under their own path - preserving the order of the members."""
+    import pickle
+
+    protocol = pickle.HIGHEST_PROTOCOL
+    chunk = {}
+    entries = 0
+    for name, value in data.items():
+        size = len(value) if isinstance(value, (dict, list)) else 0
+        if type(value) is dict and size > chunk_entries:
+            if chunk:
+                chunks.append((path, pickle.dumps(chunk, protocol)))
+                chunk, entries = {}, 0
+            _split(value, path + (name,), chunk_entries, chunks)
+            continue
+        chunk[name] = value
+        entries += 1 + size
+        if entries >= chunk_entries:
+            chunks.append((path, pickle.dumps(chunk, protocol)))
+            chunk, entries = {}, 0
+    if chunk or not chunks:
+        chunks.append((path, pickle.dumps(chunk, protocol)))
+
+
+async def _reassemble(chunks: List[_Chunk]) -> Any:
+    """Unpickles the chunks of a decoded object, yielding to the event loop
+    after each."""
+    import asyncio
+    import pickle
+
+    if chunks and chunks[0][0] is None:
+        return pickle.loads(chunks[0][1])
+    data: Dict[str, Any] = {}
+    for path, blob in chunks:
+        target = data
+        for name in path:
+            target = target.setdefault(name, {})
+        target.update(pickle.loads(blob))
+        await asyncio.sleep(0)
+    return data
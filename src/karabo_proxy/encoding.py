@@ -0,0 +1,108 @@
+#
+# Encoding of the json payloads of the write requests.
+#
+# Besides the json types, payloads may contain NumPy arrays and scalars and
+# dataclasses such as PropertyInfo, which are encoded directly without being
+# converted to lists and dicts first when orjson is installed. NumPy is never
+# imported by this module, and orjson only on the first encoding.
+#
+import dataclasses
+import functools
+import json
+import math
+from typing import Any, Union
+
+
+class EncodedPayload:
+    """A json payload encoded beforehand, sent as is by the write methods.
+    Saves encoding the same large payload - e.g. a vector setpoint - on every
+    write.
+
+    Parameters:
+    data(bytes): the UTF-8 encoded json document.
+    """
+    __slots__ = ("data",)
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    @classmethod
+    def encode(cls, payload: Any) -> "EncodedPayload":
+        """Encodes a payload once for use in several writes."""
+        return cls(encode_json(payload))
+
+    def __repr__(self) -> str:
+        return f"EncodedPayload({len(self.data)} bytes)"
+
+
+def encode_json(payload: Any) -> bytes:
+    """Encodes a payload as UTF-8 json, passing EncodedPayloads through.
+
+    The rules of the standard library apply with or without orjson: NaN and
+    infinite floats are encoded as the NaN and Infinity literals, integers
+    of any size and non-string keys are accepted. orjson encodes them
+    differently or not at all, so those payloads - the ones it fails on or
+    with non-finite floats, which it encodes as null - are encoded by the
+    standard library.
+    """
+    if isinstance(payload, EncodedPayload):
+        return payload.data
+    orjson = _orjson()
+    if orjson is not None and _is_finite(payload):
+        try:
+            return orjson.dumps(payload, default=_to_json_type,
+                                option=orjson.OPT_SERIALIZE_NUMPY)
+        except orjson.JSONEncodeError:
+            pass
+    return json.dumps(payload, default=_to_json_type,
+                      separators=(",", ":")).encode("utf-8")
+
+
+@functools.lru_cache(maxsize=None)
+def _orjson():
+    """orjson, imported on first use so that importing the clients doesn't
+    import it, or None if it is not installed."""
+    try:
+        import orjson
+    except ImportError:
+        return None
+    return orjson
+
+
+def _is_finite(obj: Any) -> bool:
+    """Whether a payload has no NaN or infinite floats, looking into the
+    containers, NumPy arrays and dataclasses orjson encodes."""
+    if isinstance(obj, float):
+        return math.isfinite(obj)
+    if isinstance(obj, (list, tuple)):
+        try:
+            # A single pass in C for the vectors of numbers: the sum is
+            # finite unless an item isn't.
+            return math.isfinite(math.fsum(obj))
+        except (TypeError, OverflowError):
+            return all(_is_finite(item) for item in obj)
+    if isinstance(obj, dict):
+        return all(_is_finite(value) for value in obj.values())
+    if type(obj).__module__ == "numpy":
+        # NaN propagates to the extrema
+        if getattr(obj, "dtype", None) is None or obj.dtype.kind != "f" \
+                or obj.size == 0:
+            return True
+        return math.isfinite(obj.min()) and math.isfinite(obj.max())
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return all(_is_finite(getattr(obj, field.name))
+                   for field in dataclasses.fields(obj))
+    return True
+
+
+def _to_json_type(obj: Any) -> Union[list, dict, bool, int, float, str]:
+    """Converts the objects the json encoders don't support natively."""
+    # NumPy arrays and scalars - e.g. non-contiguous arrays for orjson
+    if hasattr(obj, "tolist") and type(obj).__module__ == "numpy":
+        return obj.tolist()
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        # Shallow: the encoder converts the field values as needed
+        return {field.name: getattr(obj, field.name)
+                for field in dataclasses.fields(obj)}
+    raise TypeError(
+        f"Object of type {type(obj).__name__} is not JSON serializable")
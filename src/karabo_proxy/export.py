@@ -0,0 +1,390 @@
+#
+# Export of property values and topologies to Apache Arrow record batches,
+# and to Arrow IPC or Parquet files written batch by batch, so that the
+# memory used doesn't grow with the number of rows exported.
+#
+# A property table has a row per property value:
+#   device_id, property, timestamp (UTC, microseconds), tid, value_type and
+#   a column per type of value - bool_value, int_value, float_value,
+#   string_value, bool_vector, int_vector, float_vector and string_vector -
+#   of which only the one named by value_type is set.
+# Values of other types (e.g. integers out of the int64 range, tables) are
+# stored as json in string_value, with the "json" value_type. Empty vectors,
+# whose type of elements is unknown, are float vectors.
+#
+# A topology table has a row per instance of the topology:
+#   category (device, server, client or macro), instance_id, class_id,
+#   server_id, host, status and attributes - all the attributes, as json.
+#
+from typing import (
+    IO, Any, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple, Union)
+
+from .data.device_config import PropertyInfo, PropertyValue
+from .data.topology import TopologyInfo
+from .encoding import encode_json
+from .snapshot import ConfigurationSnapshot
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+EXPORT_PARQUET = "parquet"
+EXPORT_ARROW = "arrow"
+EXPORT_FORMATS = (EXPORT_PARQUET, EXPORT_ARROW)
+
+DEFAULT_BATCH_SIZE = 65536
+
+VALUE_COLUMNS = ("bool_value", "int_value", "float_value", "string_value",
+                 "bool_vector", "int_vector", "float_vector", "string_vector")
+# The value types that are not a value column
+NULL_TYPE = "null"
+JSON_TYPE = "json"
+
+TOPOLOGY_CATEGORIES = ("device", "server", "client", "macro")
+
+# (device_id, property, value, timestamp, tid) - timestamp in seconds since
+# the epoch; timestamp and tid may be None
+PropertyRow = Tuple[str, str, PropertyValue, Optional[float], Optional[int]]
+
+# The value column of each value type
+_COLUMN_INDEX = {name: i for i, name in enumerate(VALUE_COLUMNS)}
+_COLUMN_INDEX[JSON_TYPE] = VALUE_COLUMNS.index("string_value")
+
+_INT64_MIN = -(1 << 63)
+_INT64_MAX = (1 << 63) - 1
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("Exporting to Arrow or Parquet is not available: "
+                          "Please install 'pyarrow'.")
+
+
+def check_export_format(format: str) -> str:
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{format}': supported "
+                         f"formats are {', '.join(EXPORT_FORMATS)}.")
+    return format
+
+
+def property_schema() -> "pa.Schema":
+    """The schema of the property tables."""
+    _require_pyarrow()
+    return pa.schema([
+        ("device_id", pa.string()),
+        ("property", pa.string()),
+        ("timestamp", pa.timestamp("us", tz="UTC")),
+        ("tid", pa.int64()),
+        ("value_type", pa.string()),
+        *zip(VALUE_COLUMNS, _value_types()),
+    ])
+
+
+def topology_schema() -> "pa.Schema":
+    """The schema of the topology tables."""
+    _require_pyarrow()
+    return pa.schema([(name, pa.string()) for name in (
+        "category", "instance_id", "class_id", "server_id", "host", "status",
+        "attributes")])
+
+
+def _value_types() -> List["pa.DataType"]:
+    scalars = [pa.bool_(), pa.int64(), pa.float64(), pa.string()]
+    return [*scalars, *(pa.list_(scalar) for scalar in scalars)]
+
+
+# region Rows
+
+def snapshot_rows(snapshot: ConfigurationSnapshot) -> Iterator[PropertyRow]:
+    """The rows of the property values of a snapshot, timestamped with the
+    time of the capture."""
+    for device_id, values in snapshot.configurations.items():
+        for prop, value in values.items():
+            yield device_id, prop, value, snapshot.timestamp, None
+
+
+def configuration_rows(
+        configurations: Union[Mapping[str, Mapping[str, Any]],
+                              Iterable[Tuple[str, Mapping[str, Any]]]]
+) -> Iterator[PropertyRow]:
+    """The rows of device configurations as returned by
+    get_device_configuration, by device_id - a mapping or an iterable of
+    (device_id, configuration) pairs, consumed as needed."""
+    if isinstance(configurations, Mapping):
+        configurations = configurations.items()
+    for device_id, config in configurations:
+        for prop, info in config.items():
+            yield (device_id, prop, *_info_fields(info))
+
+
+def sample_rows(
+        samples: Union[Mapping[Tuple[str, str], Iterable[PropertyInfo]],
+                       Iterable[Any]]) -> Iterator[PropertyRow]:
+    """The rows of property samples: histories by (device_id, property) -
+    as aligned by align_samples - or an iterable of PropertyChanges, e.g.
+    collected from a subscription."""
+    if isinstance(samples, Mapping):
+        for (device_id, prop), history in samples.items():
+            for info in history:
+                yield (device_id, prop, *_info_fields(info))
+    else:
+        for change in samples:
+            yield (change.device_id, change.path, *_info_fields(change.info))
+
+
+def _info_fields(info: Any) -> Tuple[PropertyValue, Optional[float],
+                                     Optional[int]]:
+    if isinstance(info, PropertyInfo):
+        return info.value, info.timestamp, info.tid
+    return info["value"], info.get("timestamp"), info.get("tid")
+
+
+# endregion
+
+# region Record batches
+
+class _PropertyColumns:
+    """The columns of the property rows of a record batch being built."""
+
+    def __init__(self):
+        self.device_ids: List[str] = []
+        self.properties: List[str] = []
+        self.timestamps: List[Optional[int]] = []
+        self.tids: List[Optional[int]] = []
+        self.value_types: List[str] = []
+        self.values: List[List[Any]] = [[] for _ in VALUE_COLUMNS]
+
+    def __len__(self) -> int:
+        return len(self.device_ids)
+
+    def append(self, row: PropertyRow):
+        device_id, prop, value, timestamp, tid = row
+        self.device_ids.append(device_id)
+        self.properties.append(prop)
+        self.timestamps.append(
+            None if timestamp is None else round(timestamp * 1_000_000))
+        self.tids.append(tid)
+        value_type, value = classify_value(value)
+        self.value_types.append(value_type)
+        column = _COLUMN_INDEX.get(value_type)
+        for i, values in enumerate(self.values):
+            values.append(value if i == column else None)
+
+    def batch(self, schema: "pa.Schema") -> "pa.RecordBatch":
+        columns = [self.device_ids, self.properties, self.timestamps,
+                   self.tids, self.value_types, *self.values]
+        return pa.RecordBatch.from_arrays(
+            [pa.array(column, type=field.type)
+             for column, field in zip(columns, schema)], schema=schema)
+
+
+def classify_value(value: PropertyValue) -> Tuple[str, Any]:
+    """The value type of a value - the name of its value column, "null" or
+    "json" - and the value converted for its column."""
+    if value is None:
+        return NULL_TYPE, None
+    if hasattr(value, "tolist") and type(value).__module__ == "numpy":
+        value = value.tolist()
+    if isinstance(value, bool):
+        return "bool_value", value
+    if isinstance(value, int):
+        if _INT64_MIN <= value <= _INT64_MAX:
+            return "int_value", value
+        return JSON_TYPE, str(value)
+    if isinstance(value, float):
+        return "float_value", value
+    if isinstance(value, str):
+        return "string_value", value
+    if isinstance(value, (list, tuple)):
+        if all(isinstance(item, bool) for item in value):
+            return ("bool_vector" if value else "float_vector"), list(value)
+        if all(isinstance(item, int) and not isinstance(item, bool)
+               and _INT64_MIN <= item <= _INT64_MAX for item in value):
+            return "int_vector", list(value)
+        if all(isinstance(item, (int, float)) and not isinstance(item, bool)
+               for item in value):
+            return "float_vector", [float(item) for item in value]
+        if all(isinstance(item, str) for item in value):
+            return "string_vector", list(value)
+    return JSON_TYPE, encode_json(value).decode("utf-8")
+
+
+def property_batches(rows: Iterable[PropertyRow],
+                     batch_size: int = DEFAULT_BATCH_SIZE
+                     ) -> Iterator["pa.RecordBatch"]:
+    """Record batches of up to batch_size property rows, built as the rows
+    are consumed."""
+    _require_pyarrow()
+    schema = property_schema()
+    columns = _PropertyColumns()
+    for row in rows:
+        columns.append(row)
+        if len(columns) >= batch_size:
+            yield columns.batch(schema)
+            columns = _PropertyColumns()
+    if len(columns):
+        yield columns.batch(schema)
+
+
+def topology_batch(topology: TopologyInfo) -> "pa.RecordBatch":
+    """The record batch of the instances of a topology."""
+    _require_pyarrow()
+    rows = []
+    for category in TOPOLOGY_CATEGORIES:
+        for instance_id, attributes in getattr(topology, category).items():
+            rows.append((category, instance_id,
+                         _attribute(attributes, "classId"),
+                         _attribute(attributes, "serverId"),
+                         _attribute(attributes, "host"),
+                         _attribute(attributes, "status"),
+                         encode_json(attributes).decode("utf-8")))
+    schema = topology_schema()
+    return pa.RecordBatch.from_arrays(
+        [pa.array(list(column), type=pa.string())
+         for column in (zip(*rows) if rows else [()] * len(schema))],
+        schema=schema)
+
+
+def _attribute(attributes: Dict[str, Any], name: str) -> Optional[str]:
+    value = attributes.get(name)
+    return None if value is None else str(value)
+
+
+# endregion
+
+# region Files
+
+Sink = Union[str, IO[bytes]]
+
+
+class TableWriter:
+    """Writes record batches of a schema to a Parquet or an Arrow IPC file
+    as they are given - a Parquet row group per batch.
+
+    Parameters:
+    sink(str or file): the path or the binary file to write.
+
+    schema(pyarrow.Schema): the schema of the batches.
+
+    format(str): "parquet" or "arrow".
+
+    Raises:
+    ImportError if pyarrow is not installed.
+    """
+
+    def __init__(self, sink: Sink, schema: "pa.Schema",
+                 format: str = EXPORT_PARQUET):
+        _require_pyarrow()
+        self.format = check_export_format(format)
+        self.schema = schema
+        self.rows = 0
+        if format == EXPORT_PARQUET:
+            self._writer = pq.ParquetWriter(sink, schema)
+        else:
+            self._writer = ipc.new_file(sink, schema)
+
+    def __enter__(self) -> "TableWriter":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, batch: "pa.RecordBatch"):
+        if batch.num_rows:
+            self._writer.write_batch(batch)
+            self.rows += batch.num_rows
+
+    def close(self):
+        """Completes the file."""
+        self._writer.close()
+
+
+class PropertyWriter(TableWriter):
+    """Writes property rows to a Parquet or an Arrow IPC file, a batch of
+    batch_size rows at a time, so that only one batch is held in memory.
+    Rows may be added one by one - e.g. the changes of a subscription - or
+    by whole snapshots, configurations or histories.
+
+    Parameters:
+    sink(str or file): the path or the binary file to write.
+
+    format(str): "parquet" or "arrow".
+
+    batch_size(int): the number of rows of each batch written.
+
+    Raises:
+    ImportError if pyarrow is not installed.
+    """
+
+    def __init__(self, sink: Sink, format: str = EXPORT_PARQUET,
+                 batch_size: int = DEFAULT_BATCH_SIZE):
+        super().__init__(sink, property_schema(), format)
+        self.batch_size = batch_size
+        self._columns = _PropertyColumns()
+
+    def add(self, device_id: str, prop: str, info: Union[PropertyInfo, Any]):
+        """Adds a PropertyInfo, or a property of a configuration."""
+        self.add_row((device_id, prop, *_info_fields(info)))
+
+    def add_row(self, row: PropertyRow):
+        self._columns.append(row)
+        if len(self._columns) >= self.batch_size:
+            self.flush()
+
+    def add_rows(self, rows: Iterable[PropertyRow]):
+        for row in rows:
+            self.add_row(row)
+
+    def add_snapshot(self, snapshot: ConfigurationSnapshot):
+        self.add_rows(snapshot_rows(snapshot))
+
+    def add_configuration(self, device_id: str, config: Mapping[str, Any]):
+        self.add_rows(configuration_rows([(device_id, config)]))
+
+    def add_samples(self, samples: Union[
+            Mapping[Tuple[str, str], Iterable[PropertyInfo]], Iterable[Any]]):
+        self.add_rows(sample_rows(samples))
+
+    def flush(self):
+        """Writes the rows added since the last batch."""
+        if len(self._columns):
+            self.write(self._columns.batch(self.schema))
+            self._columns = _PropertyColumns()
+
+    def close(self):
+        self.flush()
+        super().close()
+
+
+def write_properties(sink: Sink, rows: Iterable[PropertyRow],
+                     format: str = EXPORT_PARQUET,
+                     batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """Writes property rows - e.g. snapshot_rows(snapshot) - to a Parquet or
+    an Arrow IPC file, consuming them as needed. Returns the number of rows
+    written."""
+    with PropertyWriter(sink, format, batch_size) as writer:
+        writer.add_rows(rows)
+    return writer.rows
+
+
+def write_snapshot(sink: Sink, snapshot: ConfigurationSnapshot,
+                   format: str = EXPORT_PARQUET,
+                   batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """Writes the property values of a snapshot to a Parquet or an Arrow IPC
+    file. Returns the number of rows written."""
+    return write_properties(sink, snapshot_rows(snapshot), format,
+                            batch_size)
+
+
+def write_topology(sink: Sink, topology: TopologyInfo,
+                   format: str = EXPORT_PARQUET) -> int:
+    """Writes the instances of a topology to a Parquet or an Arrow IPC file.
+    Returns the number of rows written."""
+    with TableWriter(sink, topology_schema(), format) as writer:
+        writer.write(topology_batch(topology))
+    return writer.rows
+
+# endregion
@@ -0,0 +1,165 @@
+#
+# Hedged requests: when a request takes longer than most requests do, a
+# duplicate is sent - to the same or to a replica WebProxy - and the first
+# response wins. Only meant for idempotent requests, i.e. GETs.
+#
+import asyncio
+import itertools
+import math
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional, Sequence, TypeVar
+
+R = TypeVar("R")
+
+
+@dataclass
+class HedgingPolicy:
+    """When and where hedged requests are sent.
+
+    percentile: the percentile of the recent latencies after which a request
+    is hedged.
+
+    budget: the fraction of the requests that may be hedged, bounding the
+    extra load on the WebProxies.
+
+    replicas: the URLs of WebProxy instances serving the same topic, the
+    hedged requests are sent to in turn. If empty, the hedged requests go to
+    the client's WebProxy.
+
+    initial_delay: the hedging delay, in seconds, while too few latencies
+    have been observed to estimate the percentile.
+
+    min_delay: the lower bound of the hedging delay, in seconds.
+
+    window: the number of recent latencies the percentile is computed from.
+    """
+    percentile: float = 95.0
+    budget: float = 0.05
+    replicas: Sequence[str] = ()
+    initial_delay: float = 0.1
+    min_delay: float = 0.005
+    window: int = 256
+
+
+@dataclass
+class HedgingStats:
+    requests: int = 0
+    # Requests for which a duplicate was sent
+    hedged: int = 0
+    # Hedged requests answered first by the duplicate
+    hedge_wins: int = 0
+    # Requests that would have been hedged if not for the budget
+    over_budget: int = 0
+
+
+class LatencyTracker:
+    """The latencies of the most recent requests."""
+
+    # Number of latencies required to estimate a percentile
+    MIN_SAMPLES = 20
+
+    def __init__(self, window: int):
+        self._latencies = deque(maxlen=window)
+
+    def record(self, latency: float):
+        self._latencies.append(latency)
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        """The given percentile of the recent latencies (nearest rank), or
+        None if there are too few of them."""
+        if len(self._latencies) < self.MIN_SAMPLES:
+            return None
+        latencies = sorted(self._latencies)
+        rank = math.ceil(percentile / 100 * len(latencies))
+        return latencies[min(max(rank, 1), len(latencies)) - 1]
+
+
+class Hedger:
+    """Sends requests following a HedgingPolicy.
+
+    Parameters:
+    policy(HedgingPolicy): when and where to hedge.
+
+    base_url(str): the URL of the WebProxy of the client, used for the
+    hedged requests if the policy has no replicas.
+    """
+
+    def __init__(self, policy: HedgingPolicy, base_url: str):
+        self.policy = policy
+        self.stats = HedgingStats()
+        self._latencies = LatencyTracker(policy.window)
+        self._hedge_urls = itertools.cycle(
+            [_with_separator(url) for url in policy.replicas] or [base_url])
+        # Hedging tokens earned by the requests, a hedged request spends one.
+        # The cap bounds the burst of hedges after a quiet period.
+        self._tokens = 0.0
+        self._max_tokens = max(1.0, 10 * policy.budget)
+
+    def delay(self) -> float:
+        """How long a request may take before it is hedged."""
+        delay = self._latencies.percentile(self.policy.percentile)
+        if delay is None:
+            delay = self.policy.initial_delay
+        return max(delay, self.policy.min_delay)
+
+    async def request(self, send: Callable[[str], Awaitable[R]],
+                      base_url: str) -> R:
+        """Sends a request to base_url with send and, if it doesn't complete
+        within the hedging delay and the budget allows it, a duplicate to the
+        next hedging URL. Returns the first successful response, cancelling
+        the other request; raises the error of the first request if both
+        fail.
+
+        The latencies of the first requests are recorded: the time they took
+        if they completed or, if cancelled - e.g. as the duplicate won - the
+        time they ran for, a lower bound of their latency. Leaving them out
+        would underestimate the latencies as soon as requests are hedged.
+        The duplicates aren't recorded: they may have waited for a rate
+        limit token or a scheduler slot, and aren't sent to base_url."""
+        self.stats.requests += 1
+        self._tokens = min(self._tokens + self.policy.budget,
+                           self._max_tokens)
+        start = time.monotonic()
+        primary = asyncio.ensure_future(self._timed(send(base_url)))
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=self.delay())
+            if done:
+                return primary.result()
+            if self._tokens < 1.0:
+                self.stats.over_budget += 1
+                return await primary
+            self._tokens -= 1.0
+            self.stats.hedged += 1
+            hedge = asyncio.ensure_future(send(next(self._hedge_urls)))
+            try:
+                done, _ = await asyncio.wait(
+                    {primary, hedge}, return_when=asyncio.FIRST_COMPLETED)
+                winner = primary if primary in done else hedge
+                if winner.exception() is not None:
+                    # The other request may still succeed
+                    other = hedge if winner is primary else primary
+                    await asyncio.wait({other})
+                    if other.exception() is not None:
+                        return primary.result()
+                    winner = other
+                if winner is hedge:
+                    self.stats.hedge_wins += 1
+                return winner.result()
+            finally:
+                hedge.cancel()
+        finally:
+            if not primary.done():
+                self._latencies.record(time.monotonic() - start)
+            primary.cancel()
+
+    async def _timed(self, request: Awaitable[R]) -> R:
+        start = time.monotonic()
+        result = await request
+        self._latencies.record(time.monotonic() - start)
+        return result
+
+
+def _with_separator(url: str) -> str:
+    return url if url.endswith("/") else f"{url}/"
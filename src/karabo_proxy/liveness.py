@@ -0,0 +1,380 @@
+#
+# Monitoring of the liveness of devices: the devices listed by the WebProxy
+# - in devices.json or in the topology - are online, the others offline.
+# The list is polled at jittered intervals, so that many monitors started
+# together don't poll in lockstep, and the changes of state of the devices
+# are notified to callbacks.
+#
+import asyncio
+import inspect
+import random
+import sys
+import threading
+import time
+from array import array
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import Any, Callable, Collection, Dict, Iterable, List, Optional
+
+from .transports import TimeoutArg
+
+# Sources of the devices online
+SOURCE_DEVICES = "devices"
+SOURCE_TOPOLOGY = "topology"
+LIVENESS_SOURCES = (SOURCE_DEVICES, SOURCE_TOPOLOGY)
+
+
+class DeviceState(IntEnum):
+    # Not polled yet, or the WebProxy can't be polled
+    UNKNOWN = 0
+    ONLINE = 1
+    OFFLINE = 2
+
+
+@dataclass
+class LivenessChange:
+    """A change of state of a device."""
+    device_id: str
+    previous: DeviceState
+    state: DeviceState
+    # Time of the poll that detected the change, in seconds since the epoch
+    timestamp: float
+
+
+@dataclass
+class LivenessStats:
+    polls: int = 0
+    # Polls that failed, and the ones in a row up to the last poll
+    failures: int = 0
+    consecutive_failures: int = 0
+    last_error: Optional[str] = None
+    changes: int = 0
+    # Exceptions raised by the callbacks
+    callback_errors: int = 0
+    # Duration of the last successful poll, in seconds
+    last_latency: Optional[float] = None
+
+
+Callback = Callable[[LivenessChange], Any]
+
+
+class _DeviceStates:
+    """The state of each device, the time it entered it and its number of
+    transitions, in arrays indexed by device."""
+
+    def __init__(self, device_ids: Optional[Iterable[str]]):
+        self.watch_all = device_ids is None
+        self._index: Dict[str, int] = {}
+        self._states = array("b")
+        self._since = array("d")
+        self._transitions = array("L")
+        for device_id in device_ids or ():
+            self._add(device_id)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, device_id: object) -> bool:
+        return device_id in self._index
+
+    def state(self, device_id: str) -> DeviceState:
+        i = self._index.get(device_id)
+        return DeviceState.UNKNOWN if i is None else DeviceState(
+            self._states[i])
+
+    def since(self, device_id: str) -> Optional[float]:
+        i = self._index.get(device_id)
+        return None if i is None or not self._since[i] else self._since[i]
+
+    def transitions(self, device_id: str) -> int:
+        i = self._index.get(device_id)
+        return 0 if i is None else self._transitions[i]
+
+    def all(self) -> Dict[str, DeviceState]:
+        return {device_id: DeviceState(self._states[i])
+                for device_id, i in self._index.items()}
+
+    def update(self, online: Collection[str],
+               now: float) -> List[LivenessChange]:
+        """Sets the devices online, the others offline."""
+        if self.watch_all:
+            for device_id in online:
+                if device_id not in self._index:
+                    self._add(device_id)
+        return self._set_all(
+            lambda device_id: (DeviceState.ONLINE if device_id in online
+                               else DeviceState.OFFLINE), now)
+
+    def unknown(self, now: float) -> List[LivenessChange]:
+        """Sets all the devices in the unknown state."""
+        return self._set_all(lambda device_id: DeviceState.UNKNOWN, now)
+
+    def _set_all(self, state_of: Callable[[str], DeviceState],
+                 now: float) -> List[LivenessChange]:
+        changes = []
+        for device_id, i in self._index.items():
+            state = state_of(device_id)
+            if state != self._states[i]:
+                changes.append(LivenessChange(
+                    device_id, DeviceState(self._states[i]), state, now))
+                self._states[i] = state
+                self._since[i] = now
+                self._transitions[i] += 1
+        return changes
+
+    def _add(self, device_id: str):
+        self._index[sys.intern(device_id)] = len(self._states)
+        self._states.append(DeviceState.UNKNOWN)
+        self._since.append(0.0)
+        self._transitions.append(0)
+
+
+class _LivenessMonitorBase:
+
+    def __init__(self, client: Any, device_ids: Optional[Iterable[str]],
+                 interval: float, jitter: float, unknown_after: int,
+                 source: str, timeout: TimeoutArg):
+        if source not in LIVENESS_SOURCES:
+            raise ValueError(f"Unknown liveness source '{source}': supported "
+                             f"sources are {', '.join(LIVENESS_SOURCES)}.")
+        if not 0 <= jitter < 1:
+            raise ValueError("The jitter must be in [0, 1).")
+        self.client = client
+        self.interval = interval
+        self.jitter = jitter
+        self.unknown_after = unknown_after
+        self.source = source
+        self.timeout = timeout
+        self.stats = LivenessStats()
+        self._states = _DeviceStates(device_ids)
+        self._callbacks: List[Callback] = []
+        self._random = random.Random()
+        self._lock = threading.Lock()
+
+    def add_callback(self, callback: Callback):
+        """Calls callback with each LivenessChange."""
+        self._callbacks.append(callback)
+
+    def remove_callback(self, callback: Callback):
+        self._callbacks.remove(callback)
+
+    def state(self, device_id: str) -> DeviceState:
+        """The state of a device - UNKNOWN if not monitored."""
+        with self._lock:
+            return self._states.state(device_id)
+
+    def is_online(self, device_id: str) -> bool:
+        return self.state(device_id) == DeviceState.ONLINE
+
+    def since(self, device_id: str) -> Optional[float]:
+        """The time the device entered its state, in seconds since the
+        epoch, or None if it never changed state."""
+        with self._lock:
+            return self._states.since(device_id)
+
+    def transitions(self, device_id: str) -> int:
+        """The number of changes of state of a device."""
+        with self._lock:
+            return self._states.transitions(device_id)
+
+    def states(self) -> Dict[str, DeviceState]:
+        """The states of the monitored devices."""
+        with self._lock:
+            return self._states.all()
+
+    def next_delay(self) -> float:
+        """The time to wait before the next poll: the interval, randomly
+        lengthened or shortened by up to jitter times the interval."""
+        return self.interval * (
+            1 + self._random.uniform(-self.jitter, self.jitter))
+
+    def first_delay(self) -> float:
+        """The time to wait before the first poll: a random part of the
+        jitter of the interval, to spread monitors started together."""
+        return self._random.uniform(0, self.interval * self.jitter)
+
+    def _online(self, data: Any) -> Collection[str]:
+        if self.source == SOURCE_TOPOLOGY:
+            return data.device.keys()
+        return data.devices.keys()
+
+    def _polled(self, data: Any, started: float) -> List[LivenessChange]:
+        now = time.time()
+        with self._lock:
+            self.stats.polls += 1
+            self.stats.consecutive_failures = 0
+            self.stats.last_latency = time.monotonic() - started
+            changes = self._states.update(self._online(data), now)
+            self.stats.changes += len(changes)
+        return changes
+
+    def _failed(self, error: Exception) -> List[LivenessChange]:
+        with self._lock:
+            self.stats.polls += 1
+            self.stats.failures += 1
+            self.stats.consecutive_failures += 1
+            self.stats.last_error = str(error)
+            if self.stats.consecutive_failures < self.unknown_after:
+                return []
+            changes = self._states.unknown(time.time())
+            self.stats.changes += len(changes)
+        return changes
+
+
+class AsyncLivenessMonitor(_LivenessMonitorBase):
+    """Monitors the liveness of devices with an AsyncKaraboProxy, polling
+    the devices listed by the WebProxy in a task.
+
+    The callbacks are called with each LivenessChange, in the event loop of
+    the monitor; callbacks returning an awaitable are awaited. Exceptions
+    raised by the callbacks are counted in the stats.
+
+    Parameters:
+    client(AsyncKaraboProxy): the client polling the WebProxy.
+
+    device_ids(Iterable[str]): the devices to monitor - by default all the
+    devices ever listed by the WebProxy.
+
+    interval(float): the mean time between two polls, in seconds.
+
+    jitter(float): the random variation of the intervals, as a fraction of
+    the interval, in [0, 1).
+
+    unknown_after(int): the number of consecutive failed polls after which
+    the devices are in the UNKNOWN state.
+
+    source(str): polls devices.json ("devices") or the topology
+    ("topology").
+
+    timeout(Timeout or float): the timeouts of the polls.
+    """
+
+    def __init__(self, client: Any,
+                 device_ids: Optional[Iterable[str]] = None,
+                 interval: float = 2.0, jitter: float = 0.1,
+                 unknown_after: int = 3, source: str = SOURCE_DEVICES,
+                 timeout: TimeoutArg = None):
+        super().__init__(client, device_ids, interval, jitter, unknown_after,
+                         source, timeout)
+        self._task: Optional[asyncio.Task] = None
+
+    async def __aenter__(self) -> "AsyncLivenessMonitor":
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    def start(self):
+        """Starts polling in a task of the running event loop."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """Stops polling."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def poll(self) -> List[LivenessChange]:
+        """Polls the WebProxy once, notifies the changes of state and
+        returns them."""
+        started = time.monotonic()
+        try:
+            if self.source == SOURCE_TOPOLOGY:
+                data = await self.client.get_topology(self.timeout)
+            else:
+                data = await self.client.get_devices(self.timeout)
+        except Exception as e:
+            changes = self._failed(e)
+        else:
+            changes = self._polled(data, started)
+        for change in changes:
+            for callback in list(self._callbacks):
+                try:
+                    result = callback(change)
+                    if inspect.isawaitable(result):
+                        await result
+                except Exception:
+                    self.stats.callback_errors += 1
+        return changes
+
+    async def _run(self):
+        await asyncio.sleep(self.first_delay())
+        while True:
+            await self.poll()
+            await asyncio.sleep(self.next_delay())
+
+
+class LivenessMonitor(_LivenessMonitorBase):
+    """Monitors the liveness of devices with a SyncKaraboProxy, polling the
+    devices listed by the WebProxy in a daemon thread.
+
+    The callbacks are called with each LivenessChange in the thread of the
+    monitor. Exceptions raised by the callbacks are counted in the stats.
+    The parameters are the ones of AsyncLivenessMonitor.
+    """
+
+    def __init__(self, client: Any,
+                 device_ids: Optional[Iterable[str]] = None,
+                 interval: float = 2.0, jitter: float = 0.1,
+                 unknown_after: int = 3, source: str = SOURCE_DEVICES,
+                 timeout: TimeoutArg = None):
+        super().__init__(client, device_ids, interval, jitter, unknown_after,
+                         source, timeout)
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def __enter__(self) -> "LivenessMonitor":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        """Starts polling in a daemon thread."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="liveness-monitor", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stops polling, waiting up to timeout seconds for the poll in
+        progress, if any."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def poll(self) -> List[LivenessChange]:
+        """Polls the WebProxy once, notifies the changes of state and
+        returns them."""
+        started = time.monotonic()
+        try:
+            if self.source == SOURCE_TOPOLOGY:
+                data = self.client.get_topology(self.timeout)
+            else:
+                data = self.client.get_devices(self.timeout)
+        except Exception as e:
+            changes = self._failed(e)
+        else:
+            changes = self._polled(data, started)
+        for change in changes:
+            for callback in list(self._callbacks):
+                try:
+                    callback(change)
+                except Exception:
+                    self.stats.callback_errors += 1
+        return changes
+
+    def _run(self):
+        delay = self.first_delay()
+        while not self._stopped.wait(delay):
+            self.poll()
+            delay = self.next_delay()
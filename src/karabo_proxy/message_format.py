@@ -26,3 +26,24 @@ def error_403_put(operation_name: str, operand_id: str) -> str:
 def error_422_put(operation_name: str, operand_id: str) -> str:
     return (f"Cannot {operation_name} ({operand_id}): "
             "device is not reconfigurable.")
+
+
+def error_timeout(operation_name: str) -> str:
+    return f"Timeout {operation_name}: no complete response in time."
+
+
+def batch_deadline_expired(deadline: float) -> str:
+    return f"Not completed within the deadline of the batch ({deadline} s)."
+
+
+def rate_limit_exceeded(category: str, rate: float) -> str:
+    return (f"Rate limit of the {category} requests exceeded "
+            f"({rate} requests/s).")
+
+
+def property_not_found(device_id: str, property_name: str) -> str:
+    return f"Property '{property_name}' not found in device '{device_id}'."
+
+
+def injected_property_exists(property_name: str) -> str:
+    return f"Property '{property_name}' already injected: not added again."
@@ -0,0 +1,113 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from typing import Optional, Tuple
+
+from .data.device_config import PropertyInfo
+
+# (device_id, property name)
+PropertyKey = Tuple[str, str]
+
+
+@dataclass
+class PropertyCacheStats:
+    hits: int = 0
+    # Reads of properties not in the cache or whose cached value was too
+    # old; reads with a max_age of 0, which bypass the cache, are not counted
+    misses: int = 0
+    # Entries dropped to stay within the size bound
+    evictions: int = 0
+    # Entries dropped after writes of the client
+    invalidations: int = 0
+
+
+class PropertyCache:
+    """In-memory cache of the property values read by get_device_config_path,
+    bounded in size with least recently used eviction.
+
+    Reads are served from the cache if the cached value was retrieved at
+    most max_age seconds ago, as a copy of the cached PropertyInfo - and of
+    its value if it is a list or dict - so that callers may modify it. The
+    client invalidates the properties it writes, and all the properties of a
+    device it executes a slot on.
+
+    Parameters:
+    max_entries(int): the maximum number of properties in the cache.
+
+    max_age(float): the default staleness bound of the reads, in seconds;
+    0 disables reading from the cache unless a read specifies a max_age.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_age: float = 0.0):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.stats = PropertyCacheStats()
+        self._lock = threading.Lock()
+        # key -> (time of retrieval as given by time.monotonic, value), from
+        # the least to the most recently used
+        self._entries = OrderedDict()
+        # Incremented by every invalidation, so that reads which overlap
+        # with a write don't cache the value from before the write.
+        self._generation = 0
+
+    def get(self, key: PropertyKey,
+            max_age: Optional[float] = None) -> Optional[PropertyInfo]:
+        """The cached value of a property, if retrieved at most max_age (or
+        the default max_age) seconds ago."""
+        if max_age is None:
+            max_age = self.max_age
+        if max_age <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > max_age:
+                self.stats.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            value = entry[1]
+        if isinstance(value.value, (list, dict)):
+            return replace(value, value=value.value.copy())
+        return replace(value)
+
+    def generation(self) -> int:
+        """To be taken before retrieving a value to put in the cache."""
+        return self._generation
+
+    def put(self, key: PropertyKey, value: PropertyInfo,
+            generation: int, retrieved: Optional[float] = None):
+        """Caches the value of a property retrieved at the given time (as
+        given by time.monotonic - now by default). The value is dropped if
+        an invalidation happened since the generation was taken."""
+        if retrieved is None:
+            retrieved = time.monotonic()
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[key] = (retrieved, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats.evictions += 1
+
+    def invalidate(self, device_id: str, property_name: Optional[str] = None):
+        """Drops a property - or all the properties of a device - from the
+        cache."""
+        with self._lock:
+            self._generation += 1
+            if property_name is not None:
+                keys = [(device_id, property_name)]
+            else:
+                keys = [key for key in self._entries if key[0] == device_id]
+            for key in keys:
+                if self._entries.pop(key, None) is not None:
+                    self.stats.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
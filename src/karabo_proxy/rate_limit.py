@@ -0,0 +1,189 @@
+#
+# Client-side rate limiting of the requests to the WebProxy with token
+# buckets, per category of request.
+#
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from .message_format import rate_limit_exceeded
+
+# Categories of requests
+READ = "read"
+WRITE = "write"
+SLOT = "slot"
+INJECTED = "injected"
+
+
+class RateLimitExceeded(RuntimeError):
+    """Raised, in reject mode, by a call exceeding its rate limit."""
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """Sustained rate, in requests per second, and the number of requests
+    that may be sent at once after a quiet period."""
+    rate: float
+    burst: int = 1
+
+
+@dataclass
+class RateLimits:
+    """The rate limits of a client per category of request; None means no
+    limit.
+
+    reads: the retrieval of topology, devices, configurations, properties
+    and schemas.
+
+    writes: the setting of configurations and properties.
+
+    slots: slot executions.
+
+    injected: all the operations on injected properties.
+
+    reject: whether calls exceeding their limit raise RateLimitExceeded
+    instead of waiting for their turn.
+    """
+    reads: Optional[RateLimit] = None
+    writes: Optional[RateLimit] = None
+    slots: Optional[RateLimit] = None
+    injected: Optional[RateLimit] = None
+    reject: bool = False
+
+
+@dataclass
+class RateLimitStats:
+    calls: int = 0
+    # Calls that had to wait for their turn, and how long they waited in
+    # total and at most, in seconds
+    delayed: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+    rejected: int = 0
+
+
+class TokenBucket:
+    """Thread-safe token bucket. Each request takes a token; tokens are
+    added at the given rate up to burst."""
+
+    def __init__(self, limit: RateLimit):
+        self.limit = limit
+        self._tokens = float(limit.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, reject: bool) -> Optional[float]:
+        """Takes a token and returns how long to wait, in seconds, before
+        sending the request. Waiting callers are served in order: tokens are
+        borrowed from the future. In reject mode, returns None instead of
+        borrowing a token."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self._tokens + (now - self._updated) * self.limit.rate,
+                float(self.limit.burst))
+            self._updated = now
+            if self._tokens < 1.0 and reject:
+                return None
+            self._tokens -= 1.0
+            if self._tokens >= 0.0:
+                return 0.0
+            return -self._tokens / self.limit.rate
+
+    def release(self):
+        """Gives back the token of a reservation whose request is not sent,
+        so that the reservations made from now on aren't delayed by it. The
+        callers already waiting keep the wait computed when they reserved
+        their token."""
+        with self._lock:
+            self._tokens = min(self._tokens + 1.0, float(self.limit.burst))
+
+
+class RateLimiter:
+    """Rate limits of the requests of a client."""
+
+    def __init__(self, limits: RateLimits):
+        self.limits = limits
+        self.stats: Dict[str, RateLimitStats] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._stats_lock = threading.Lock()
+        for category, limit in ((READ, limits.reads), (WRITE, limits.writes),
+                                (SLOT, limits.slots),
+                                (INJECTED, limits.injected)):
+            if limit is not None:
+                self._buckets[category] = TokenBucket(limit)
+                self.stats[category] = RateLimitStats()
+
+    def reserve(self, method: str, path: str) -> float:
+        """Takes a token for a request and returns how long to wait before
+        sending it.
+
+        Raises:
+        RateLimitExceeded in reject mode if the request exceeds its limit.
+        """
+        category = request_category(method, path)
+        bucket = self._buckets.get(category)
+        if bucket is None:
+            return 0.0
+        wait = bucket.reserve(self.limits.reject)
+        with self._stats_lock:
+            stats = self.stats[category]
+            stats.calls += 1
+            if wait is None:
+                stats.rejected += 1
+            elif wait > 0.0:
+                stats.delayed += 1
+                stats.total_wait += wait
+                stats.max_wait = max(stats.max_wait, wait)
+        if wait is None:
+            raise RateLimitExceeded(rate_limit_exceeded(
+                category, bucket.limit.rate))
+        return wait
+
+    def acquire(self, method: str, path: str,
+                max_wait: Optional[float] = None) -> float:
+        """Blocks until a request may be sent and returns how long it
+        waited, in seconds.
+
+        Raises:
+        TimeoutError, without waiting, if the request would have to wait
+        longer than max_wait; its token is given back.
+        """
+        wait = self.reserve(method, path)
+        if max_wait is not None and wait > max_wait:
+            self.release(method, path)
+            raise TimeoutError(f"No token within {max_wait} s")
+        if wait > 0.0:
+            time.sleep(wait)
+        return wait
+
+    def release(self, method: str, path: str):
+        """Gives back the token reserved for a request that is not sent."""
+        bucket = self._buckets.get(request_category(method, path))
+        if bucket is not None:
+            bucket.release()
+
+    async def async_acquire(self, method: str, path: str):
+        """Waits until a request may be sent. The token is given back if the
+        wait is cancelled - see TokenBucket.release."""
+        import asyncio
+
+        wait = self.reserve(method, path)
+        if wait > 0.0:
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                self.release(method, path)
+                raise
+
+
+def request_category(method: str, path: str) -> str:
+    """The category of a request to a path relative to the WebProxy URL."""
+    if path.startswith("property/"):
+        return INJECTED
+    if "/slot/" in path:
+        return SLOT
+    if method in ("GET", "HEAD"):
+        return READ
+    return WRITE
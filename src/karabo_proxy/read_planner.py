@@ -0,0 +1,213 @@
+#
+# Planning of the reads of several properties of a device: either one
+# request per property (devices/<id>.<property>/config.json) or a single
+# request for the whole configuration (devices/<id>/config.json), whichever
+# the latencies observed so far predict to be cheaper.
+#
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from .data.device_config import PropertyInfo
+from .message_format import property_not_found
+
+# Strategies of the reads of several properties
+FULL = "full"
+PATHS = "paths"
+
+
+@dataclass
+class ReadPlan:
+    """The strategy chosen for a read and the predicted costs, in seconds
+    of requests, of both strategies - None when unknown."""
+    device_id: str
+    properties: int
+    strategy: str
+    paths_cost: Optional[float]
+    full_cost: Optional[float]
+    # Whether the strategy was chosen to refresh its estimate rather than
+    # for its cost
+    explored: bool = False
+
+
+@dataclass
+class ReadPlannerStats:
+    plans: int = 0
+    # Plans by strategy
+    strategies: Dict[str, int] = field(
+        default_factory=lambda: {FULL: 0, PATHS: 0})
+    explorations: int = 0
+    # Devices whose estimates were dropped to stay within max_devices
+    evictions: int = 0
+    last_plan: Optional[ReadPlan] = None
+
+
+@dataclass
+class _DeviceEstimates:
+    # Smoothed latency of the full configuration reads, in seconds
+    full_latency: Optional[float] = None
+    # Number of properties of the configuration, learned from its reads or
+    # from the schema of the device
+    size: Optional[int] = None
+    plans: int = 0
+
+
+class ReadPlanner:
+    """Chooses how to read several properties of a device from the latencies
+    of the past reads of the client.
+
+    The cost of reading n properties one by one is n times the smoothed
+    latency of the single property reads, which hardly depends on the
+    device. The cost of reading the whole configuration is the smoothed
+    latency of the configuration reads of the device or, for a device never
+    read whole, the mean latency per property of the other devices times the
+    size of its configuration, if known, or the mean latency of the other
+    configuration reads. Total request time is compared, rather than
+    elapsed time, as it is what loads the WebProxy.
+
+    Parameters:
+    smoothing(float): the weight of a new latency in the smoothed
+    latencies.
+
+    explore_every(int): every explore_every-th plan of a device uses the
+    strategy deemed more expensive, keeping both estimates current; 0
+    disables exploration.
+
+    max_devices(int): the maximum number of devices whose estimates are
+    kept, the least recently used being dropped first.
+    """
+
+    def __init__(self, smoothing: float = 0.2, explore_every: int = 50,
+                 max_devices: int = 4096):
+        self.smoothing = smoothing
+        self.explore_every = explore_every
+        self.max_devices = max_devices
+        self.stats = ReadPlannerStats()
+        self._path_latency: Optional[float] = None
+        # From the least to the most recently used device
+        self._devices = OrderedDict()
+        # Over the devices with a full latency: the number of them and the
+        # sums of their full latencies and of their latencies per property
+        self._known = 0
+        self._full_sum = 0.0
+        self._per_property_sum = 0.0
+        self._lock = threading.Lock()
+
+    def plan(self, device_id: str, properties: int) -> ReadPlan:
+        """The strategy to read the given number of properties of a
+        device."""
+        with self._lock:
+            device = self._device(device_id)
+            device.plans += 1
+            paths_cost = (None if self._path_latency is None
+                          else properties * self._path_latency)
+            full_cost = self._full_cost(device)
+            explored = False
+            if paths_cost is None or full_cost is None:
+                # Learn the missing estimate, unless a single property is
+                # read
+                if properties == 1:
+                    strategy = PATHS
+                else:
+                    strategy = FULL if full_cost is None else PATHS
+                    explored = (device.full_latency is None
+                                or self._path_latency is None)
+            else:
+                strategy = PATHS if paths_cost <= full_cost else FULL
+                if (self.explore_every and properties > 1
+                        and device.plans % self.explore_every == 0):
+                    strategy = FULL if strategy == PATHS else PATHS
+                    explored = True
+            plan = ReadPlan(device_id, properties, strategy, paths_cost,
+                            full_cost, explored)
+            self.stats.plans += 1
+            self.stats.strategies[strategy] += 1
+            self.stats.explorations += explored
+            self.stats.last_plan = plan
+            return plan
+
+    def observe_path(self, latency: float):
+        """Records the latency of a single property read."""
+        with self._lock:
+            self._path_latency = self._smooth(self._path_latency, latency)
+
+    def observe_full(self, device_id: str, latency: float, size: int):
+        """Records the latency of a configuration read and the number of
+        properties of the configuration."""
+        with self._lock:
+            device = self._device(device_id)
+            if device.full_latency is None:
+                self._known += 1
+            else:
+                self._forget(device)
+            device.full_latency = self._smooth(device.full_latency, latency)
+            device.size = size
+            self._full_sum += device.full_latency
+            self._per_property_sum += device.full_latency / max(size, 1)
+
+    def observe_size(self, device_id: str, size: int):
+        """Records the number of properties of a device - e.g. of its
+        schema - before its configuration is read."""
+        with self._lock:
+            device = self._device(device_id)
+            if device.full_latency is None:
+                device.size = size
+
+    def estimates(self, device_id: str) -> Tuple[Optional[float],
+                                                 Optional[float]]:
+        """The smoothed latencies of a single property read and of a
+        configuration read of a device."""
+        with self._lock:
+            return (self._path_latency,
+                    self._full_cost(self._devices.get(device_id)))
+
+    def _device(self, device_id: str) -> _DeviceEstimates:
+        device = self._devices.get(device_id)
+        if device is None:
+            device = self._devices[device_id] = _DeviceEstimates()
+            while len(self._devices) > self.max_devices:
+                _, evicted = self._devices.popitem(last=False)
+                if evicted.full_latency is not None:
+                    self._known -= 1
+                    self._forget(evicted)
+                self.stats.evictions += 1
+        else:
+            self._devices.move_to_end(device_id)
+        return device
+
+    def _forget(self, device: _DeviceEstimates):
+        """Removes the full latency of a device from the sums."""
+        self._full_sum -= device.full_latency
+        self._per_property_sum -= device.full_latency / max(device.size, 1)
+
+    def _full_cost(self, device: Optional[_DeviceEstimates]
+                   ) -> Optional[float]:
+        if device is not None and device.full_latency is not None:
+            return device.full_latency
+        if not self._known:
+            return None
+        if device is not None and device.size:
+            return self._per_property_sum / self._known * device.size
+        return self._full_sum / self._known
+
+    def _smooth(self, estimate: Optional[float], latency: float) -> float:
+        if estimate is None:
+            return latency
+        return estimate + self.smoothing * (latency - estimate)
+
+
+def properties_of(device_id: str, config: Mapping[str, Dict[str, Any]],
+                  property_names: List[str]) -> Dict[str, PropertyInfo]:
+    """Extracts properties from a configuration as returned by
+    get_device_configuration.
+
+    Raises:
+    RuntimeError if a property is not in the configuration.
+    """
+    properties = {}
+    for name in property_names:
+        if name not in config:
+            raise RuntimeError(property_not_found(device_id, name))
+        properties[name] = PropertyInfo(**config[name])
+    return properties
@@ -0,0 +1,145 @@
+#
+# Priority scheduling of the requests of the AsyncKaraboProxy.
+#
+# The scheduler limits the number of requests in flight - matching the
+# connections available - and hands the freed slots to the waiting request
+# of the highest priority. Waiting raises the priority of a request, so that
+# low priority requests are not starved by a steady flow of higher priority
+# ones.
+#
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import AsyncIterator, Deque, Dict, Iterator, Optional, Tuple
+
+
+class Priority(IntEnum):
+    HIGH = 0
+    NORMAL = 1
+    LOW = 2
+
+
+# Priority of the requests sent from the current context, if set
+_current_priority = ContextVar("_current_priority", default=None)
+
+
+@contextmanager
+def priority(value: Priority, override: bool = True) -> Iterator[None]:
+    """Sets the priority of the requests sent from within the block - and
+    from the tasks it creates. If override is False, an enclosing priority
+    is kept."""
+    if not override and _current_priority.get() is not None:
+        yield
+        return
+    token = _current_priority.set(value)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def current_priority() -> Optional[Priority]:
+    return _current_priority.get()
+
+
+@dataclass
+class SchedulerStats:
+    # Requests currently waiting, and the most that ever waited at once
+    queued: int = 0
+    max_queued: int = 0
+    dispatched: int = 0
+    # Time spent waiting for a slot, in seconds
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+
+
+class RequestScheduler:
+    """Schedules requests by priority.
+
+    Parameters:
+    max_in_flight(int): the maximum number of requests in flight. Should not
+    exceed the connections of the transport, 100 for aiohttp, so that the
+    requests queue here rather than in the connection pool.
+
+    aging(float): the waiting time, in seconds, worth one priority class:
+    a LOW request waiting for more than 2 * aging seconds goes before a HIGH
+    request that just arrived.
+    """
+
+    def __init__(self, max_in_flight: int = 16, aging: float = 1.0):
+        self.max_in_flight = max_in_flight
+        self.aging = aging
+        self.stats = {priority: SchedulerStats() for priority in Priority}
+        self._in_flight = 0
+        # priority -> (time queued, future set when given a slot)
+        self._waiters: Dict[Priority, Deque[Tuple[float, asyncio.Future]]]
+        self._waiters = {priority: deque() for priority in Priority}
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority) -> AsyncIterator[None]:
+        """Waits for a slot for a request of the given priority and holds it
+        for the duration of the block."""
+        stats = self.stats[priority]
+        queued_at = time.monotonic()
+        if self._in_flight < self.max_in_flight and not any(
+                self._waiters.values()):
+            self._in_flight += 1
+        else:
+            waiter = (queued_at, asyncio.get_running_loop().create_future())
+            waiters = self._waiters[priority]
+            waiters.append(waiter)
+            stats.queued += 1
+            stats.max_queued = max(stats.max_queued, stats.queued)
+            self._dispatch()
+            try:
+                await waiter[1]
+            except asyncio.CancelledError:
+                if waiter[1].done() and not waiter[1].cancelled():
+                    # Given a slot right before being cancelled
+                    self._release()
+                elif waiter in waiters:
+                    waiters.remove(waiter)
+                    stats.queued -= 1
+                raise
+            wait = time.monotonic() - queued_at
+            stats.total_wait += wait
+            stats.max_wait = max(stats.max_wait, wait)
+        stats.dispatched += 1
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _release(self):
+        self._in_flight -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        """Hands the free slots to the waiters of the best scores."""
+        while self._in_flight < self.max_in_flight:
+            now = time.monotonic()
+            best = None
+            best_score = None
+            for priority, waiters in self._waiters.items():
+                # Drop the waiters cancelled but not woken up yet
+                while waiters and waiters[0][1].done():
+                    waiters.popleft()
+                    self.stats[priority].queued -= 1
+                if waiters:
+                    score = priority - (now - waiters[0][0]) / self.aging
+                    if best_score is None or score < best_score:
+                        best, best_score = priority, score
+            if best is None:
+                return
+            _, future = self._waiters[best].popleft()
+            self.stats[best].queued -= 1
+            self._in_flight += 1
+            future.set_result(None)
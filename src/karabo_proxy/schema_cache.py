@@ -0,0 +1,188 @@
+#
+# On-disk cache of device schemas shared by the processes of a host.
+#
+# Schemas are stored one file per (device class, schema fingerprint) in a
+# compact binary layout:
+#
+#   header:  magic (4s) | format version (H) | number of entries (I)
+#   index:   per entry - offset (I) | length (I) | name length (H) | name
+#   payload: per entry - the attributes of the property as compact JSON
+#
+# Files are written once to a temporary name and atomically renamed into
+# place, so concurrent readers either see a complete file or no file at all.
+# Readers memory-map the files and only decode the attributes of a property
+# when it is accessed.
+#
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+import tempfile
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+_MAGIC = b"KPSC"
+_FORMAT_VERSION = 1
+_HEADER = struct.Struct("<4sHI")
+_INDEX_ENTRY = struct.Struct("<IIH")
+
+# Attributes of a device's instance info that, together with its classId,
+# identify the schema of the device class it is an instance of.
+_FINGERPRINT_KEYS = ("serverId", "karaboVersion", "version", "lang")
+
+# Time, in seconds, the devices' instance info used to compute schema cache
+# keys is reused by a client before being fetched again.
+DEVICES_INFO_TTL = 30.0
+
+
+def schema_cache_key(
+        instance_info: Dict[str, Any]) -> Optional[Tuple[str, str]]:
+    """Returns the (class_id, fingerprint) pair under which the schema of a
+    device with the given instance info is cached, or None if the instance
+    info lacks the device class."""
+    class_id = instance_info.get("classId")
+    if not class_id:
+        return None
+    digest = hashlib.sha1(str(class_id).encode("utf-8"))
+    for key in _FINGERPRINT_KEYS:
+        digest.update(f"\0{key}={instance_info.get(key, '')}".encode("utf-8"))
+    return str(class_id), digest.hexdigest()[:16]
+
+
+class MappedSchema(Mapping):
+    """Read-only view of a cached device schema backed by a memory-mapped
+    file. The attributes of a property are only decoded on first access."""
+
+    def __init__(self, buffer: mmap.mmap, index: Dict[str, Tuple[int, int]]):
+        self._buffer = buffer
+        self._index = index
+        self._decoded: Dict[str, Dict[str, Any]] = {}
+
+    def __getitem__(self, property_name: str) -> Dict[str, Any]:
+        attributes = self._decoded.get(property_name)
+        if attributes is None:
+            offset, length = self._index[property_name]
+            attributes = json.loads(self._buffer[offset:offset + length])
+            self._decoded[property_name] = attributes
+        return attributes
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, property_name: object) -> bool:
+        return property_name in self._index
+
+
+class SchemaCache:
+    """Persistent cache of device schemas in a local directory.
+
+    A single directory can be shared by any number of processes - and
+    clients - on the same host. Devices that modify their schema at runtime
+    should not have their schemas retrieved through a cache.
+
+    Parameters:
+    directory(str): the directory where the cached schemas are stored; it is
+    created if it does not exist.
+
+    max_mapped(int): the maximum number of schema files kept mapped - each
+    holding a file descriptor - for reuse, the least recently used being
+    dropped first. A dropped mapping is closed once the schemas returned
+    from it are no longer referenced.
+    """
+
+    def __init__(self, directory: str, max_mapped: int = 128):
+        self.directory = directory
+        self.max_mapped = max_mapped
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        # path -> mapped schema, from the least to the most recently used
+        self._mapped = OrderedDict()
+
+    def get(self, class_id: str,
+            fingerprint: str) -> Optional[MappedSchema]:
+        """Returns the cached schema for a device class and fingerprint or
+        None if there is no valid cache entry for them."""
+        path = self._path(class_id, fingerprint)
+        with self._lock:
+            schema = self._mapped.get(path)
+            if schema is not None:
+                self._mapped.move_to_end(path)
+                return schema
+            schema = _map_schema_file(path)
+            if schema is not None:
+                self._mapped[path] = schema
+                while len(self._mapped) > self.max_mapped:
+                    self._mapped.popitem(last=False)
+            return schema
+
+    def put(self, class_id: str, fingerprint: str,
+            schema: Dict[str, Dict[str, Any]]):
+        """Stores the schema of a device class and fingerprint."""
+        path = self._path(class_id, fingerprint)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                tmp_file.write(_encode_schema(schema))
+            os.replace(tmp_path, path)
+        except OSError:
+            # Another process may be holding the file (on platforms that do
+            # not allow replacing open files) - it is writing the same
+            # content anyway.
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _path(self, class_id: str, fingerprint: str) -> str:
+        safe_class_id = re.sub(r"[^A-Za-z0-9_.-]", "_", class_id)
+        return os.path.join(self.directory,
+                            f"{safe_class_id}-{fingerprint}.schema")
+
+
+def _encode_schema(schema: Dict[str, Dict[str, Any]]) -> bytes:
+    names = [name.encode("utf-8") for name in schema]
+    blobs = [json.dumps(attributes, separators=(",", ":")).encode("utf-8")
+             for attributes in schema.values()]
+    index_size = sum(_INDEX_ENTRY.size + len(name) for name in names)
+    offset = _HEADER.size + index_size
+    parts = [_HEADER.pack(_MAGIC, _FORMAT_VERSION, len(names))]
+    for name, blob in zip(names, blobs):
+        parts.append(_INDEX_ENTRY.pack(offset, len(blob), len(name)))
+        parts.append(name)
+        offset += len(blob)
+    parts.extend(blobs)
+    return b"".join(parts)
+
+
+def _map_schema_file(path: str) -> Optional[MappedSchema]:
+    try:
+        with open(path, "rb") as schema_file:
+            buffer = mmap.mmap(schema_file.fileno(), 0,
+                               access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        # Missing or empty file.
+        return None
+    try:
+        magic, version, count = _HEADER.unpack_from(buffer, 0)
+        if magic != _MAGIC or version != _FORMAT_VERSION:
+            raise ValueError(f"unsupported schema file '{path}'")
+        index = {}
+        position = _HEADER.size
+        for _ in range(count):
+            offset, length, name_length = _INDEX_ENTRY.unpack_from(
+                buffer, position)
+            position += _INDEX_ENTRY.size
+            name = buffer[position:position + name_length].decode("utf-8")
+            position += name_length
+            if offset + length > len(buffer):
+                raise ValueError(f"truncated schema file '{path}'")
+            index[name] = (offset, length)
+    except (struct.error, UnicodeDecodeError, ValueError):
+        buffer.close()
+        return None
+    return MappedSchema(buffer, index)
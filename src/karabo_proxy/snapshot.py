@@ -0,0 +1,102 @@
+import math
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Tuple
+
+from .data.device_config import PropertyValue
+from .decoding import CompactDeviceConfig
+
+# Value of the "accessMode" attribute of the properties that can be set
+# after a device is instantiated.
+RECONFIGURABLE = "RECONFIGURABLE"
+
+
+@dataclass
+class SnapshotDiff:
+    """Differences between two configuration snapshots, "before" and
+    "after"."""
+    # Properties with different values in both snapshots:
+    # device_id -> property -> (value before, value after)
+    changed: Dict[str, Dict[str, Tuple[PropertyValue, PropertyValue]]] = (
+        field(default_factory=dict))
+    # Devices in only one of the snapshots
+    only_before: List[str] = field(default_factory=list)
+    only_after: List[str] = field(default_factory=list)
+
+    def __bool__(self) -> bool:
+        return bool(self.changed or self.only_before or self.only_after)
+
+
+@dataclass
+class ConfigurationSnapshot:
+    """The property values of a set of devices at a point in time."""
+    # device_id -> property -> value
+    configurations: Dict[str, Dict[str, PropertyValue]]
+    # Time of the capture, in seconds since the epoch
+    timestamp: float = field(default_factory=time.time)
+    # device_id -> reason why its configuration could not be captured
+    errors: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def device_ids(self) -> List[str]:
+        return list(self.configurations)
+
+    def diff(self, after: "ConfigurationSnapshot") -> SnapshotDiff:
+        """Compares this snapshot with a later one - or a snapshot of the
+        live state. Only properties present in both snapshots are
+        compared."""
+        result = SnapshotDiff()
+        for device_id, config_before in self.configurations.items():
+            config_after = after.configurations.get(device_id)
+            if config_after is None:
+                result.only_before.append(device_id)
+            elif config_after != config_before:
+                changed = _diff_configurations(config_before, config_after)
+                if changed:
+                    result.changed[device_id] = changed
+        result.only_after = [device_id for device_id in after.configurations
+                             if device_id not in self.configurations]
+        return result
+
+
+def snapshot_values(config: Dict[str, Any]) -> Dict[str, PropertyValue]:
+    """Extracts the property values of a device configuration as returned by
+    get_device_configuration."""
+    if isinstance(config, CompactDeviceConfig):
+        return config.property_values()
+    return {prop: info["value"] for prop, info in config.items()}
+
+
+def writable_properties(schema: Dict[str, Dict[str, Any]]) -> List[str]:
+    """The properties of a device schema that can be reconfigured."""
+    return [prop for prop, attributes in schema.items()
+            if attributes.get("accessMode") == RECONFIGURABLE]
+
+
+def restore_changes(
+        snapshot_config: Dict[str, PropertyValue],
+        live_config: Dict[str, PropertyValue],
+        writable: List[str]) -> Dict[str, PropertyValue]:
+    """The writable properties whose live values differ from the ones in a
+    snapshot, with the values to restore."""
+    return {prop: snapshot_config[prop] for prop in writable
+            if prop in snapshot_config and prop in live_config
+            and _values_differ(snapshot_config[prop], live_config[prop])}
+
+
+def _diff_configurations(
+        before: Dict[str, PropertyValue], after: Dict[str, PropertyValue]
+) -> Dict[str, Tuple[PropertyValue, PropertyValue]]:
+    changed = {}
+    for prop, value_before in before.items():
+        if prop in after and _values_differ(value_before, after[prop]):
+            changed[prop] = (value_before, after[prop])
+    return changed
+
+
+def _values_differ(value_1: PropertyValue, value_2: PropertyValue) -> bool:
+    if value_1 == value_2:
+        return False
+    # NaN is never equal to itself
+    return not (isinstance(value_1, float) and isinstance(value_2, float)
+                and math.isnan(value_1) and math.isnan(value_2))
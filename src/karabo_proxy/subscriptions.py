@@ -0,0 +1,284 @@
+#
+# Subscriptions to the changes of device properties: pushed by the WebProxy
+# over a websocket or a server-sent events stream when it offers them, or
+# detected by polling otherwise.
+#
+# The push endpoints expected from the WebProxy:
+#   - subscriptions/ws: a websocket to which the client sends
+#     {"subscribe": [[device_id, path], ...]} and from which it receives the
+#     changes of those properties;
+#   - subscriptions/stream?properties=<device_id>.<path>,...: a server-sent
+#     events stream of the changes of those properties, one per event.
+# A change is a json object with the device_id, the path, the value, the
+# timestamp and the tid of the property.
+#
+import asyncio
+import json
+import time
+from dataclasses import dataclass, field
+from typing import (
+    AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple)
+from urllib.parse import urlencode
+
+from .batch import DEFAULT_MAX_CONCURRENCY, arun_batch
+from .concurrency import AdaptiveConcurrency
+from .data.device_config import PropertyInfo
+from .message_format import invalid_response_format
+from .transports import PushChannel
+
+# Modes of the subscriptions
+SUBSCRIBE_AUTO = "auto"
+SUBSCRIBE_WEBSOCKET = "websocket"
+SUBSCRIBE_SSE = "sse"
+SUBSCRIBE_POLLING = "polling"
+SUBSCRIBE_MODES = (SUBSCRIBE_AUTO, SUBSCRIBE_WEBSOCKET, SUBSCRIBE_SSE,
+                   SUBSCRIBE_POLLING)
+# The push modes tried, in order, by the auto mode
+_PUSH_MODES = (SUBSCRIBE_WEBSOCKET, SUBSCRIBE_SSE)
+
+WEBSOCKET_PATH = "subscriptions/ws"
+EVENT_STREAM_PATH = "subscriptions/stream"
+
+# (device_id, property path)
+PropertyKey = Tuple[str, str]
+
+
+@dataclass
+class PropertyChange:
+    """A new value of a subscribed property."""
+    device_id: str
+    path: str
+    info: PropertyInfo
+    # How the value was received: "websocket", "sse" or "polling"
+    source: str
+
+
+@dataclass
+class SubscriptionStats:
+    # The mode in use: "websocket", "sse" or "polling"
+    mode: Optional[str] = None
+    changes: int = 0
+    # Values received that were not newer than the last ones yielded for
+    # their property, e.g. unchanged values between two polls
+    duplicates: int = 0
+    polls: int = 0
+    # Push channels reopened after being lost
+    reconnects: int = 0
+    # Push modes given up, as not offered by the WebProxy or the transport
+    fallbacks: List[str] = field(default_factory=list)
+    # Failed polls of a device and failures of the push channels
+    errors: int = 0
+    last_error: Optional[str] = None
+
+
+def check_subscribe_mode(mode: str) -> str:
+    if mode not in SUBSCRIBE_MODES:
+        raise ValueError(f"Unknown subscription mode '{mode}': supported "
+                         f"modes are {', '.join(SUBSCRIBE_MODES)}.")
+    return mode
+
+
+def event_stream_url(base_url: str, keys: Iterable[PropertyKey]) -> str:
+    """The URL of the server-sent events stream of the changes of some
+    properties - base_url ending with a path separator."""
+    query = urlencode({"properties": ",".join(
+        f"{device_id}.{path}" for device_id, path in keys)})
+    return f"{base_url}{EVENT_STREAM_PATH}?{query}"
+
+
+def subscribe_message(keys: Iterable[PropertyKey]) -> str:
+    """The message subscribing a websocket to the changes of some
+    properties."""
+    return json.dumps({"subscribe": [list(key) for key in keys]})
+
+
+def parse_change(message: str) -> Tuple[PropertyKey, PropertyInfo]:
+    """The property and the value of a change pushed by the WebProxy.
+
+    Raises:
+    RuntimeError if the message is not a change.
+    """
+    try:
+        data = json.loads(message)
+        return ((data["device_id"], data["path"]),
+                PropertyInfo(value=data["value"],
+                             timestamp=data["timestamp"], tid=data["tid"]))
+    except (ValueError, KeyError, TypeError) as e:
+        raise RuntimeError(invalid_response_format(str(e)))
+
+
+class Subscription:
+    """Asynchronous iterator of the changes of the values of device
+    properties, returned by AsyncKaraboProxy.subscribe.
+
+    The current value of each property is yielded first, then its changes.
+    A value is only yielded if it is newer than the last one yielded for
+    its property: a different value, timestamp or tid, not older.
+
+    In the auto mode, a websocket is opened or, if the WebProxy or the
+    transport doesn't offer it, a server-sent events stream; without either,
+    the properties are polled, grouping the reads per device. A push channel
+    that is lost is reopened after reconnect_delay seconds - the properties
+    are read again then, to catch up with the changes missed in between -
+    and, if it can't be reopened, the next mode is used.
+
+    Parameters:
+    keys(Iterable[Tuple[str, str]]): the (device_id, property path) pairs
+    subscribed to.
+
+    open_channel(Callable): opens the push channel of a mode, subscribed
+    to the keys.
+
+    read(Callable): reads properties of a device, given the device_id and
+    the paths.
+
+    mode(str): "auto", "websocket", "sse" or "polling". The push modes fall
+    back to polling.
+
+    poll_interval(float): the period of the polls, in seconds.
+
+    reconnect_delay(float): the pause before reopening a push channel, in
+    seconds.
+
+    max_concurrency(int): the maximum number of devices read concurrently.
+
+    limiter(AdaptiveConcurrency): adapts the number of devices read
+    concurrently, if given.
+
+    Raises:
+    RuntimeError, when iterating, if the WebProxy pushes an invalid change.
+    """
+
+    def __init__(
+            self, keys: Iterable[PropertyKey],
+            open_channel: Callable[[str], Awaitable[PushChannel]],
+            read: Callable[[str, List[str]],
+                           Awaitable[Dict[str, PropertyInfo]]],
+            mode: str = SUBSCRIBE_AUTO, poll_interval: float = 1.0,
+            reconnect_delay: float = 1.0,
+            max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+            limiter: Optional[AdaptiveConcurrency] = None):
+        self.keys = list(dict.fromkeys(keys))
+        self.mode = check_subscribe_mode(mode)
+        self.poll_interval = poll_interval
+        self.reconnect_delay = reconnect_delay
+        self.max_concurrency = max_concurrency
+        self.stats = SubscriptionStats()
+        self._open_channel = open_channel
+        self._read = read
+        self._limiter = limiter
+        self._paths: Dict[str, List[str]] = {}
+        for device_id, path in self.keys:
+            self._paths.setdefault(device_id, []).append(path)
+        self._last: Dict[PropertyKey, Optional[PropertyInfo]] = dict.fromkeys(
+            self.keys)
+        self._changes = self._run()
+
+    def __aiter__(self) -> "Subscription":
+        return self
+
+    async def __anext__(self) -> PropertyChange:
+        return await self._changes.__anext__()
+
+    async def __aenter__(self) -> "Subscription":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """Closes the push channel, if any, and ends the iteration."""
+        await self._changes.aclose()
+
+    async def _run(self) -> AsyncIterator[PropertyChange]:
+        if self.mode == SUBSCRIBE_AUTO:
+            modes = list(_PUSH_MODES)
+        elif self.mode == SUBSCRIBE_POLLING:
+            modes = []
+        else:
+            modes = [self.mode]
+        while modes:
+            channel = await self._open(modes[0])
+            if channel is None:
+                self.stats.fallbacks.append(modes.pop(0))
+                continue
+            self.stats.mode = modes[0]
+            try:
+                # Read once the channel is open, so no change is missed
+                for change in await self._poll():
+                    yield change
+                message = await self._receive(channel)
+                while message is not None:
+                    key, info = parse_change(message)
+                    change = self._change(key, info, modes[0])
+                    if change is not None:
+                        yield change
+                    message = await self._receive(channel)
+            finally:
+                await channel.close()
+            self.stats.reconnects += 1
+            await asyncio.sleep(self.reconnect_delay)
+
+        self.stats.mode = SUBSCRIBE_POLLING
+        next_poll = time.monotonic()
+        while True:
+            for change in await self._poll():
+                yield change
+            # Polls missed while the changes were consumed are skipped
+            next_poll = max(next_poll + self.poll_interval, time.monotonic())
+            await asyncio.sleep(next_poll - time.monotonic())
+
+    async def _open(self, mode: str) -> Optional[PushChannel]:
+        try:
+            return await self._open_channel(mode)
+        except NotImplementedError:
+            return None
+        except (RuntimeError, OSError) as e:
+            self._error(e)
+            return None
+
+    async def _receive(self, channel: PushChannel) -> Optional[str]:
+        """The next message of a channel, None if it was closed or lost."""
+        try:
+            return await channel.receive()
+        except OSError as e:
+            self._error(e)
+            return None
+
+    async def _poll(self) -> List[PropertyChange]:
+        """Reads all the properties and returns the changed ones."""
+        async def read(device_id: str) -> Dict[str, PropertyInfo]:
+            return await self._read(device_id, self._paths[device_id])
+
+        results = await arun_batch(self._paths, read, self.max_concurrency,
+                                   limiter=self._limiter)
+        self.stats.polls += 1
+        changes = []
+        for device_id, result in results.items():
+            if isinstance(result, Exception):
+                self._error(result)
+                continue
+            for path, info in result.items():
+                change = self._change((device_id, path), info,
+                                      SUBSCRIBE_POLLING)
+                if change is not None:
+                    changes.append(change)
+        return changes
+
+    def _change(self, key: PropertyKey, info: PropertyInfo,
+                source: str) -> Optional[PropertyChange]:
+        if key not in self._last:
+            # Not subscribed to
+            return None
+        last = self._last[key]
+        if last is not None and (info == last
+                                 or info.timestamp < last.timestamp):
+            self.stats.duplicates += 1
+            return None
+        self._last[key] = info
+        self.stats.changes += 1
+        return PropertyChange(key[0], key[1], info, source)
+
+    def _error(self, error: Exception):
+        self.stats.errors += 1
+        self.stats.last_error = str(error)
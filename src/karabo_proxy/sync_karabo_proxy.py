@@ -1,104 +1,314 @@
-from dataclasses import asdict
-from typing import Any, Dict, Optional
-
-import requests
-
-from .data.device_config import DeviceConfigInfo, PropertyInfo, PropertyValue
+import dataclasses
+import json
+import time
+from typing import (
+    Any, Callable, Dict, Iterable, Iterator, Mapping, Optional, Tuple, Union)
+
+from .alignment import AlignedFrame, PropertyKey, laggards
+from .batch import (
+    DEFAULT_MAX_CONCURRENCY, KeyedLock, injected_values, iter_batch, run_batch,
+    write_responses)
+from .data.device_config import (
+    DeviceConfigInfo, InjectedPropertyValues, PropertyInfo, PropertyValue)
 from .data.topology import DevicesInfo, TopologyInfo
 from .data.web_proxy_responses import WriteResponse
+from .decoding import (
+    DECODING_COMPACT, DECODING_DICT, DECODING_LAZY, KeyLayouts,
+    LazyDeviceConfig, LazySchema, check_decoding, compact_configuration)
+from .encoding import EncodedPayload, encode_json
 from .message_format import (
     error_401_put, error_403_put, error_422_put, error_on_operation,
-    invalid_response_format)
+    error_timeout, injected_property_exists, invalid_response_format)
+from .property_cache import PropertyCache
+from .rate_limit import RateLimiter, RateLimits, RateLimitStats
+from .read_planner import PATHS, ReadPlanner, ReadPlannerStats, properties_of
+from .schema_cache import DEVICES_INFO_TTL, SchemaCache, schema_cache_key
+from .snapshot import (
+    ConfigurationSnapshot, restore_changes, snapshot_values,
+    writable_properties)
+from .tracing import Tracer, instrument
+from .transports import (
+    SyncTransport, TimeoutArg, TransportResponse, WarmUpMetrics, as_timeout,
+    create_sync_transport)
 
 
 class SyncKaraboProxy:
 
-    def __init__(self, base_url: str):
+    def __init__(self, base_url: str,
+                 schema_cache: Optional[SchemaCache] = None,
+                 transport: Union[str, SyncTransport, None] = None,
+                 timeout: TimeoutArg = None,
+                 property_cache: Optional[PropertyCache] = None,
+                 tracer: Optional[Tracer] = None,
+                 rate_limits: Optional[RateLimits] = None,
+                 decoding: str = DECODING_DICT,
+                 read_planner: Optional[ReadPlanner] = None):
+        """Parameters:
+        base_url(str): the URL of the WebProxy instance.
+
+        schema_cache(SchemaCache): optional on-disk cache for the schemas
+        retrieved by get_device_schema.
+
+        transport(str or SyncTransport): the HTTP transport to use, either
+        an instance or the name of a backend - "requests" (default),
+        "httpx", "urllib3" or "http2" (httpx over HTTP/2 with fallback to
+        HTTP/1.1). The backend library is only imported when needed.
+
+        timeout(Timeout or float): the default timeouts of the requests -
+        a Timeout with total, connect and read timeouts or the total timeout
+        in seconds. Every method accepts a timeout argument overriding the
+        default for that call. A request that times out raises TimeoutError.
+        Without any timeout, the defaults of the backend apply.
+
+        property_cache(PropertyCache): optional in-memory cache serving
+        repeated get_device_config_path reads within a staleness bound.
+
+        tracer(Tracer): records spans of the operations of the client and of
+        their phases, saved to a Chrome trace file when the client is
+        closed. Without a tracer, tracing has no overhead.
+
+        rate_limits(RateLimits): token bucket limits of the rates of the
+        reads, writes, slot executions and injected property operations.
+        Requests exceeding their limit wait for their turn or, in reject
+        mode, raise RateLimitExceeded.
+
+        decoding(str): how device configurations are decoded - "dict"
+        (default), "compact", which stores the property names once for
+        all the devices of a class and only the values, timestamps and tids
+        per device, or "lazy", which returns views of the responses - for
+        schemas too - decoding a property when it is first accessed. See
+        karabo_proxy.decoding.
+
+        read_planner(ReadPlanner): chooses how get_device_properties reads
+        several properties from the latencies of the past reads; a default
+        planner is used if not given.
+        """
         self.base_url = base_url
+        self._schema_cache = schema_cache
+        self._property_cache = property_cache
+        self._rate_limiter = None
+        if rate_limits is not None:
+            self._rate_limiter = RateLimiter(rate_limits)
+        self._decoding = check_decoding(decoding)
+        self._read_planner = read_planner or ReadPlanner()
+        self._key_layouts = KeyLayouts()
+        self._devices_info: Dict[str, Dict[str, Any]] = {}
+        self._devices_info_time: Optional[float] = None
+        self._timeout = as_timeout(timeout)
+        self._device_locks = KeyedLock()
+        self._transport = create_sync_transport(transport)
         self._headers = {
             "content-type": "application/json"}
         if not self.base_url.endswith("/"):
             # ensures the base_url ends with a path separator; this will be
             # assumed throughout the class
             self.base_url = f"{self.base_url}/"
+        self._tracer = tracer
+        if tracer is not None:
+            self._transport.tracer = tracer
+            instrument(self, tracer)
+
+    def __enter__(self) -> "SyncKaraboProxy":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Closes the connections kept alive by the client - and saves
+        its trace, if any."""
+        self._transport.close()
+        if self._tracer is not None:
+            self._tracer.save()
+
+    def warm_up(self, connections: int = 4,
+                timeout: TimeoutArg = None) -> WarmUpMetrics:
+        """Opens keep-alive connections to the WebProxy - resolving its host
+        name - ahead of the first requests, with as many concurrent HEAD
+        requests. The connections kept are limited by the connection pool of
+        the transport.
+
+        Returns:
+        WarmUpMetrics: the connections opened and the time it took.
+        """
+        def open_connection(_: int) -> float:
+            start = time.monotonic()
+            self._request("HEAD", self.base_url, None, "warming up", timeout)
+            return time.monotonic() - start
+
+        metrics = WarmUpMetrics()
+        start = time.monotonic()
+        results = run_batch(range(connections), open_connection,
+                            connections)
+        metrics.elapsed = time.monotonic() - start
+        for result in results.values():
+            if isinstance(result, Exception):
+                metrics.errors.append(str(result))
+            else:
+                metrics.latencies.append(result)
+        metrics.latencies.sort()
+        metrics.connections = len(metrics.latencies)
+        return metrics
+
+    @property
+    def read_planner_stats(self) -> ReadPlannerStats:
+        """The strategies chosen for the reads of several properties, and
+        the last plan."""
+        return self._read_planner.stats
+
+    @property
+    def rate_limit_stats(self) -> Dict[str, RateLimitStats]:
+        """The calls and wait times per rate limited category of
+        requests."""
+        if self._rate_limiter is None:
+            return {}
+        return self._rate_limiter.stats
 
     def set_access_token(self, access_token: str):
         self._headers["Authorization"] = f"Bearer {access_token}"
 
-    def get_topology(self) -> TopologyInfo:
+    def get_topology(
+            self, timeout: TimeoutArg = None) -> TopologyInfo:
         """Retrieves the topology of the topic containing the connected
         WebProxy."""
-        resp = requests.get(f"{self.base_url}topology.json",
-                            headers=self._headers)
-        data = self._handle_get_response(resp, "gettting topology")
+        data = self._get(f"{self.base_url}topology.json",
+                         "gettting topology", timeout)
         try:
             topology_info = TopologyInfo(**data)
             return topology_info
         except TypeError as te:
             raise RuntimeError(invalid_response_format(str(te)))
 
-    def get_devices(self) -> DevicesInfo:
+    def get_devices(
+            self, timeout: TimeoutArg = None) -> DevicesInfo:
         """Retrieves the devices in the topic containing the connected
         WebProxy."""
-        resp = requests.get(f"{self.base_url}devices.json",
-                            headers=self._headers)
-        data = self._handle_get_response(resp, "gettting devices")
+        data = self._get(f"{self.base_url}devices.json",
+                         "gettting devices", timeout)
         try:
             devices_info = DevicesInfo(**data)
             return devices_info
         except TypeError as te:
             raise RuntimeError(invalid_response_format(str(te)))
 
-    def get_device_configuration(self, device_id: str) -> DeviceConfigInfo:
+    def get_device_configuration(
+            self, device_id: str,
+            timeout: TimeoutArg = None) -> DeviceConfigInfo:
         """Retrieves the configuration of a specified device."""
-        resp = requests.get(
-            f"{self.base_url}devices/{device_id}/config.json",
-            headers=self._headers)
-        data = self._handle_get_response(resp, "getting device configuration")
-        try:
-            device_config = dict(**data)
-            return device_config
-        except TypeError as te:
-            raise RuntimeError(invalid_response_format(str(te)))
+        start = time.monotonic()
+        if self._decoding == DECODING_LAZY:
+            device_config = self._get(
+                f"{self.base_url}devices/{device_id}/config.json",
+                "getting device configuration", timeout,
+                LazyDeviceConfig.decode)
+        else:
+            data = self._get(
+                f"{self.base_url}devices/{device_id}/config.json",
+                "getting device configuration", timeout)
+            if self._decoding == DECODING_COMPACT:
+                device_config = compact_configuration(data,
+                                                      self._key_layouts)
+            else:
+                try:
+                    device_config = dict(**data)
+                except TypeError as te:
+                    raise RuntimeError(invalid_response_format(str(te)))
+        self._read_planner.observe_full(
+            device_id, time.monotonic() - start, len(device_config))
+        return device_config
 
     def set_device_configuration(
             self, device_id: str,
-            properties: Dict[str, PropertyValue]) -> WriteResponse:
+            properties: Union[Dict[str, PropertyValue], EncodedPayload],
+            timeout: TimeoutArg = None) -> WriteResponse:
         """Sets a given set of properties of a specified device (if the
-        device is reconfigurable)"""
-        resp = requests.put(
-            f"{self.base_url}devices/{device_id}/config.json",
-            json=properties, headers=self._headers)
-        return self._handle_write_response(
-            resp, "set configuration", device_id)
+        device is reconfigurable). Vector values may be NumPy arrays; an
+        EncodedPayload of the properties is sent as is."""
+        try:
+            return self._write(
+                "PUT", f"{self.base_url}devices/{device_id}/config.json",
+                properties, "set configuration", device_id, timeout)
+        finally:
+            if self._property_cache is not None:
+                if isinstance(properties, dict):
+                    for property_name in properties:
+                        self._property_cache.invalidate(device_id,
+                                                        property_name)
+                else:
+                    self._property_cache.invalidate(device_id)
 
     def get_device_config_path(
-            self, device_id: str, property_name: str) -> PropertyInfo:
+            self, device_id: str, property_name: str,
+            timeout: TimeoutArg = None,
+            max_age: Optional[float] = None) -> PropertyInfo:
         """Retrieves the value and time attributes of a specified device
-        property."""
-        resp = requests.get(f"{self.base_url}devices/"
-                            f"{device_id}.{property_name}/config.json",
-                            headers=self._headers)
-        data = self._handle_get_response(resp, "getting device property")
+        property.
+
+        If the client has a property cache, a value retrieved at most
+        max_age seconds ago - by default the max_age of the cache - is
+        returned from the cache.
+        """
+        cache = self._property_cache
+        if cache is not None:
+            cached = cache.get((device_id, property_name), max_age)
+            if cached is not None:
+                return cached
+            generation = cache.generation()
+        start = time.monotonic()
+        data = self._get(
+            f"{self.base_url}devices/{device_id}.{property_name}/config.json",
+            "getting device property", timeout)
+        self._read_planner.observe_path(time.monotonic() - start)
         try:
             property_info = PropertyInfo(**data)
-            return property_info
         except TypeError as te:
             raise RuntimeError(invalid_response_format(str(te)))
+        if cache is not None:
+            cache.put((device_id, property_name), property_info, generation,
+                      start)
+        return property_info
+
+    def get_device_properties(
+            self, device_id: str, property_names: Iterable[str],
+            timeout: TimeoutArg = None) -> Dict[str, PropertyInfo]:
+        """Retrieves the values and time attributes of several properties of
+        a device, either with a request per property or with a single
+        request for the whole configuration - whichever the read planner of
+        the client predicts to be cheaper.
+
+        Raises:
+        RuntimeError if a property is not in the configuration of the
+        device.
+        """
+        property_names = list(dict.fromkeys(property_names))
+        plan = self._read_planner.plan(device_id, len(property_names))
+        if plan.strategy == PATHS:
+            return {name: self.get_device_config_path(device_id, name,
+                                                      timeout, max_age=0)
+                    for name in property_names}
+        config = self.get_device_configuration(device_id, timeout)
+        return properties_of(device_id, config, property_names)
 
     def set_device_config_path(
             self, device_id: str, property_name: str,
-            property_value: PropertyValue) -> WriteResponse:
+            property_value: Union[PropertyValue, EncodedPayload],
+            timeout: TimeoutArg = None) -> WriteResponse:
         """Sets a property of a specified device (if the device is
-        reconfigurable)."""
-        resp = requests.put(f"{self.base_url}devices/"
-                            f"{device_id}.{property_name}/config.json",
-                            json=property_value, headers=self._headers)
-        return self._handle_write_response(
-            resp, "set property", f"{device_id}.{property_name}")
+        reconfigurable). A vector value may be a NumPy array; an
+        EncodedPayload of the value is sent as is."""
+        url = (f"{self.base_url}devices/{device_id}.{property_name}"
+               "/config.json")
+        try:
+            return self._write(
+                "PUT", url, property_value, "set property",
+                f"{device_id}.{property_name}", timeout)
+        finally:
+            if self._property_cache is not None:
+                self._property_cache.invalidate(device_id, property_name)
 
     def get_device_schema(
-            self, device_id: str) -> Dict[str, Dict[str, Any]]:
+            self, device_id: str,
+            timeout: TimeoutArg = None) -> Dict[str, Dict[str, Any]]:
         """Retrieves the schema of a specified device.
 
         Parameters:
@@ -122,35 +332,81 @@ class SyncKaraboProxy:
             }
          ...
         }
+
+        If the client has a schema cache, the schema is looked up in the
+        cache first and, on a cache hit, returned as a read-only mapping with
+        the same structure.
+
+        With lazy decoding, the schema is returned as a read-only LazySchema
+        mapping decoding the attributes of a property when first accessed.
         """
-        resp = requests.get(
-            f"{self.base_url}devices/{device_id}/schema.json",
-            headers=self._headers)
-        data = self._handle_get_response(resp, "getting device schema")
-        try:
-            schema = dict(**data)
-            return schema
-        except TypeError as te:
-            raise RuntimeError(invalid_response_format(str(te)))
+        cache_key = None
+        if self._schema_cache is not None:
+            cache_key = self._get_schema_cache_key(device_id, timeout)
+            if cache_key is not None:
+                cached_schema = self._schema_cache.get(*cache_key)
+                if cached_schema is not None:
+                    self._read_planner.observe_size(device_id,
+                                                    len(cached_schema))
+                    return cached_schema
+        if self._decoding == DECODING_LAZY:
+            schema = self._get(
+                f"{self.base_url}devices/{device_id}/schema.json",
+                "getting device schema", timeout, LazySchema.decode)
+        else:
+            data = self._get(
+                f"{self.base_url}devices/{device_id}/schema.json",
+                "getting device schema", timeout)
+            try:
+                schema = dict(**data)
+            except TypeError as te:
+                raise RuntimeError(invalid_response_format(str(te)))
+        if cache_key is not None:
+            self._schema_cache.put(*cache_key, schema)
+        self._read_planner.observe_size(device_id, len(schema))
+        return schema
+
+    def _get_schema_cache_key(
+            self, device_id: str,
+            timeout: TimeoutArg = None) -> Optional[Tuple[str, str]]:
+        """Returns the key of the schema of a device in the schema cache. The
+        devices' instance info is fetched once and reused for up to
+        DEVICES_INFO_TTL seconds - also for devices missing from it, whose
+        schemas are not cached until it is fetched again."""
+        now = time.monotonic()
+        if (self._devices_info_time is None
+                or now - self._devices_info_time > DEVICES_INFO_TTL):
+            self._devices_info = self.get_devices(timeout).devices
+            self._devices_info_time = now
+        instance_info = self._devices_info.get(device_id)
+        if instance_info is None:
+            return None
+        return schema_cache_key(instance_info)
 
     def execute_slot(
         self, device_id: str, slot_name: str,
             slot_params: Optional[
-                Dict[str, PropertyValue]] = None) -> WriteResponse:
+                Dict[str, PropertyValue]] = None,
+            timeout: TimeoutArg = None) -> WriteResponse:
         """Executes a device slot. Supports both parameterless slots (commands)
         and slots with parameters. The results of the slot execution (if any)
         will be available as a dictionary in the field 'reply' of the response
         """
-        resp = requests.put(
-            f"{self.base_url}devices/{device_id}/slot/{slot_name}.json",
-            json=slot_params, headers=self._headers)
-        return self._handle_write_response(
-            resp, f"execute slot {slot_name}", device_id)
+        try:
+            return self._write(
+                "PUT",
+                f"{self.base_url}devices/{device_id}/slot/{slot_name}.json",
+                slot_params, f"execute slot {slot_name}", device_id, timeout)
+        finally:
+            # A slot may change any property of its device
+            if self._property_cache is not None:
+                self._property_cache.invalidate(device_id)
 
 # region Injected Property endpoints
 
     def add_injected_property(
-            self, property_name: str, property_type: str) -> WriteResponse:
+            self, property_name: str, property_type: str,
+            timeout: TimeoutArg = None) -> WriteResponse:
         """Adds a property to the set of injected properties of the WebProxy
         instance.
 
@@ -171,14 +427,14 @@ class SyncKaraboProxy:
         RuntimeError if the property name is invalid, the property type is not
         supported or the user is not authorized for the operation.
         """
-        resp = requests.post(
-            f"{self.base_url}property/{property_name}/config.json",
-            json={"valueType": property_type}, headers=self._headers)
-        return self._handle_write_response(
-            resp, "inject property", property_name)
+        return self._write(
+            "POST", f"{self.base_url}property/{property_name}/config.json",
+            {"valueType": property_type}, "inject property", property_name,
+            timeout)
 
     def get_injected_property(
-            self, property_name: str) -> PropertyInfo:
+            self, property_name: str,
+            timeout: TimeoutArg = None) -> PropertyInfo:
         """Retrieves the value of a specified injected property.
 
         Parameters:
@@ -191,10 +447,9 @@ class SyncKaraboProxy:
         Raises:
         RuntimeError if property is not among the injected ones.
         """
-        resp = requests.get(f"{self.base_url}property/"
-                            f"{property_name}/config.json")
-        data = self._handle_get_response(resp,
-                                         "getting injected property value")
+        data = self._get(
+            f"{self.base_url}property/{property_name}/config.json",
+            "getting injected property value", timeout)
         try:
             injected_property = PropertyInfo(**data)
             return injected_property
@@ -202,7 +457,9 @@ class SyncKaraboProxy:
             raise RuntimeError(invalid_response_format(str(te)))
 
     def set_injected_property(
-            self, property_name: str, property: PropertyInfo) -> WriteResponse:
+            self, property_name: str,
+            property: Union[PropertyInfo, EncodedPayload],
+            timeout: TimeoutArg = None) -> WriteResponse:
         """Sets the value and timing attributes of a property previously
         injected into the WebProxy instance.
 
@@ -210,7 +467,8 @@ class SyncKaraboProxy:
         property_name(str): the name of the injected property.
 
         property(PropertyInfo): the value and timing attributes to be set for
-        the injected property
+        the injected property. The value may be a NumPy array. An
+        EncodedPayload of a PropertyInfo is sent as is.
 
         Returns:
         WriteResponse: was the operation successful? If not, what was the
@@ -220,13 +478,14 @@ class SyncKaraboProxy:
         RuntimeError if the injected property was not found, the property type
         is not supported or the user is not authorized for the operation.
         """
-        resp = requests.put(
-            f"{self.base_url}property/{property_name}/config.json",
-            json=asdict(property), headers=self._headers)
-        return self._handle_write_response(resp, "set injected property value",
-                                           property_name)
-
-    def delete_injected_property(self, property_name: str) -> WriteResponse:
+        return self._write(
+            "PUT", f"{self.base_url}property/{property_name}/config.json",
+            property, "set injected property value", property_name,
+            timeout)
+
+    def delete_injected_property(
+            self, property_name: str,
+            timeout: TimeoutArg = None) -> WriteResponse:
         """Removes the specified property from the set of properties injected
         into the WebProxy instance.
 
@@ -241,24 +500,386 @@ class SyncKaraboProxy:
         RuntimeError if the injected property was not found, or the user is
         not authorized for the operation.
         """
-        resp = requests.delete(
-            f"{self.base_url}property/{property_name}/config.json",
-            headers=self._headers)
+        return self._write(
+            "DELETE", f"{self.base_url}property/{property_name}/config.json",
+            None, "delete injected property", property_name, timeout)
+
+    def add_injected_properties(
+            self, properties: Mapping[str, str], ensure: bool = False,
+            max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+            deadline: Optional[float] = None, timeout: TimeoutArg = None
+    ) -> Dict[str, WriteResponse]:
+        """Adds several properties to the set of injected properties of the
+        WebProxy instance concurrently.
+
+        Parameters:
+        properties(Mapping[str, str]): the types of the properties to add by
+        name - see add_injected_property.
+
+        ensure(bool): skips the properties already injected, reported as
+        successful, so that adding the properties is idempotent. Costs a read
+        of each property; the type of the existing properties isn't checked.
+        Only a property the WebProxy reports as not found is added: the
+        properties whose read fails otherwise - e.g. times out or isn't
+        authorized - are reported as unsuccessful.
+
+        max_concurrency(int): the maximum number of properties being added
+        at any time.
+
+        deadline(float): the maximum duration of the whole operation, in
+        seconds. The properties not added by then are reported as
+        unsuccessful responses.
+
+        timeout(Timeout or float): the timeouts of each request.
+
+        Returns:
+        Dict[str, WriteResponse]: the results by property name. Errors are
+        reported as unsuccessful responses.
+        """
+        def add(property_name: str) -> WriteResponse:
+            if ensure and self._is_injected(property_name, timeout):
+                return WriteResponse(
+                    success=True,
+                    reason=injected_property_exists(property_name))
+            return self.add_injected_property(
+                property_name, properties[property_name], timeout)
+
+        return self._write_injected_properties(
+            properties, add, max_concurrency, deadline)
+
+    def get_injected_properties(
+            self, property_names: Iterable[str],
+            max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+            deadline: Optional[float] = None, timeout: TimeoutArg = None
+    ) -> InjectedPropertyValues:
+        """Retrieves the values of several injected properties concurrently.
+
+        Parameters are the ones of add_injected_properties.
+
+        Returns:
+        InjectedPropertyValues: the values by property name and the reasons
+        of the properties that could not be read.
+        """
+        def get(property_name: str) -> PropertyInfo:
+            return self.get_injected_property(property_name, timeout)
+
+        results = run_batch(dict.fromkeys(property_names), get,
+                            max_concurrency, deadline)
+        return injected_values(results)
+
+    def set_injected_properties(
+            self, properties: Mapping[str, Union[PropertyInfo,
+                                                 EncodedPayload]],
+            max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+            deadline: Optional[float] = None, timeout: TimeoutArg = None
+    ) -> Dict[str, WriteResponse]:
+        """Sets the values and timing attributes of several injected
+        properties concurrently.
+
+        Parameters:
+        properties(Mapping[str, PropertyInfo]): the values to set by property
+        name - see set_injected_property.
 
-        return self._handle_write_response(resp, "delete injected property",
-                                           property_name)
+        The other parameters and the results are the ones of
+        add_injected_properties.
+        """
+        def set_property(property_name: str) -> WriteResponse:
+            return self.set_injected_property(
+                property_name, properties[property_name], timeout)
+
+        return self._write_injected_properties(
+            properties, set_property, max_concurrency, deadline)
+
+    def delete_injected_properties(
+            self, property_names: Iterable[str],
+            max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+            deadline: Optional[float] = None, timeout: TimeoutArg = None
+    ) -> Dict[str, WriteResponse]:
+        """Removes several injected properties concurrently. The parameters
+        and the results are the ones of add_injected_properties."""
+        def delete(property_name: str) -> WriteResponse:
+            return self.delete_injected_property(property_name, timeout)
+
+        return self._write_injected_properties(
+            property_names, delete, max_concurrency, deadline)
+
+    def _write_injected_properties(
+            self, property_names: Iterable[str],
+            write: Callable[[str], WriteResponse],
+            max_concurrency: int,
+            deadline: Optional[float]) -> Dict[str, WriteResponse]:
+        results = run_batch(dict.fromkeys(property_names), write,
+                            max_concurrency, deadline)
+        return write_responses(results)
 
 # endregion
 
-    def _handle_get_response(self,
-                             resp: requests.Response,
-                             operation_name: str) -> Dict[str, Any]:
+# region Batch operations
+
+    def get_configuration_snapshot(
+            self, device_ids: Iterable[str],
+            max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+            deadline: Optional[float] = None, timeout: TimeoutArg = None
+    ) -> ConfigurationSnapshot:
+        """Captures the configurations of a set of devices, retrieved
+        concurrently.
+
+        Parameters:
+        device_ids(Iterable[str]): the devices to capture.
+
+        max_concurrency(int): the maximum number of configurations being
+        retrieved at any time.
+
+        deadline(float): the maximum duration of the whole operation, in
+        seconds. The configurations not retrieved by then are
+        reported as errors of the snapshot.
+
+        timeout(Timeout or float): the timeouts of each request.
+
+        Returns:
+        ConfigurationSnapshot: the property values of the devices. Devices
+        whose configuration could not be retrieved are in the errors of the
+        snapshot.
+        """
+        def get_configuration(device_id: str) -> DeviceConfigInfo:
+            return self.get_device_configuration(device_id, timeout)
+
+        snapshot = ConfigurationSnapshot(configurations={})
+        results = run_batch(device_ids, get_configuration, max_concurrency,
+                            deadline)
+        for device_id, result in results.items():
+            if isinstance(result, Exception):
+                snapshot.errors[device_id] = str(result)
+            else:
+                snapshot.configurations[device_id] = snapshot_values(result)
+        return snapshot
+
+    def restore_configuration_snapshot(
+            self, snapshot: ConfigurationSnapshot,
+            max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+            deadline: Optional[float] = None, timeout: TimeoutArg = None
+    ) -> Dict[str, WriteResponse]:
+        """Restores the configurations of the devices in a snapshot.
+
+        Only the reconfigurable properties whose live values differ from the
+        snapshot are written, in a single request per device.
+
+        Parameters:
+        snapshot(ConfigurationSnapshot): the configurations to restore.
+
+        max_concurrency(int): the maximum number of devices being restored
+        at any time.
+
+        deadline(float): the maximum duration of the whole operation, in
+        seconds. The devices not restored by then are reported
+        as unsuccessful writes.
+
+        timeout(Timeout or float): the timeouts of each request.
+
+        Returns:
+        Dict[str, WriteResponse]: the results of the writes by device id.
+        Devices whose live configuration already matches the snapshot are not
+        included.
+        """
+        def restore_device(device_id: str) -> Optional[WriteResponse]:
+            live_config = self.get_device_configuration(device_id, timeout)
+            schema = self.get_device_schema(device_id, timeout)
+            changes = restore_changes(snapshot.configurations[device_id],
+                                      snapshot_values(live_config),
+                                      writable_properties(schema))
+            if not changes:
+                return None
+            return self.set_device_configuration(device_id, changes,
+                                                 timeout)
+
+        results = {}
+        restored = run_batch(snapshot.configurations, restore_device,
+                             max_concurrency, deadline)
+        for device_id, result in restored.items():
+            if isinstance(result, Exception):
+                results[device_id] = WriteResponse(success=False,
+                                                   reason=str(result))
+            elif result is not None:
+                results[device_id] = result
+        return results
+
+    def execute_slots(
+            self, device_ids: Iterable[str], slot_name: str,
+            slot_params: Optional[Dict[str, PropertyValue]] = None,
+            max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+            deadline: Optional[float] = None, timeout: TimeoutArg = None
+    ) -> Dict[str, WriteResponse]:
+        """Executes the same slot on several devices concurrently.
+
+        Parameters:
+        device_ids(Iterable[str]): the devices whose slot should be executed.
 
-        if resp.status_code == 200:
+        slot_name(str): the slot to execute.
+
+        slot_params(dict): the parameters of the slot, if any.
+
+        max_concurrency(int): the maximum number of slot executions in flight
+        at any time. No device ever has more than one slot execution of a
+        batch operation of this client in flight.
+
+        deadline(float): the maximum duration of the whole operation, in
+        seconds. The slot executions not completed by then are
+        reported as unsuccessful responses.
+
+        timeout(Timeout or float): the timeouts of each request.
+
+        Returns:
+        Dict[str, WriteResponse]: the results of the slot executions, with
+        their replies, by device id. Errors reaching the WebProxy are reported
+        as unsuccessful responses.
+        """
+        device_ids = list(dict.fromkeys(device_ids))
+        results = dict(self.iter_execute_slots(
+            device_ids, slot_name, slot_params, max_concurrency, deadline,
+            timeout))
+        return {device_id: results[device_id] for device_id in device_ids}
+
+    def iter_execute_slots(
+            self, device_ids: Iterable[str], slot_name: str,
+            slot_params: Optional[Dict[str, PropertyValue]] = None,
+            max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+            deadline: Optional[float] = None, timeout: TimeoutArg = None
+    ) -> Iterator[Tuple[str, WriteResponse]]:
+        """Executes the same slot on several devices concurrently, like
+        execute_slots, yielding (device_id, WriteResponse) pairs as the slot
+        executions complete.
+        """
+        def execute(device_id: str) -> WriteResponse:
+            with self._device_locks.hold(device_id):
+                return self.execute_slot(device_id, slot_name, slot_params,
+                                         timeout)
+
+        for device_id, result in iter_batch(
+                dict.fromkeys(device_ids), execute, max_concurrency,
+                deadline):
+            if isinstance(result, Exception):
+                result = WriteResponse(success=False, reason=str(result))
+            yield device_id, result
+
+    def read_aligned(
+            self, keys: Iterable[PropertyKey], tolerance: int = 0,
+            deadline: float = 1.0, retry_interval: float = 0.05,
+            max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+            timeout: TimeoutArg = None) -> AlignedFrame:
+        """Reads several device properties concurrently and aligns them on
+        train id.
+
+        The properties behind the latest train read by more than the
+        tolerance are read again until all of them are aligned or the
+        deadline expires.
+
+        Parameters:
+        keys(Iterable[Tuple[str, str]]): the (device_id, property name) pairs
+        to read.
+
+        tolerance(int): the maximum difference, in trains, between the tids
+        of the values of an aligned frame.
+
+        deadline(float): the maximum duration of the read, in seconds.
+
+        retry_interval(float): the pause between two rounds of reads, in
+        seconds.
+
+        max_concurrency(int): the maximum number of reads in flight at any
+        time.
+
+        timeout(Timeout or float): the timeouts of each request.
+
+        Returns:
+        AlignedFrame: the latest values read, with their train, whether they
+        are aligned and the errors of the properties that could not be read.
+        """
+        def read(key: PropertyKey) -> PropertyInfo:
+            return self.get_device_config_path(*key, timeout=timeout,
+                                               max_age=0)
+
+        keys = list(dict.fromkeys(keys))
+        frame = AlignedFrame(tid=None)
+        end = time.monotonic() + deadline
+        to_read = keys
+        while to_read and time.monotonic() < end:
+            if frame.rounds:
+                # The deadline may pass between the check and the sleep
+                time.sleep(max(min(retry_interval, end - time.monotonic()),
+                               0.0))
+            frame.rounds += 1
+            results = run_batch(
+                to_read, read, max_concurrency, max(end - time.monotonic(), 0))
+            for key, result in results.items():
+                if isinstance(result, Exception):
+                    frame.errors[key] = str(result)
+                else:
+                    frame.values[key] = result
+                    frame.errors.pop(key, None)
+            to_read = laggards(frame, keys, tolerance)
+        return frame
+
+# endregion
+
+    def _is_injected(self, property_name: str,
+                     timeout: TimeoutArg = None) -> bool:
+        """Whether a property is among the injected ones. Only the not found
+        response of the WebProxy means it isn't: other errors are raised."""
+        operation_name = "getting injected property value"
+        resp = self._request(
+            "GET", f"{self.base_url}property/{property_name}/config.json",
+            None, operation_name, timeout)
+        if resp.status == 404:
+            return False
+        self._handle_get_response(resp, operation_name)
+        return True
+
+    def _get(self, url: str, operation_name: str,
+             timeout: TimeoutArg = None,
+             decode: Callable[[bytes], Any] = json.loads) -> Any:
+        """Sends a GET request and returns its json payload decoded by
+        decode."""
+        resp = self._request("GET", url, None, operation_name, timeout)
+        return self._handle_get_response(resp, operation_name, decode)
+
+    def _write(self, method: str, url: str, payload: Any,
+               operation_name: str, operand_id: str,
+               timeout: TimeoutArg = None) -> WriteResponse:
+        """Sends a write request - POST, PUT or DELETE - with an optional json
+        payload."""
+        body = None
+        if payload is not None:
+            body = encode_json(payload)
+        resp = self._request(method, url, body, operation_name, timeout)
+        return self._handle_write_response(resp, operation_name, operand_id)
+
+    def _request(self, method: str, url: str, body: Optional[bytes],
+                 operation_name: str,
+                 timeout: TimeoutArg) -> TransportResponse:
+        """Sends a request with the given or the default timeouts; the time
+        waiting for the rate limiter counts in the total timeout."""
+        timeout = as_timeout(timeout) or self._timeout
+        try:
+            if self._rate_limiter is not None:
+                total = None if timeout is None else timeout.total
+                waited = self._rate_limiter.acquire(
+                    method, url[len(self.base_url):], total)
+                if waited > 0.0 and total is not None:
+                    timeout = dataclasses.replace(timeout,
+                                                  total=total - waited)
+            return self._transport.request(method, url, self._headers, body,
+                                           timeout)
+        except TimeoutError as te:
+            raise TimeoutError(error_timeout(operation_name)) from te
+
+    def _handle_get_response(
+            self, resp: TransportResponse, operation_name: str,
+            decode: Callable[[bytes], Any] = json.loads) -> Any:
+        if resp.status == 200:
             try:
-                data = resp.json()
+                data = decode(resp.body)
                 return data
-            except requests.exceptions.JSONDecodeError as e:
+            except Exception as e:
                 raise RuntimeError(invalid_response_format(str(e)))
         else:
             # For some endpoints the WebProxy returns errors with a json
@@ -266,44 +887,44 @@ class SyncKaraboProxy:
             # to provide better information to the user
             reason = resp.reason
             try:
-                payload = resp.json()
+                payload = json.loads(resp.body)
                 if "detail" in payload:
                     reason = f"{reason} - {payload['detail']}"
             finally:
                 raise RuntimeError(error_on_operation(operation_name,
-                                                      resp.status_code,
+                                                      resp.status,
                                                       reason))
 
     def _handle_write_response(self,
-                               resp: requests.Response,
+                               resp: TransportResponse,
                                operation_name: str,
-                               device_id: str) -> WriteResponse:
+                               operand_id: str) -> WriteResponse:
         """Handles the response of a write operation - POST, PUT or DELETE
         HTTP verbs"""
-        if resp.status_code == 200:
+        if resp.status == 200:
             try:
-                data = resp.json()
+                data = json.loads(resp.body)
                 return WriteResponse(**data)
-            except requests.exceptions.JSONDecodeError as e:
+            except Exception as e:
                 return WriteResponse(success=False,
                                      reason=invalid_response_format(str(e)))
-        elif resp.status_code == 401:
+        elif resp.status == 401:
             return WriteResponse(
                 success=False,
-                reason=error_401_put(operation_name, device_id))
-        elif resp.status_code == 403:
+                reason=error_401_put(operation_name, operand_id))
+        elif resp.status == 403:
             return WriteResponse(
                 success=False,
-                reason=error_403_put(operation_name, device_id))
-        elif resp.status_code == 422:
+                reason=error_403_put(operation_name, operand_id))
+        elif resp.status == 422:
             return WriteResponse(
                 success=False,
-                reason=error_422_put(operation_name, device_id))
+                reason=error_422_put(operation_name, operand_id))
         else:
             return WriteResponse(
                 success=False,
                 reason=(error_on_operation(operation_name,
-                                           resp.status_code,
+                                           resp.status,
                                            resp.reason)))
 
 
@@ -0,0 +1,23 @@
+import os
+import subprocess
+from time import sleep
+
+import pytest
+
+
+@pytest.fixture(scope="session")
+def web_proxy_mocks():
+    mock_module_path = os.path.dirname(
+        os.path.abspath(os.path.dirname(__file__)))
+    proc_valid_mock = subprocess.Popen(
+        ["python", "-m", "tests.mock_web_proxy"],
+        cwd=mock_module_path)
+    proc_invalid_mock = subprocess.Popen(
+        ["python", "-m", "tests.mock_web_proxy", "--invalid"],
+        cwd=mock_module_path)
+    # The WebProxy mocks require some time to initialize and reach
+    # the point when they can start accepting requests.
+    sleep(3)
+    yield
+    proc_valid_mock.terminate()
+    proc_invalid_mock.terminate()
@@ -1,4 +1,7 @@
 import argparse
+import asyncio
+import json
+import time
 
 from aiohttp import web
 
@@ -29,7 +32,9 @@ TOPOLOGY_RESPONSE_INVALID = (
 DEVICES_RESPONSE_VALID = (
     '{'
     '  "devices": {'
-    '    "A_SIMPLE_DEVICE": {"__deviceId__": "A_SIMPLE_DEVICE"}'
+    '    "A_SIMPLE_DEVICE": {"__deviceId__": "A_SIMPLE_DEVICE", '
+    '                        "classId": "SimpleDevice", '
+    '                        "serverId": "A_SIMPLE_SERVER"}'
     '  }'
     '}')
 
@@ -45,7 +50,9 @@ DEVICE_GET_CONFIGURATION_VALID = (
     '  "_deviceId_":{"value":"Karabo_GuiServer_0", '
     '                "timestamp": 1719838221.5852, "tid": 0},'
     '  "deviceId":{"value":"Karabo_GuiServer_0", '
-    '              "timestamp": 1719838221.5852, "tid": 0}'
+    '              "timestamp": 1719838221.5852, "tid": 0},'
+    '  "heartbeatInterval":{"value": 20, '
+    '                       "timestamp": 1719838221.5852, "tid": 0}'
     '}')
 
 # the WebProxy returns a status code 500 with the following payload
@@ -66,12 +73,14 @@ DEVICE_GET_SCHEMA_VALID = (
     '  "_deviceId_": { '
     '     "displayedName": "_DeviceID_", '
     '     "description": "Do not set this property.", '
-    '     "requiredAccessLevel": "ADMIN" '
+    '     "requiredAccessLevel": "ADMIN", '
+    '     "accessMode": "INITONLY" '
     '  }, '
     '  "heartbeatInterval" :{ '
     '     "displayedName": "Heartbeat interval", '
     '     "description": "Interval in seconds between device heartbeats", '
-    '     "requiredAccessLevel": "ADMIN" '
+    '     "requiredAccessLevel": "ADMIN", '
+    '     "accessMode": "RECONFIGURABLE" '
     '  } '
     '}')
 
@@ -187,7 +196,19 @@ async def _handle_set_device_configuration_invalid(request):
         text=DEVICE_SET_CONFIGURATION_INVALID)
 
 
+# (device_id, property) -> number of reads of the "tid<step>" properties
+_TID_READS = {}
+
+
 async def _handle_get_config_path(request):
+    property_name = request.match_info["propertyName"]
+    if property_name.startswith("tid"):
+        # Property whose train id advances by <step> on every read
+        key = (request.match_info["device_id"], property_name)
+        _TID_READS[key] = _TID_READS.get(key, 0) + 1
+        return web.json_response({
+            "value": 0, "timestamp": 1720508183,
+            "tid": int(property_name[3:]) * _TID_READS[key]})
     return web.Response(
         content_type="application/json",
         text=GET_PROPERTY_VALID)
@@ -212,6 +233,10 @@ async def _handle_set_config_path_invalid(request):
 
 
 async def _handle_execute_slot(request):
+    if request.match_info["slot_name"] == "sleep":
+        # Slot simulating a device that takes a while to reply
+        params = await request.json()
+        await asyncio.sleep(params["seconds"])
     return web.Response(
         content_type="application/json",
         text=DEVICE_EXECUTE_SLOT_VALID)
@@ -284,6 +309,104 @@ async def _handle_delete_injected_property_invalid(request):
         text=INVALID_MODIFY_INJECTED_PROPERTY)
 
 
+# The injected properties other than property_test, kept by the mock:
+# name -> {"value", "timestamp", "tid"}
+_INJECTED = {}
+# Reading an injected property with this name is not authorized
+INJECTED_UNAUTHORIZED = "unauthorized"
+
+
+async def _handle_add_named_injected_property(request):
+    property_name = request.match_info["property_name"]
+    if property_name in _INJECTED:
+        return web.Response(
+            content_type="application/json",
+            text=ADD_INJECTED_PROPERTY_INVALID)
+    _INJECTED[property_name] = {"value": None, "timestamp": time.time(),
+                                "tid": 0}
+    return web.Response(
+        content_type="application/json",
+        text=VALID_MODIFY_RESPONSE)
+
+
+async def _handle_get_named_injected_property(request):
+    property_name = request.match_info["property_name"]
+    if property_name == INJECTED_UNAUTHORIZED:
+        return web.json_response({"detail": "not authorized"}, status=401,
+                                 reason="Unauthorized")
+    if property_name not in _INJECTED:
+        return web.json_response(
+            {"detail": "property not among the injected set"}, status=404,
+            reason="Not Found")
+    return web.json_response(_INJECTED[property_name])
+
+
+async def _handle_set_named_injected_property(request):
+    property_name = request.match_info["property_name"]
+    if property_name not in _INJECTED:
+        return web.Response(
+            content_type="application/json",
+            text=INVALID_MODIFY_INJECTED_PROPERTY)
+    _INJECTED[property_name] = await request.json()
+    return web.Response(
+        content_type="application/json",
+        text=VALID_MODIFY_RESPONSE)
+
+
+async def _handle_delete_named_injected_property(request):
+    if _INJECTED.pop(request.match_info["property_name"], None) is None:
+        return web.Response(
+            content_type="application/json",
+            text=INVALID_MODIFY_INJECTED_PROPERTY)
+    return web.Response(
+        content_type="application/json",
+        text=VALID_MODIFY_RESPONSE)
+
+
+# Number of changes of each property pushed by the subscription channels
+# before they are closed by the server
+PUSHED_CHANGES = 3
+
+_pushed_tid = 0
+
+
+async def _push_changes(keys, send):
+    """Pushes changes of the given (device_id, path) pairs: the value of each
+    is 0, 1, ... up to PUSHED_CHANGES - 1."""
+    global _pushed_tid
+    for value in range(PUSHED_CHANGES):
+        for device_id, path in keys:
+            _pushed_tid += 1
+            await send(json.dumps({
+                "device_id": device_id, "path": path, "value": value,
+                "timestamp": time.time(), "tid": _pushed_tid}))
+        await asyncio.sleep(0.01)
+
+
+async def _handle_subscription_stream(request):
+    keys = [key.partition(".")[::2]
+            for key in request.query["properties"].split(",")]
+    response = web.StreamResponse(
+        headers={"content-type": "text/event-stream"})
+    await response.prepare(request)
+    await response.write(b": change stream\n\n")
+
+    async def send(message):
+        await response.write(f"event: change\ndata: {message}\n\n".encode())
+
+    await _push_changes(keys, send)
+    return response
+
+
+async def _handle_subscription_websocket(request):
+    websocket = web.WebSocketResponse()
+    await websocket.prepare(request)
+    message = await websocket.receive_json()
+    await _push_changes(message["subscribe"], websocket.send_str)
+    await websocket.close()
+    return websocket
+
+
 # endregion
 
 _app_valid = web.Application()
@@ -315,6 +438,16 @@ _app_valid.add_routes([
             _handle_set_injected_property),
     web.delete("/property/property_test/config.json",
                _handle_delete_injected_property),
+    web.post("/property/{property_name}/config.json",
+             _handle_add_named_injected_property),
+    web.get("/property/{property_name}/config.json",
+            _handle_get_named_injected_property),
+    web.put("/property/{property_name}/config.json",
+            _handle_set_named_injected_property),
+    web.delete("/property/{property_name}/config.json",
+               _handle_delete_named_injected_property),
+    web.get("/subscriptions/stream", _handle_subscription_stream),
+    web.get("/subscriptions/ws", _handle_subscription_websocket),
 ])
 
 
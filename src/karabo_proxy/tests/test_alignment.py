@@ -0,0 +1,71 @@
+import pytest
+
+from .. import alignment
+from ..alignment import align_samples
+from ..async_karabo_proxy import AsyncKaraboProxy
+from ..data.device_config import PropertyInfo
+from ..sync_karabo_proxy import SyncKaraboProxy
+from .mock_web_proxy import PORT_INVALID_MOCK, PORT_VALID_MOCK
+
+
+def _history(*tids):
+    return [PropertyInfo(value=tid * 2, timestamp=0.0, tid=tid)
+            for tid in tids]
+
+
+@pytest.mark.parametrize("with_numpy", [True, False])
+def test_align_samples(monkeypatch, with_numpy):
+    if with_numpy:
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(alignment, "_numpy", lambda: None)
+    frames = align_samples({
+        "a": _history(10, 11, 12, 13, 20),
+        "b": _history(9, 12, 13, 14),
+        "c": _history(11, 13, 19)}, tolerance=1)
+    # No value of "b" is near train 20
+    assert [frame.tid for frame in frames] == [10, 11, 12, 13]
+    assert frames[0].values["b"].tid == 9
+    assert frames[2].values["b"].tid == 12
+    assert frames[3].values["c"].tid == 13
+    assert all(frame.aligned for frame in frames)
+
+    frames = align_samples({"a": _history(10, 11, 12, 20),
+                            "b": _history(11, 14)})
+    assert [frame.tid for frame in frames] == [11]
+    assert align_samples({"a": _history(1), "b": []}) == []
+
+
+def test_sync_read_aligned(web_proxy_mocks):
+    client = SyncKaraboProxy(f"http://localhost:{PORT_VALID_MOCK}")
+    keys = [("SYNC_A", "tid10"), ("SYNC_B", "tid5")]
+    frame = client.read_aligned(keys, tolerance=0, retry_interval=0.0)
+    # The second device lagged behind on the first read
+    assert frame.aligned
+    assert frame.rounds == 2
+    assert frame.tid == 10
+    assert frame.spread == 0
+    assert [prop.tid for prop in frame.values.values()] == [10, 10]
+
+    frame = client.read_aligned(keys, tolerance=10)
+    assert frame.aligned
+    assert frame.rounds == 1
+
+
+@pytest.mark.asyncio
+async def test_async_read_aligned(web_proxy_mocks):
+    async with AsyncKaraboProxy(
+            f"http://localhost:{PORT_VALID_MOCK}") as client:
+        frame = await client.read_aligned(
+            [("ASYNC_A", "tid10"), ("ASYNC_B", "tid3")], retry_interval=0.0)
+        # Either device may lag: both reach train 30 together
+        assert frame.aligned
+        assert frame.tid == 30
+        assert frame.spread == 0
+
+    async with AsyncKaraboProxy(
+            f"http://localhost:{PORT_INVALID_MOCK}") as client:
+        frame = await client.read_aligned([("ANY", "tid1")], deadline=0.2)
+        assert not frame.aligned
+        assert frame.rounds > 1
+        assert ("ANY", "tid1") in frame.errors
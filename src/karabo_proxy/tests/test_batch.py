@@ -0,0 +1,224 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from ..async_karabo_proxy import AsyncKaraboProxy
+from ..batch import (
+    AsyncKeyedLock, KeyedLock, aiter_batch, arun_batch, iter_batch, run_batch)
+from ..data.device_config import PropertyInfo
+from ..sync_karabo_proxy import SyncKaraboProxy
+from .mock_web_proxy import (
+    INJECTED_UNAUTHORIZED, PORT_INVALID_MOCK, PORT_VALID_MOCK)
+
+
+@pytest.mark.asyncio
+async def test_aiter_batch():
+    in_flight = 0
+    max_in_flight = 0
+
+    async def operation(delay):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(delay)
+        in_flight -= 1
+        if delay == 0.12:
+            raise RuntimeError("failed")
+        return delay * 2
+
+    delays = [0.2, 0.02, 0.12, 0.05, 0.3]
+    # Results are streamed in order of completion
+    completed = [key async for key, _ in aiter_batch(delays, operation, 3)]
+    assert completed == [0.02, 0.05, 0.12, 0.2, 0.3]
+    assert max_in_flight == 3
+    # Collected results keep the order of the keys; failures are results
+    results = await arun_batch(delays, operation, 2)
+    assert list(results) == delays
+    assert results[0.02] == 0.04
+    assert isinstance(results[0.12], RuntimeError)
+
+
+def test_iter_batch():
+    def operation(delay):
+        time.sleep(delay)
+        if delay == 0.1:
+            raise RuntimeError("failed")
+        return threading.get_ident()
+
+    delays = [0.3, 0.02, 0.1]
+    completed = [key for key, _ in iter_batch(delays, operation, 3)]
+    assert completed == [0.02, 0.1, 0.3]
+    results = run_batch(delays, operation, 2)
+    assert list(results) == delays
+    assert isinstance(results[0.1], RuntimeError)
+
+
+@pytest.mark.asyncio
+async def test_arun_batch_deadline():
+    cancelled = []
+
+    async def operation(delay):
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            cancelled.append(delay)
+            raise
+        return delay
+
+    start = time.monotonic()
+    results = await arun_batch([0.02, 1.0, 1.1, 0.03], operation, 2,
+                               deadline=0.3)
+    assert time.monotonic() - start < 0.8
+    # Partial results; the stragglers were cancelled and the keys never
+    # started report the expired deadline too.
+    assert list(results) == [0.02, 1.0, 1.1, 0.03]
+    assert results[0.02] == 0.02
+    for delay in (1.0, 1.1, 0.03):
+        assert isinstance(results[delay], TimeoutError)
+    await asyncio.sleep(0)
+    assert sorted(cancelled) == [1.0, 1.1]
+
+
+def test_run_batch_deadline():
+    def operation(delay):
+        time.sleep(delay)
+        return delay
+
+    start = time.monotonic()
+    results = run_batch([0.02, 1.0, 0.03, 1.1, 0.04], operation, 2,
+                        deadline=0.3)
+    assert time.monotonic() - start < 0.8
+    assert results[0.02] == 0.02
+    assert results[0.03] == 0.03
+    for delay in (1.0, 1.1, 0.04):
+        assert isinstance(results[delay], TimeoutError)
+
+
+@pytest.mark.asyncio
+async def test_async_keyed_lock():
+    keyed_lock = AsyncKeyedLock()
+    holders = []
+
+    async def hold(key):
+        async with keyed_lock.hold(key):
+            holders.append(key)
+            assert holders.count(key) == 1
+            await asyncio.sleep(0.01)
+            holders.remove(key)
+
+    await asyncio.gather(*(hold(key) for key in "aabab"))
+    assert keyed_lock._locks == {}
+
+
+def test_keyed_lock():
+    keyed_lock = KeyedLock()
+    holders = []
+
+    def hold(key):
+        with keyed_lock.hold(key):
+            holders.append(key)
+            assert holders.count(key) == 1
+            time.sleep(0.01)
+            holders.remove(key)
+
+    run_batch(list(range(8)), lambda i: hold("ab"[i % 2]), 8)
+    assert keyed_lock._locks == {}
+
+
+@pytest.mark.asyncio
+async def test_execute_slots(web_proxy_mocks):
+    device_ids = [f"MOTOR_{i}" for i in range(12)]
+    async_cli = AsyncKaraboProxy(f"http://localhost:{PORT_VALID_MOCK}")
+    results = await async_cli.execute_slots(
+        device_ids + ["MOTOR_1"], "divide", {"dividend": 15, "divisor": 6})
+    assert list(results) == device_ids
+    assert all(result.success for result in results.values())
+    assert results["MOTOR_3"].reply == {"quotient": 2, "remainder": 3}
+    streamed = [device_id async for device_id, _ in
+                async_cli.iter_execute_slots(device_ids, "divide")]
+    assert sorted(streamed) == sorted(device_ids)
+
+    sync_cli = SyncKaraboProxy(f"http://localhost:{PORT_INVALID_MOCK}")
+    results = sync_cli.execute_slots(device_ids, "divide")
+    assert list(results) == device_ids
+    assert not results["MOTOR_3"].success
+    assert results["MOTOR_3"].reason == "none_works has no slot divide"
+
+    # Connection errors are reported per device
+    unreachable_cli = SyncKaraboProxy("http://localhost:1")
+    results = unreachable_cli.execute_slots(["MOTOR_1"], "divide")
+    assert not results["MOTOR_1"].success
+
+
+@pytest.mark.asyncio
+async def test_execute_slots_deadline(web_proxy_mocks):
+    url = f"http://localhost:{PORT_VALID_MOCK}"
+    device_ids = ["SLOW_1", "SLOW_2"]
+    async with AsyncKaraboProxy(url) as async_cli:
+        results = await async_cli.execute_slots(
+            device_ids, "sleep", {"seconds": 1}, deadline=0.3)
+    assert not any(result.success for result in results.values())
+    assert "deadline" in results["SLOW_1"].reason
+
+    with SyncKaraboProxy(url) as sync_cli:
+        results = sync_cli.execute_slots(
+            device_ids, "sleep", {"seconds": 1}, timeout=0.3)
+    assert not any(result.success for result in results.values())
+    assert "Timeout" in results["SLOW_2"].reason
+
+
+@pytest.mark.asyncio
+async def test_injected_properties_batch(web_proxy_mocks):
+    url = f"http://localhost:{PORT_VALID_MOCK}"
+    types = {f"async_{i}": "INT64" for i in range(10)}
+    async with AsyncKaraboProxy(url) as client:
+        results = await client.add_injected_properties(types,
+                                                       max_concurrency=4)
+        assert list(results) == list(types)
+        assert all(result.success for result in results.values())
+        # Adding them again fails, unless ensured
+        results = await client.add_injected_properties(types)
+        assert not any(result.success for result in results.values())
+        assert results["async_0"].reason == "property already existing"
+        types["async_new"] = "DOUBLE"
+        results = await client.add_injected_properties(types, ensure=True)
+        assert all(result.success for result in results.values())
+        assert "already injected" in results["async_0"].reason
+        assert results["async_new"].reason == ""
+
+        values = {name: PropertyInfo(value=i, timestamp=1.5, tid=i)
+                  for i, name in enumerate(types)}
+        results = await client.set_injected_properties(values)
+        assert all(result.success for result in results.values())
+        read = await client.get_injected_properties([*types, "missing"])
+        assert read.values == values
+        assert list(read.errors) == ["missing"]
+        assert "property not among the injected set" in read.errors["missing"]
+
+        results = await client.delete_injected_properties(types)
+        assert all(result.success for result in results.values())
+        results = await client.delete_injected_properties(["async_0"])
+        assert not results["async_0"].success
+
+    types = {f"sync_{i}": "STRING" for i in range(5)}
+    with SyncKaraboProxy(url) as client:
+        client.add_injected_properties({"sync_0": "STRING"})
+        results = client.add_injected_properties(types, ensure=True,
+                                                 max_concurrency=2)
+        assert all(result.success for result in results.values())
+        assert "already injected" in results["sync_0"].reason
+        # Only the properties not found are added
+        results = client.add_injected_properties(
+            {INJECTED_UNAUTHORIZED: "STRING"}, ensure=True)
+        assert not results[INJECTED_UNAUTHORIZED].success
+        assert "401" in results[INJECTED_UNAUTHORIZED].reason
+        values = {name: PropertyInfo(value=name, timestamp=1.5, tid=0)
+                  for name in types}
+        results = client.set_injected_properties(values)
+        assert all(result.success for result in results.values())
+        assert client.get_injected_properties(types).values == values
+        results = client.delete_injected_properties([*types, "missing"])
+        assert [result.success for result in results.values()] == [
+            True] * 5 + [False]
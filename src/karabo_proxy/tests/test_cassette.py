@@ -0,0 +1,101 @@
+import time
+
+import pytest
+
+from ..async_karabo_proxy import AsyncKaraboProxy
+from ..sync_karabo_proxy import SyncKaraboProxy
+from ..transports.cassette import (
+    Cassette, RecordingAsyncTransport, RecordingSyncTransport,
+    ReplayAsyncTransport, ReplaySyncTransport)
+from .mock_web_proxy import PORT_VALID_MOCK
+
+
+def test_sync_record_and_replay(web_proxy_mocks, tmp_path):
+    path = str(tmp_path / "session.cassette")
+    with SyncKaraboProxy(f"http://localhost:{PORT_VALID_MOCK}",
+                         transport=RecordingSyncTransport(path)) as client:
+        topology = client.get_topology()
+        config = client.get_device_configuration("MOTOR_1")
+        assert client.execute_slot("MOTOR_1", "sleep",
+                                   {"seconds": 0.1}).success
+        with pytest.raises(TimeoutError):
+            client.execute_slot("MOTOR_1", "sleep", {"seconds": 0.3},
+                                timeout=0.1)
+
+    cassette = Cassette.load(path)
+    assert [i.method for i in cassette.interactions] == [
+        "GET", "GET", "PUT", "PUT"]
+    assert cassette.interactions[0].path == "/topology.json"
+    assert cassette.interactions[2].latency >= 0.1
+    assert cassette.interactions[3].status is None
+
+    # Replayed against any base URL, without network
+    with SyncKaraboProxy("http://replayed:8282",
+                         transport=ReplaySyncTransport(path)) as client:
+        assert client.get_topology() == topology
+        assert client.get_device_configuration("MOTOR_1") == config
+        start = time.monotonic()
+        assert client.execute_slot("MOTOR_1", "sleep",
+                                   {"seconds": 0.1}).success
+        assert time.monotonic() - start >= 0.1
+        with pytest.raises(TimeoutError):
+            client.execute_slot("MOTOR_1", "sleep", {"seconds": 0.3})
+        with pytest.raises(RuntimeError, match="Not Recorded"):
+            client.get_devices()
+
+    with SyncKaraboProxy(
+            "http://replayed:8282",
+            transport=ReplaySyncTransport(path, latency_scale=0)) as client:
+        start = time.monotonic()
+        assert client.execute_slot("MOTOR_1", "sleep",
+                                   {"seconds": 0.1}).success
+        assert time.monotonic() - start < 0.05
+
+
+@pytest.mark.asyncio
+async def test_async_record_and_replay(web_proxy_mocks, tmp_path):
+    path = str(tmp_path / "session.cassette")
+    transport = RecordingAsyncTransport(path)
+    async with AsyncKaraboProxy(f"http://localhost:{PORT_VALID_MOCK}",
+                                transport=transport) as client:
+        schema = await client.get_device_schema("MOTOR_1")
+        await client.get_device_configuration("MOTOR_1")
+        await client.get_device_configuration("MOTOR_1")
+        # Cancelled by the total timeout of the client
+        with pytest.raises(TimeoutError):
+            await client.execute_slot("MOTOR_1", "sleep", {"seconds": 0.3},
+                                      timeout=0.1)
+    assert transport.cassette.interactions[-1].status is None
+
+    async with AsyncKaraboProxy(
+            "http://replayed:8282",
+            transport=ReplayAsyncTransport(path, latency_scale=0)) as client:
+        assert await client.get_device_schema("MOTOR_1") == schema
+        # Responses recorded for the same request are served in turn
+        for _ in range(3):
+            await client.get_device_configuration("MOTOR_1")
+        with pytest.raises(TimeoutError):
+            await client.execute_slot("MOTOR_1", "sleep", {"seconds": 0.3})
+
+
+@pytest.mark.asyncio
+async def test_cancelled_requests_not_recorded(web_proxy_mocks, tmp_path):
+    path = str(tmp_path / "session.cassette")
+    transport = RecordingAsyncTransport(path)
+    params = {"seconds": 0.2}
+    async with AsyncKaraboProxy(f"http://localhost:{PORT_VALID_MOCK}",
+                                transport=transport) as client:
+        # Cancelled by the deadline of the batch, not timed out
+        results = await client.execute_slots(["MOTOR_1"], "sleep", params,
+                                             deadline=0.05)
+        assert not results["MOTOR_1"].success
+        assert (await client.execute_slot("MOTOR_1", "sleep",
+                                          params)).success
+    assert [i.status for i in transport.cassette.interactions] == [200]
+
+    async with AsyncKaraboProxy(
+            "http://replayed:8282",
+            transport=ReplayAsyncTransport(path, latency_scale=0)) as client:
+        for _ in range(2):
+            assert (await client.execute_slot("MOTOR_1", "sleep",
+                                              params)).success
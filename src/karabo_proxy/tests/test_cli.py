@@ -0,0 +1,71 @@
+import json
+
+from ..cli import main
+from .mock_web_proxy import PORT_INVALID_MOCK, PORT_VALID_MOCK
+
+URL = f"http://localhost:{PORT_VALID_MOCK}"
+
+
+def _records(text: str):
+    return [json.loads(line) for line in text.splitlines()]
+
+
+def test_dump(web_proxy_mocks, tmp_path, capsys):
+    devices = [f"DEVICE_{i}" for i in range(10)]
+    output = tmp_path / "dump.ndjson"
+    args = ["--url", URL, "-j", "4", "dump", "--topology", "--schemas",
+            "--configurations", "-o", str(output)]
+    for device_id in devices:
+        args += ["-d", device_id]
+    assert main(args) == 0
+    records = _records(output.read_text())
+    assert records[0]["type"] == "topology"
+    assert "device" in records[0]["data"]
+    schemas = {r["device_id"] for r in records if r["type"] == "schema"}
+    configs = {r["device_id"]: r["data"] for r in records
+               if r["type"] == "configuration"}
+    assert schemas == set(configs) == set(devices)
+    assert configs["DEVICE_3"]["heartbeatInterval"]["value"] == 20
+    assert "dumped 21 records, 0 errors" in capsys.readouterr().err
+
+    # All the devices of the topic matching a pattern, to stdout
+    assert main(["--url", URL, "dump", "-p", "A_SIMPLE_*"]) == 0
+    records = _records(capsys.readouterr().out)
+    assert [(r["type"], r["device_id"]) for r in records] == [
+        ("configuration", "A_SIMPLE_DEVICE")]
+
+    # Errors are records too
+    url = f"http://localhost:{PORT_INVALID_MOCK}"
+    assert main(["--url", url, "dump", "-d", "DEVICE_1"]) == 1
+    [record] = _records(capsys.readouterr().out)
+    assert record["type"] == "error"
+    assert record["operation"] == "configuration"
+    assert "not online or not alive" in record["reason"]
+
+
+def test_load(web_proxy_mocks, tmp_path, capsys, monkeypatch):
+    dump = tmp_path / "dump.ndjson"
+    assert main(["--url", URL, "dump", "--schemas", "--configurations",
+                 "-d", "DEVICE_1", "-d", "DEVICE_2", "-o", str(dump)]) == 0
+    records = _records(dump.read_text())
+    for record in records:
+        if record.get("device_id") == "DEVICE_1" and \
+                record["type"] == "configuration":
+            record["data"]["heartbeatInterval"]["value"] = 30
+    lines = [json.dumps(record) for record in records]
+    dump.write_text("\n".join([*lines, "not json", ""]))
+
+    results = tmp_path / "results.ndjson"
+    assert main(["--url", URL, "--rate", "100", "load", str(dump),
+                 "-o", str(results)]) == 1
+    results = {r["device_id"]: r for r in _records(results.read_text())}
+    assert results["DEVICE_1"]["success"]
+    assert results["DEVICE_2"] == {"type": "result", "device_id": "DEVICE_2",
+                                   "success": True, "reason": "unchanged"}
+    assert not results[None]["success"]
+    assert "line 5: invalid record" in results[None]["reason"]
+    assert "loaded 2 devices, 1 failed" in capsys.readouterr().err
+
+    # The URL is required
+    monkeypatch.delenv("KARABO_PROXY_URL", raising=False)
+    assert main(["load", str(dump)]) == 2
@@ -0,0 +1,109 @@
+import asyncio
+import time
+
+import pytest
+
+from ..async_karabo_proxy import AsyncKaraboProxy
+from ..batch import arun_batch
+from ..concurrency import AdaptiveConcurrency
+from ..scheduler import RequestScheduler
+from .mock_web_proxy import PORT_VALID_MOCK
+
+
+def test_additive_increase_multiplicative_decrease():
+    limiter = AdaptiveConcurrency(initial_limit=4, max_limit=6)
+    start = time.monotonic()
+    # About one more in flight per round of limit fast requests
+    for _ in range(5):
+        limiter.observe(start, 0.01, False)
+    assert limiter.limit == 5
+    for _ in range(20):
+        limiter.observe(start, 0.01, False)
+    assert limiter.limit == 6
+    assert limiter.stats.increases == 2
+    # Latency growth halves the limit, once for the requests of a round
+    limiter.observe(time.monotonic(), 0.05, False)
+    assert limiter.limit == 3
+    limiter.observe(start, 0.05, False)
+    limiter.observe(start, 0.01, True)
+    assert limiter.limit == 3
+    assert limiter.stats.overloads == 3
+    assert limiter.stats.decreases == 1
+    # Timeouts and server errors of later requests decrease it again
+    limiter.observe(time.monotonic(), 0.01, True)
+    assert limiter.limit == 1
+    limiter.observe(time.monotonic(), 0.01, True)
+    assert limiter.limit == 1
+
+
+@pytest.mark.asyncio
+async def test_limiter_bounds_batches():
+    limiter = AdaptiveConcurrency(initial_limit=2)
+    in_flight = []
+    peak = 0
+
+    async def operation(key: int) -> int:
+        nonlocal peak
+        in_flight.append(key)
+        peak = max(peak, len(in_flight))
+        await asyncio.sleep(0.01)
+        in_flight.remove(key)
+        return key
+
+    # Two batches share the limit of the limiter
+    results = await asyncio.gather(
+        arun_batch(range(6), operation, 10, limiter=limiter),
+        arun_batch(range(6, 12), operation, 10, limiter=limiter))
+    assert results[0] == {key: key for key in range(6)}
+    assert peak == 2
+    assert limiter.stats.in_flight == 0
+    assert limiter.stats.waiting == 0
+
+    # Waiting operations are cancelled with the batch
+    results = await arun_batch(range(6), operation, 10, deadline=0.005,
+                               limiter=limiter)
+    assert all(isinstance(r, TimeoutError) for r in results.values())
+    await asyncio.sleep(0)
+    assert limiter.stats.in_flight == 0
+    assert limiter.stats.waiting == 0
+
+
+@pytest.mark.asyncio
+async def test_client_adaptive_concurrency(web_proxy_mocks):
+    # Only timeouts are overloads, so that the latencies of a busy host
+    # don't take the limit down to its minimum before they are tested
+    limiter = AdaptiveConcurrency(initial_limit=2, max_limit=16,
+                                  tolerance=1000)
+    async with AsyncKaraboProxy(f"http://localhost:{PORT_VALID_MOCK}",
+                                concurrency=limiter) as client:
+        results = await client.execute_slots(
+            [f"MOTOR_{i}" for i in range(40)], "divide")
+        assert all(result.success for result in results.values())
+        stats = client.concurrency_stats
+        assert stats.requests == 40
+        assert stats.baseline is not None
+        assert stats.in_flight == 0
+        # Timeouts back off
+        limit = limiter.limit
+        results = await client.execute_slots(
+            ["MOTOR_1", "MOTOR_2"], "sleep", {"seconds": 0.3}, timeout=0.05)
+        assert not any(result.success for result in results.values())
+        assert limiter.limit < limit
+        assert stats.decreases >= 1
+
+
+@pytest.mark.asyncio
+async def test_scheduler_wait_not_observed(web_proxy_mocks):
+    # The time waiting for a slot of the scheduler is not transport latency:
+    # with a server replying in a constant time, the limit isn't decreased
+    limiter = AdaptiveConcurrency(initial_limit=8, max_limit=16)
+    async with AsyncKaraboProxy(f"http://localhost:{PORT_VALID_MOCK}",
+                                concurrency=limiter,
+                                scheduler=RequestScheduler(max_in_flight=4)
+                                ) as client:
+        await client.execute_slots([f"MOTOR_{i}" for i in range(48)],
+                                   "sleep", {"seconds": 0.02})
+        stats = client.concurrency_stats
+    assert stats.requests == 48
+    assert stats.decreases == 0
+    assert limiter.limit > 8
@@ -0,0 +1,247 @@
+import asyncio
+import json
+import tracemalloc
+
+import pytest
+
+from ..async_karabo_proxy import AsyncKaraboProxy
+from ..data.device_config import PropertyInfo
+from ..decoding import (
+    CompactDeviceConfig, DecodeOffload, KeyLayouts, LazyDeviceConfig,
+    LazyJsonObject, LazySchema, compact_configuration, decode_incrementally,
+    index_json_object)
+from ..sync_karabo_proxy import SyncKaraboProxy
+from .mock_web_proxy import PORT_VALID_MOCK
+
+
+def _configuration(n_properties: int, offset: int = 0) -> dict:
+    return {f"property_{i}": {"value": i + offset, "timestamp": 1.5,
+                              "tid": i}
+            for i in range(n_properties)}
+
+
+def test_compact_configuration():
+    layouts = KeyLayouts()
+    first = compact_configuration(_configuration(3), layouts)
+    second = compact_configuration(_configuration(3, offset=10), layouts)
+    assert isinstance(first, CompactDeviceConfig)
+    assert first.layout is second.layout
+    assert len(layouts) == 1
+    assert first == _configuration(3)
+    assert second["property_1"] == {"value": 11, "timestamp": 1.5, "tid": 1}
+    assert "property_2" in second and "property_3" not in second
+    assert second.value("property_2") == 12
+    assert second.property_info("property_0") == PropertyInfo(
+        value=10, timestamp=1.5, tid=0)
+    assert list(second) == ["property_0", "property_1", "property_2"]
+    assert second.property_values() == {
+        "property_0": 10, "property_1": 11, "property_2": 12}
+
+    # Configurations that don't fit the layout are kept as is
+    irregular = {"a": {"value": 1, "timestamp": 1.5, "tid": 0, "x": 0}}
+    assert compact_configuration(irregular, layouts) is irregular
+    assert len(layouts) == 1
+    # Responses that aren't configurations are invalid, as in dict mode
+    with pytest.raises(RuntimeError, match="Invalid response format"):
+        compact_configuration([1, 2], layouts)
+
+    layouts = KeyLayouts(max_layouts=2)
+    for n in range(1, 4):
+        compact_configuration(_configuration(n), layouts)
+    assert len(layouts) == 2
+
+
+def test_compact_memory():
+    payloads = [json.dumps(_configuration(200, offset=d)) for d in range(50)]
+
+    def allocated(decode):
+        tracemalloc.start()
+        configs = [decode(json.loads(payload)) for payload in payloads]
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        assert len(configs) == len(payloads)
+        return size
+
+    layouts = KeyLayouts()
+    assert allocated(lambda data: compact_configuration(data, layouts)) < \
+        allocated(dict) / 3
+
+
+@pytest.mark.asyncio
+async def test_compact_decoding_clients(web_proxy_mocks):
+    url = f"http://localhost:{PORT_VALID_MOCK}"
+    with SyncKaraboProxy(url) as client:
+        expected = client.get_device_configuration("MOTOR_1")
+    with SyncKaraboProxy(url, decoding="compact") as client:
+        config = client.get_device_configuration("MOTOR_1")
+        assert isinstance(config, CompactDeviceConfig)
+        assert config == expected
+        assert client.get_device_configuration("MOTOR_2").layout is \
+            config.layout
+        snapshot = client.get_configuration_snapshot(["MOTOR_1"])
+        assert snapshot.configurations["MOTOR_1"]["heartbeatInterval"] == 20
+    async with AsyncKaraboProxy(url, decoding="compact") as client:
+        config = await client.get_device_configuration("MOTOR_1")
+        assert isinstance(config, CompactDeviceConfig)
+        assert config == expected
+    with pytest.raises(ValueError, match="Unknown decoding"):
+        SyncKaraboProxy(url, decoding="columnar")
+
+
+def test_index_json_object():
+    documents = [
+        {},
+        _configuration(3),
+        {"a\\n\"b": {"x": {"y": [1, {"z": "}"}]}, "k": "],}"},
+         "c": [1, [2, 3]], "d": -1.5e+3, "e": True, "f": None,
+         "g": 'quoted "}" brace', "h": {"a": 1, "b": {"c": [2]}}},
+    ]
+    for document in documents:
+        for text in (json.dumps(document, indent=1),
+                     json.dumps(document, separators=(",", ":"))):
+            index = index_json_object(text)
+            assert list(index) == list(document)
+            for name, (start, end) in index.items():
+                assert json.loads(text[start:end]) == document[name]
+    for invalid in ("[1]", '{"a": 1} x', '{"a" 1}', '{"a": 1,}', "{",
+                    '{"a": {"b" 1}}', '{"a": [1,]}'):
+        with pytest.raises(ValueError):
+            index_json_object(invalid)
+
+
+def test_lazy_json_object():
+    config = LazyDeviceConfig.decode(json.dumps(_configuration(100)).encode())
+    assert len(config) == 100
+    assert list(config.keys())[:2] == ["property_0", "property_1"]
+    assert "property_99" in config and "property_100" not in config
+    assert config.decoded == 0
+    assert config.value("property_7") == 7
+    assert config.property_info("property_7") == PropertyInfo(
+        value=7, timestamp=1.5, tid=7)
+    assert config["property_7"] is config["property_7"]
+    assert config.decoded == 1
+    assert config == _configuration(100)
+    assert config.decoded == 100
+
+    lazy = LazyJsonObject.decode('{"a": tru, "b": 1}')
+    assert lazy["b"] == 1
+    with pytest.raises(RuntimeError, match="Invalid response format"):
+        lazy["a"]
+
+
+@pytest.mark.asyncio
+async def test_lazy_decoding_clients(web_proxy_mocks):
+    url = f"http://localhost:{PORT_VALID_MOCK}"
+    with SyncKaraboProxy(url) as client:
+        expected_config = client.get_device_configuration("MOTOR_1")
+        expected_schema = client.get_device_schema("MOTOR_1")
+    with SyncKaraboProxy(url, decoding="lazy") as client:
+        config = client.get_device_configuration("MOTOR_1")
+        assert isinstance(config, LazyDeviceConfig)
+        assert config == expected_config
+        schema = client.get_device_schema("MOTOR_1")
+        assert isinstance(schema, LazySchema)
+        assert schema == expected_schema
+    async with AsyncKaraboProxy(url, decoding="lazy") as client:
+        config = await client.get_device_configuration("MOTOR_1")
+        assert isinstance(config, LazyDeviceConfig)
+        assert config == expected_config
+        schema = await client.get_device_schema("MOTOR_1")
+        assert schema == expected_schema
+
+
+def test_decode_incrementally():
+    documents = [
+        {}, [1, {"a": 2}], "text", _configuration(3),
+        {"a\\n\"b": {"x": {"y": [1, {"z": "}"}]}, "k": "],}"},
+         "c": [1, [2, 3]], "d": -1.5e+3, "e": True, "f": None,
+         "h": {"a": {}, "b": {"c": {"d": [{"e": 1}]}}}},
+    ]
+    for document in documents:
+        for text in (json.dumps(document, indent=1), json.dumps(document)):
+            assert decode_incrementally(text.encode()) == document
+    for invalid in ('{"a": 1} x', '{"a": {"b": 1,}}', '{"a": {"b" 1}}'):
+        with pytest.raises(ValueError):
+            decode_incrementally(invalid)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("processes", [False, True])
+async def test_decode_offload(processes):
+    document = {"device": {f"DEVICE_{i}": {"classId": "Motor", "visibility": i}
+                           for i in range(100)},
+                "server": {"SERVER": {"host": "exflqr"}}, "macro": {}}
+    offload = DecodeOffload(processes=processes, chunk_entries=16)
+    try:
+        body = json.dumps(document).encode()
+        decoded = await offload.decode(json.loads, body)
+        assert decoded == document
+        assert list(decoded["device"]) == list(document["device"])
+        assert list(decoded) == list(document)
+        config = await offload.decode(LazyDeviceConfig.decode,
+                                      json.dumps(_configuration(5)).encode())
+        assert config.value("property_4") == 4
+        assert await offload.decode(json.loads, b"[1, 2]") == [1, 2]
+        with pytest.raises(ValueError):
+            await offload.decode(json.loads, b'{"a": }')
+    finally:
+        offload.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_decode_offload_thread(monkeypatch):
+    def decode_incrementally(body):
+        raise AssertionError("decoded incrementally")
+
+    # json.loads is used as is in the thread, unless incremental
+    monkeypatch.setattr(f"{DecodeOffload.__module__}.decode_incrementally",
+                        decode_incrementally)
+    offload = DecodeOffload()
+    try:
+        assert await offload.decode(json.loads, b'{"a": [1]}') == {"a": [1]}
+        offload.incremental = True
+        with pytest.raises(AssertionError, match="incrementally"):
+            await offload.decode(json.loads, b'{"a": [1]}')
+    finally:
+        offload.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_decode_offload_loop_latency():
+    body = json.dumps({"device": {
+        f"DEVICE_{i}": {"classId": "Motor", "serverId": f"SERVER_{i}",
+                        "visibility": 4, "interfaces": [1, 2]}
+        for i in range(50000)}}).encode()
+    offload = DecodeOffload(incremental=True)
+    ticks = 0
+
+    async def tick():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0)
+            ticks += 1
+
+    ticker = asyncio.ensure_future(tick())
+    try:
+        await offload.decode(json.loads, body)
+    finally:
+        ticker.cancel()
+        offload.shutdown()
+    # The event loop kept running other tasks during the decoding
+    assert ticks > 10
+
+
+@pytest.mark.asyncio
+async def test_decode_offload_client(web_proxy_mocks):
+    url = f"http://localhost:{PORT_VALID_MOCK}"
+    async with AsyncKaraboProxy(url) as client:
+        expected_topology = await client.get_topology()
+        expected_config = await client.get_device_configuration("MOTOR_1")
+    for decoding in ("dict", "lazy"):
+        offload = DecodeOffload(threshold=0)
+        async with AsyncKaraboProxy(url, decoding=decoding,
+                                    decode_offload=offload) as client:
+            assert await client.get_topology() == expected_topology
+            config = await client.get_device_configuration("MOTOR_1")
+            assert config == expected_config
+        assert offload._executor is None
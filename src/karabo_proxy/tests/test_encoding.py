@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+from .. import encoding
+from ..data.device_config import PropertyInfo
+from ..encoding import EncodedPayload, encode_json
+from ..sync_karabo_proxy import SyncKaraboProxy
+from .mock_web_proxy import PORT_VALID_MOCK
+
+
+@pytest.fixture(params=["orjson", "json"])
+def encoder(request, monkeypatch):
+    if request.param == "orjson":
+        pytest.importorskip("orjson")
+    else:
+        monkeypatch.setattr(encoding, "_orjson", lambda: None)
+    return request.param
+
+
+def test_encode_json(encoder):
+    payload = {"name": "motor", "positions": [1.5, 2], "enabled": True}
+    assert json.loads(encode_json(payload)) == payload
+    prop = PropertyInfo(value=[1, 2], timestamp=100.0, tid=7)
+    assert json.loads(encode_json(prop)) == {
+        "value": [1, 2], "timestamp": 100.0, "tid": 7}
+    with pytest.raises(TypeError):
+        encode_json({"value": object()})
+
+
+def test_encoders_agree(encoder):
+    # The same json with and without orjson
+    assert encode_json({"a": float("nan"), "b": [float("inf"), None]}) == (
+        b'{"a":NaN,"b":[Infinity,null]}')
+    assert encode_json({"big": 1 << 64}) == b'{"big":18446744073709551616}'
+    assert encode_json({1: "x", 2.5: [1]}) == b'{"1":"x","2.5":[1]}'
+    assert encode_json([1e308, 1e308, float("-inf")]) == (
+        b"[1e+308,1e+308,-Infinity]")
+    prop = PropertyInfo(value=[1.0, float("nan")], timestamp=1.0, tid=0)
+    assert encode_json(prop) == b'{"value":[1.0,NaN],"timestamp":1.0,"tid":0}'
+
+
+def test_is_finite():
+    assert encoding._is_finite({"a": "nullable", "b": None, "c": [1, 1.5]})
+    assert encoding._is_finite([1e308, 1e308, True, 1 << 2000])
+    assert not encoding._is_finite({"a": [[1.0], [float("inf")]]})
+    assert not encoding._is_finite((1, float("nan")))
+    assert not encoding._is_finite(
+        PropertyInfo(value=float("nan"), timestamp=1.0, tid=0))
+
+
+def test_encode_numpy(encoder):
+    np = pytest.importorskip("numpy")
+    values = np.arange(6, dtype=np.float64).reshape(2, 3)
+    prop = PropertyInfo(value=values[:, 1], timestamp=1.0, tid=np.int64(3))
+    assert json.loads(encode_json(prop)) == {
+        "value": [1.0, 4.0], "timestamp": 1.0, "tid": 3}
+    assert json.loads(encode_json({"gain": np.float32(0.5)})) == {
+        "gain": 0.5}
+    assert encode_json(np.array([1.0, np.nan])) == b"[1.0,NaN]"
+    assert encode_json({"gain": np.float32(np.inf)}) == b'{"gain":Infinity}'
+    assert encoding._is_finite(np.array([], dtype=np.float64))
+    assert encoding._is_finite(np.arange(3))
+
+
+def test_encoded_payload(web_proxy_mocks):
+    encoded = EncodedPayload.encode({"targetPosition": 1.5})
+    assert encode_json(encoded) is encoded.data
+    assert json.loads(encoded.data) == {"targetPosition": 1.5}
+    client = SyncKaraboProxy(f"http://localhost:{PORT_VALID_MOCK}")
+    assert client.set_device_configuration("MOTOR_1", encoded).success
+    assert client.set_injected_property(
+        "property_test",
+        PropertyInfo(value=[1.0, 2.0], timestamp=1.0, tid=0)).success
@@ -0,0 +1,114 @@
+import datetime
+
+import pytest
+
+from ..data.device_config import PropertyInfo
+from ..export import (
+    EXPORT_ARROW, EXPORT_PARQUET, PropertyWriter, classify_value,
+    configuration_rows, property_batches, write_snapshot, write_topology)
+from ..snapshot import ConfigurationSnapshot
+from ..subscriptions import PropertyChange
+from ..sync_karabo_proxy import SyncKaraboProxy
+from .mock_web_proxy import PORT_VALID_MOCK
+
+
+def _read(path, format):
+    pa = pytest.importorskip("pyarrow")
+    if format == EXPORT_PARQUET:
+        import pyarrow.parquet as pq
+        return pq.read_table(path)
+    import pyarrow.ipc as ipc
+    with pa.memory_map(str(path)) as source:
+        return ipc.open_file(source).read_all()
+
+
+def test_classify_value():
+    assert classify_value(None) == ("null", None)
+    assert classify_value(True) == ("bool_value", True)
+    assert classify_value(3) == ("int_value", 3)
+    assert classify_value(1 << 64) == ("json", str(1 << 64))
+    assert classify_value(2.5) == ("float_value", 2.5)
+    assert classify_value("on") == ("string_value", "on")
+    assert classify_value([True, False]) == ("bool_vector", [True, False])
+    assert classify_value([1, 2]) == ("int_vector", [1, 2])
+    assert classify_value([1, 2.5]) == ("float_vector", [1.0, 2.5])
+    assert classify_value([]) == ("float_vector", [])
+    assert classify_value(["a"]) == ("string_vector", ["a"])
+    assert classify_value([{"a": 1}]) == ("json", '[{"a":1}]')
+
+
+@pytest.mark.parametrize("format", [EXPORT_PARQUET, EXPORT_ARROW])
+def test_write_snapshot(tmp_path, format):
+    pytest.importorskip("pyarrow")
+    snapshot = ConfigurationSnapshot(configurations={
+        "MOTOR_1": {"position": 1.5, "steps": 7, "state": "ON",
+                    "profile": [0.0, 0.5], "flags": [True], "names": ["a"],
+                    "empty": None},
+        "MOTOR_2": {"position": 2.5}}, timestamp=1720508183.25)
+    path = tmp_path / f"snapshot.{format}"
+    assert write_snapshot(str(path), snapshot, format) == 8
+    table = _read(path, format).to_pylist()
+    rows = {(row["device_id"], row["property"]): row for row in table}
+    assert rows["MOTOR_1", "position"]["float_value"] == 1.5
+    assert rows["MOTOR_1", "position"]["value_type"] == "float_value"
+    assert rows["MOTOR_1", "position"]["int_value"] is None
+    assert rows["MOTOR_1", "steps"]["int_value"] == 7
+    assert rows["MOTOR_1", "profile"]["float_vector"] == [0.0, 0.5]
+    assert rows["MOTOR_1", "flags"]["bool_vector"] == [True]
+    assert rows["MOTOR_1", "names"]["string_vector"] == ["a"]
+    assert rows["MOTOR_1", "empty"]["value_type"] == "null"
+    assert rows["MOTOR_2", "position"]["timestamp"] == datetime.datetime(
+        2024, 7, 9, 6, 56, 23, 250000, tzinfo=datetime.timezone.utc)
+    assert rows["MOTOR_2", "position"]["tid"] is None
+
+    with pytest.raises(ValueError, match="Unknown export format"):
+        write_snapshot(str(path), snapshot, "csv")
+
+
+def test_property_writer(tmp_path, web_proxy_mocks):
+    pytest.importorskip("pyarrow")
+    import pyarrow.parquet as pq
+
+    client = SyncKaraboProxy(f"http://localhost:{PORT_VALID_MOCK}")
+    path = tmp_path / "samples.parquet"
+    with PropertyWriter(str(path), batch_size=2) as writer:
+        writer.add_configuration("DEVICE_3",
+                                 client.get_device_configuration("DEVICE_3"))
+        writer.add_samples({("MOTOR_1", "position"): [
+            PropertyInfo(value=float(i), timestamp=1.0 + i, tid=100 + i)
+            for i in range(3)]})
+        writer.add_samples([PropertyChange(
+            "MOTOR_2", "state", PropertyInfo("ON", 2.0, 7), "polling")])
+    # 3 properties of the configuration, 3 + 1 samples
+    assert writer.rows == 7
+    # The rows are written in batches of 2, a row group each
+    parquet = pq.ParquetFile(str(path))
+    assert parquet.metadata.num_rows == 7
+    assert parquet.metadata.num_row_groups == 4
+    table = parquet.read().to_pylist()
+    heartbeat = [row for row in table
+                 if row["property"] == "heartbeatInterval"]
+    assert heartbeat[0]["int_value"] == 20 and heartbeat[0]["tid"] == 0
+    samples = [row for row in table if row["device_id"] == "MOTOR_1"]
+    assert [row["tid"] for row in samples] == [100, 101, 102]
+    assert table[-1]["string_value"] == "ON"
+
+    # Batches of rows consumed lazily
+    config = {"DEV": {"a": {"value": 1, "timestamp": 1.0, "tid": 5},
+                      "b": {"value": [1, 2], "timestamp": 1.0, "tid": 5},
+                      "c": {"value": "x", "timestamp": 1.0, "tid": 5}}}
+    batches = list(property_batches(configuration_rows(config), 2))
+    assert [batch.num_rows for batch in batches] == [2, 1]
+    assert batches[0].column("int_vector").to_pylist() == [None, [1, 2]]
+
+
+def test_write_topology(tmp_path, web_proxy_mocks):
+    pytest.importorskip("pyarrow")
+    client = SyncKaraboProxy(f"http://localhost:{PORT_VALID_MOCK}")
+    path = tmp_path / "topology.arrow"
+    assert write_topology(str(path), client.get_topology(),
+                          EXPORT_ARROW) == 2
+    table = _read(path, EXPORT_ARROW).to_pylist()
+    assert [(row["category"], row["instance_id"]) for row in table] == [
+        ("device", "A_SIMPLE_DEVICE"), ("server", "A_SIMPLE_SERVER")]
+    assert table[0]["attributes"] == '{"__deviceId__":"A_SIMPLE_DEVICE"}'
@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+
+from ..async_karabo_proxy import AsyncKaraboProxy
+from ..data.device_config import PropertyInfo
+from ..hedging import Hedger, HedgingPolicy, LatencyTracker
+from ..rate_limit import RateLimit, RateLimits
+from ..scheduler import RequestScheduler
+from .mock_web_proxy import PORT_VALID_MOCK
+
+
+def test_latency_tracker():
+    tracker = LatencyTracker(window=100)
+    for latency in range(LatencyTracker.MIN_SAMPLES - 1):
+        tracker.record(latency)
+    assert tracker.percentile(50) is None
+    for latency in range(200):
+        tracker.record(latency / 1000)
+    # Only the last 100 latencies are kept: 0.100 to 0.199
+    assert tracker.percentile(50) == 0.149
+    assert tracker.percentile(99) == 0.198
+    assert tracker.percentile(100) == 0.199
+
+
+@pytest.mark.asyncio
+async def test_hedged_request():
+    delays = {"http://primary/": 0.5, "http://replica/": 0.01}
+    sent = []
+    cancelled = []
+
+    async def send(base_url):
+        sent.append(base_url)
+        try:
+            await asyncio.sleep(delays[base_url])
+        except asyncio.CancelledError:
+            cancelled.append(base_url)
+            raise
+        return base_url
+
+    policy = HedgingPolicy(budget=1.0, replicas=["http://replica"],
+                           initial_delay=0.05)
+    hedger = Hedger(policy, "http://primary/")
+    assert await hedger.request(send, "http://primary/") == "http://replica/"
+    assert sent == ["http://primary/", "http://replica/"]
+    await asyncio.sleep(0)
+    assert cancelled == ["http://primary/"]
+    assert hedger.stats.hedged == hedger.stats.hedge_wins == 1
+    # The cancelled request is recorded with the time it ran for
+    [latency] = hedger._latencies._latencies
+    assert 0.05 <= latency < 0.5
+
+    # Fast requests are not hedged
+    assert await hedger.request(send, "http://replica/") == "http://replica/"
+    assert hedger.stats.requests == 2
+    assert hedger.stats.hedged == 1
+
+
+@pytest.mark.asyncio
+async def test_hedging_budget_and_failures():
+    async def send(base_url):
+        await asyncio.sleep(0.05)
+        if base_url == "http://failing/":
+            raise RuntimeError("failed")
+        return base_url
+
+    policy = HedgingPolicy(budget=0.5, replicas=["http://failing"],
+                           initial_delay=0.01)
+    hedger = Hedger(policy, "http://primary/")
+    # A failed hedge doesn't fail the request
+    for _ in range(4):
+        assert await hedger.request(send, "http://primary/") == (
+            "http://primary/")
+    # Only half of the requests could be hedged
+    assert hedger.stats.hedged == 2
+    assert hedger.stats.over_budget == 2
+    assert hedger.stats.hedge_wins == 0
+
+
+@pytest.mark.asyncio
+async def test_client_hedging(web_proxy_mocks):
+    replica_url = f"http://127.0.0.1:{PORT_VALID_MOCK}"
+    policy = HedgingPolicy(budget=1.0, replicas=[replica_url],
+                           initial_delay=0.0, min_delay=0.0)
+    async with AsyncKaraboProxy(f"http://localhost:{PORT_VALID_MOCK}",
+                                hedging=policy) as client:
+        prop = await client.get_device_config_path(
+            "A_SIMPLE_DEVICE", "heartbeatInterval")
+        assert type(prop) is PropertyInfo
+        # Writes are never hedged
+        await client.execute_slot("any_works", "divide")
+        assert client.hedging_stats.requests == 1
+
+    # The duplicates are rate limited and scheduled too
+    async with AsyncKaraboProxy(
+            f"http://localhost:{PORT_VALID_MOCK}", hedging=policy,
+            rate_limits=RateLimits(reads=RateLimit(rate=1000, burst=10)),
+            scheduler=RequestScheduler()) as client:
+        await client.get_device_config_path("A_SIMPLE_DEVICE",
+                                            "heartbeatInterval")
+        assert client.hedging_stats.hedged == 1
+        assert client.rate_limit_stats["read"].calls == 2
+        assert sum(stats.dispatched
+                   for stats in client.scheduler_stats.values()) == 2
+    assert AsyncKaraboProxy("http://localhost").hedging_stats is None
@@ -1,35 +1,14 @@
-import os
-import subprocess
-from time import sleep
-
 import pytest
 
 from ..async_karabo_proxy import AsyncKaraboProxy
 from ..data.device_config import PropertyInfo
 from ..data.topology import DevicesInfo, TopologyInfo
+from ..schema_cache import MappedSchema, SchemaCache
 from ..sync_karabo_proxy import SyncKaraboProxy
 from .mock_web_proxy import (
     DEVICE_GET_CONFIGURATION_VALID, PORT_INVALID_MOCK, PORT_VALID_MOCK)
 
 
-@pytest.fixture(scope="module")
-def web_proxy_mocks():
-    mock_module_path = os.path.dirname(
-        os.path.abspath(os.path.dirname(__file__)))
-    proc_valid_mock = subprocess.Popen(
-        ["python", "-m", "tests.mock_web_proxy"],
-        cwd=mock_module_path)
-    proc_invalid_mock = subprocess.Popen(
-        ["python", "-m", "tests.mock_web_proxy", "--invalid"],
-        cwd=mock_module_path)
-    # The WebProxy mocks require some time to initialize and reach
-    # the point when they can start accepting requests.
-    sleep(3)
-    yield
-    proc_valid_mock.terminate()
-    proc_invalid_mock.terminate()
-
-
 @pytest.fixture(scope="module")
 def valid_mock_async_cli():
     """Instantiantes an async client for the WebProxy mock that returns valid
@@ -239,6 +218,34 @@ async def test_get_device_schema(web_proxy_mocks,
         invalid_mock_sync_cli.get_device_schema("none_works")
 
 
+@pytest.mark.asyncio
+async def test_get_device_schema_cached(web_proxy_mocks, tmp_path):
+    url = f"http://localhost:{PORT_VALID_MOCK}"
+    # The first client fetches the schema and stores it in the cache
+    async_cli = AsyncKaraboProxy(url, schema_cache=SchemaCache(str(tmp_path)))
+    schema = await async_cli.get_device_schema("A_SIMPLE_DEVICE")
+    assert type(schema) is dict
+    # Any other client sharing the cache directory gets it from the cache
+    async_cli = AsyncKaraboProxy(url, schema_cache=SchemaCache(str(tmp_path)))
+    cached_schema = await async_cli.get_device_schema("A_SIMPLE_DEVICE")
+    assert type(cached_schema) is MappedSchema
+    assert dict(cached_schema) == schema
+    sync_cli = SyncKaraboProxy(url, schema_cache=SchemaCache(str(tmp_path)))
+    cached_schema = sync_cli.get_device_schema("A_SIMPLE_DEVICE")
+    assert type(cached_schema) is MappedSchema
+    assert dict(cached_schema) == schema
+    # Devices not in the topology are not cached, and don't get the devices'
+    # instance info fetched again before it expires
+    fetched = []
+    get_devices = sync_cli.get_devices
+    sync_cli.get_devices = lambda timeout: fetched.append(1) or get_devices(
+        timeout)
+    for _ in range(2):
+        schema = sync_cli.get_device_schema("any_works")
+        assert type(schema) is dict
+    assert fetched == []
+
+
 @pytest.mark.asyncio
 async def test_execute_slot(web_proxy_mocks,
                             valid_mock_async_cli,
@@ -0,0 +1,128 @@
+import asyncio
+import time
+
+import pytest
+
+from ..async_karabo_proxy import AsyncKaraboProxy
+from ..data.topology import DevicesInfo
+from ..liveness import (
+    AsyncLivenessMonitor, DeviceState, LivenessChange, LivenessMonitor)
+from ..sync_karabo_proxy import SyncKaraboProxy
+from .mock_web_proxy import PORT_INVALID_MOCK, PORT_VALID_MOCK
+
+
+class _FakeClient:
+    """Lists the devices in its online attribute, or fails if None."""
+
+    def __init__(self):
+        self.online = set()
+
+    async def get_devices(self, timeout=None) -> DevicesInfo:
+        if self.online is None:
+            raise RuntimeError("Error getting devices: unreachable")
+        return DevicesInfo(devices={device_id: {}
+                                    for device_id in self.online})
+
+
+@pytest.mark.asyncio
+async def test_liveness_transitions():
+    client = _FakeClient()
+    monitor = AsyncLivenessMonitor(client, ["A", "B"], unknown_after=2)
+    changes = []
+    notified = []
+
+    async def async_callback(change: LivenessChange):
+        notified.append(change.device_id)
+
+    def failing_callback(change: LivenessChange):
+        raise ValueError("bug in callback")
+
+    for callback in (changes.append, async_callback, failing_callback):
+        monitor.add_callback(callback)
+    assert monitor.state("A") == DeviceState.UNKNOWN
+
+    client.online = {"A", "C"}
+    await monitor.poll()
+    assert [(c.device_id, c.previous, c.state) for c in changes] == [
+        ("A", DeviceState.UNKNOWN, DeviceState.ONLINE),
+        ("B", DeviceState.UNKNOWN, DeviceState.OFFLINE)]
+    assert notified == ["A", "B"]
+    assert monitor.stats.callback_errors == 2
+    # Devices not monitored are ignored
+    assert "C" not in monitor.states()
+    assert await monitor.poll() == []
+
+    client.online = {"B"}
+    changes.clear()
+    await monitor.poll()
+    assert {c.device_id: c.state for c in changes} == {
+        "A": DeviceState.OFFLINE, "B": DeviceState.ONLINE}
+    assert monitor.is_online("B") and not monitor.is_online("A")
+    assert monitor.transitions("A") == 2
+    assert monitor.since("A") == pytest.approx(time.time(), abs=5)
+
+    # The WebProxy unreachable: unknown after unknown_after failed polls
+    client.online = None
+    changes.clear()
+    assert await monitor.poll() == []
+    await monitor.poll()
+    assert {c.state for c in changes} == {DeviceState.UNKNOWN}
+    stats = monitor.stats
+    assert (stats.polls, stats.failures, stats.consecutive_failures) == (
+        5, 2, 2)
+    assert "unreachable" in stats.last_error
+
+    # Monitoring all the devices listed
+    monitor = AsyncLivenessMonitor(client)
+    client.online = {"A", "C"}
+    await monitor.poll()
+    client.online = {"C"}
+    await monitor.poll()
+    assert monitor.states() == {"A": DeviceState.OFFLINE,
+                                "C": DeviceState.ONLINE}
+
+
+def test_liveness_jitter():
+    monitor = LivenessMonitor(None, interval=1.0, jitter=0.2)
+    delays = [monitor.next_delay() for _ in range(1000)]
+    assert 0.8 <= min(delays) < 0.85 and 1.15 < max(delays) <= 1.2
+    first_delays = [monitor.first_delay() for _ in range(1000)]
+    assert 0 <= min(first_delays) and max(first_delays) <= 0.2
+    assert len(set(first_delays)) == 1000
+    with pytest.raises(ValueError, match="jitter"):
+        LivenessMonitor(None, jitter=1.0)
+    with pytest.raises(ValueError, match="Unknown liveness source"):
+        LivenessMonitor(None, source="heartbeats")
+
+
+@pytest.mark.asyncio
+async def test_liveness_monitors(web_proxy_mocks):
+    url = f"http://localhost:{PORT_VALID_MOCK}"
+    device_ids = ["A_SIMPLE_DEVICE", "MOTOR_1"]
+    expected = {"A_SIMPLE_DEVICE": DeviceState.ONLINE,
+                "MOTOR_1": DeviceState.OFFLINE}
+    with SyncKaraboProxy(url) as client:
+        with LivenessMonitor(client, device_ids, interval=0.01) as monitor:
+            for _ in range(500):
+                if monitor.stats.polls >= 3:
+                    break
+                time.sleep(0.01)
+        assert monitor.states() == expected
+        assert monitor.stats.changes == 2
+
+    async with AsyncKaraboProxy(url) as client:
+        changes = asyncio.Queue()
+        monitor = AsyncLivenessMonitor(client, device_ids, interval=0.01,
+                                       source="topology")
+        monitor.add_callback(changes.put_nowait)
+        async with monitor:
+            await asyncio.wait_for(changes.get(), 5)
+            await asyncio.wait_for(changes.get(), 5)
+        assert monitor.states() == expected
+
+    url = f"http://localhost:{PORT_INVALID_MOCK}"
+    async with AsyncKaraboProxy(url) as client:
+        monitor = AsyncLivenessMonitor(client, device_ids)
+        await monitor.poll()
+        assert monitor.stats.failures == 1
+        assert "Invalid response format" in monitor.stats.last_error
@@ -0,0 +1,96 @@
+import time
+
+import pytest
+
+from ..async_karabo_proxy import AsyncKaraboProxy
+from ..data.device_config import PropertyInfo
+from ..property_cache import PropertyCache, PropertyCacheStats
+from ..sync_karabo_proxy import SyncKaraboProxy
+from .mock_web_proxy import PORT_VALID_MOCK
+
+
+def _property(value):
+    return PropertyInfo(value=value, timestamp=1.0, tid=0)
+
+
+def test_property_cache():
+    cache = PropertyCache(max_entries=2)
+    key = ("MOTOR_1", "position")
+    cache.put(key, _property(1), cache.generation())
+    # Reading from the cache is opt-in by default
+    assert cache.get(key) is None
+    assert cache.get(key, max_age=10).value == 1
+    cache.put(key, _property(2), cache.generation(),
+              retrieved=time.monotonic() - 5)
+    assert cache.get(key, max_age=1) is None
+    assert cache.get(key, max_age=10).value == 2
+
+    # Least recently used eviction
+    cache.put(("MOTOR_2", "position"), _property(3), cache.generation())
+    cache.get(key, max_age=10)
+    cache.put(("MOTOR_3", "position"), _property(4), cache.generation())
+    assert cache.get(("MOTOR_2", "position"), max_age=10) is None
+    assert cache.get(key, max_age=10) is not None
+    assert len(cache) == 2
+
+    # A value read before an invalidation is not cached
+    generation = cache.generation()
+    cache.invalidate("MOTOR_1")
+    cache.put(key, _property(5), generation)
+    assert cache.get(key, max_age=10) is None
+    assert cache.stats.evictions == 1
+    assert cache.stats.invalidations == 1
+    assert cache.stats.hits == 4
+
+
+def test_property_cache_copies():
+    cache = PropertyCache(max_age=10)
+    key = ("MOTOR_1", "profile")
+    cache.put(key, _property([1, 2]), cache.generation())
+    # Callers may modify the values they read
+    cached = cache.get(key)
+    cached.value.append(3)
+    cached.tid = 7
+    assert cache.get(key) == _property([1, 2])
+    assert cache.stats.hits == 2
+
+    # Disabled reads count neither as hits nor as misses
+    disabled = PropertyCache()
+    disabled.put(key, _property(1), disabled.generation())
+    assert disabled.get(key) is None
+    assert disabled.get(("MOTOR_2", "position")) is None
+    assert disabled.stats == PropertyCacheStats()
+
+
+def test_sync_client_property_cache(web_proxy_mocks):
+    cache = PropertyCache(max_age=60)
+    client = SyncKaraboProxy(f"http://localhost:{PORT_VALID_MOCK}",
+                             property_cache=cache)
+    first = client.get_device_config_path("MOTOR_1", "heartbeatInterval")
+    assert client.get_device_config_path(
+        "MOTOR_1", "heartbeatInterval") == first
+    assert client.get_device_config_path(
+        "MOTOR_1", "heartbeatInterval", max_age=0) == first
+    # The read bypassing the cache is not a miss
+    assert cache.stats.hits == 1
+    assert cache.stats.misses == 1
+    # Own writes invalidate the cached values
+    client.set_device_config_path("MOTOR_1", "heartbeatInterval", 10)
+    assert len(cache) == 0
+    client.get_device_config_path("MOTOR_1", "heartbeatInterval")
+    client.set_device_configuration("MOTOR_1", {"heartbeatInterval": 10})
+    assert len(cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_async_client_property_cache(web_proxy_mocks):
+    cache = PropertyCache(max_age=60)
+    async with AsyncKaraboProxy(f"http://localhost:{PORT_VALID_MOCK}",
+                                property_cache=cache) as client:
+        first = await client.get_device_config_path(
+            "MOTOR_1", "heartbeatInterval")
+        assert await client.get_device_config_path(
+            "MOTOR_1", "heartbeatInterval") == first
+        # Slots invalidate all the properties of their device
+        await client.execute_slot("MOTOR_1", "divide")
+        assert len(cache) == 0
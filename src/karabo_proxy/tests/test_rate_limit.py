@@ -0,0 +1,105 @@
+import asyncio
+import time
+
+import pytest
+
+from ..async_karabo_proxy import AsyncKaraboProxy
+from ..rate_limit import (
+    RateLimit, RateLimiter, RateLimitExceeded, RateLimits, TokenBucket,
+    request_category)
+from ..sync_karabo_proxy import SyncKaraboProxy
+from .mock_web_proxy import PORT_VALID_MOCK
+
+
+def test_token_bucket():
+    bucket = TokenBucket(RateLimit(rate=10, burst=2))
+    assert bucket.reserve(reject=False) == 0.0
+    assert bucket.reserve(reject=False) == 0.0
+    # Excess requests are queued one token period apart...
+    assert bucket.reserve(reject=False) == pytest.approx(0.1, abs=0.01)
+    assert bucket.reserve(reject=False) == pytest.approx(0.2, abs=0.01)
+    # ...or rejected without taking a token
+    assert bucket.reserve(reject=True) is None
+
+
+@pytest.mark.asyncio
+async def test_cancelled_acquire():
+    limiter = RateLimiter(RateLimits(reads=RateLimit(rate=2)))
+    await limiter.async_acquire("GET", "topology.json")
+    waiters = [asyncio.ensure_future(
+        limiter.async_acquire("GET", "topology.json")) for _ in range(10)]
+    await asyncio.sleep(0.01)
+    for waiter in waiters:
+        waiter.cancel()
+    await asyncio.gather(*waiters, return_exceptions=True)
+    # The tokens of the cancelled waits are given back: the next request
+    # only waits for the token after the first one
+    assert limiter.reserve("GET", "topology.json") < 0.5
+
+
+def test_request_category():
+    assert request_category("GET", "devices/A/config.json") == "read"
+    assert request_category("PUT", "devices/A.b/config.json") == "write"
+    assert request_category("PUT", "devices/A/slot/s.json") == "slot"
+    assert request_category("GET", "property/p/config.json") == "injected"
+
+
+def test_sync_rate_limit(web_proxy_mocks):
+    limits = RateLimits(reads=RateLimit(rate=20))
+    client = SyncKaraboProxy(f"http://localhost:{PORT_VALID_MOCK}",
+                             rate_limits=limits)
+    start = time.monotonic()
+    for _ in range(5):
+        client.get_device_config_path("MOTOR_1", "heartbeatInterval")
+    # Writes are not limited
+    client.execute_slot("MOTOR_1", "divide")
+    assert time.monotonic() - start >= 0.18
+    stats = client.rate_limit_stats["read"]
+    assert stats.calls == 5
+    assert stats.delayed == 4
+    assert stats.max_wait == pytest.approx(0.05, abs=0.02)
+    assert list(client.rate_limit_stats) == ["read"]
+
+    limits = RateLimits(slots=RateLimit(rate=1), reject=True)
+    client = SyncKaraboProxy(f"http://localhost:{PORT_VALID_MOCK}",
+                             rate_limits=limits)
+    assert client.execute_slot("MOTOR_1", "divide").success
+    with pytest.raises(RateLimitExceeded, match="slot requests"):
+        client.execute_slot("MOTOR_1", "divide")
+    assert client.rate_limit_stats["slot"].rejected == 1
+
+
+@pytest.mark.asyncio
+async def test_async_rate_limit(web_proxy_mocks):
+    limits = RateLimits(reads=RateLimit(rate=50, burst=2))
+    async with AsyncKaraboProxy(f"http://localhost:{PORT_VALID_MOCK}",
+                                rate_limits=limits) as client:
+        start = time.monotonic()
+        await asyncio.gather(*(client.get_topology() for _ in range(7)))
+        # 2 at once, then 1 every 20 ms
+        assert time.monotonic() - start >= 0.09
+        assert client.rate_limit_stats["read"].delayed == 5
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_timeout(web_proxy_mocks):
+    # The wait for a token counts in the total timeout
+    limits = RateLimits(reads=RateLimit(rate=2))
+    url = f"http://localhost:{PORT_VALID_MOCK}"
+    async with AsyncKaraboProxy(url, rate_limits=limits) as client:
+        await client.get_topology()
+        start = time.monotonic()
+        with pytest.raises(TimeoutError, match="no complete response"):
+            await client.get_topology(timeout=0.2)
+        assert time.monotonic() - start < 0.4
+
+    client = SyncKaraboProxy(url, rate_limits=limits)
+    client.get_topology()
+    start = time.monotonic()
+    with pytest.raises(TimeoutError, match="no complete response"):
+        client.get_topology(timeout=0.2)
+    assert time.monotonic() - start < 0.1
+    # The token is given back: the next request waits for 1 token only
+    start = time.monotonic()
+    client.get_topology(timeout=1.0)
+    assert time.monotonic() - start == pytest.approx(0.5, abs=0.1)
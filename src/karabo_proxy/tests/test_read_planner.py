@@ -0,0 +1,87 @@
+import pytest
+
+from ..async_karabo_proxy import AsyncKaraboProxy
+from ..read_planner import FULL, PATHS, ReadPlanner
+from ..sync_karabo_proxy import SyncKaraboProxy
+from .mock_web_proxy import PORT_VALID_MOCK
+
+
+def test_read_planner():
+    planner = ReadPlanner(explore_every=0)
+    # Nothing known: learn the cost of a full read of several properties
+    assert planner.plan("A", 1).strategy == PATHS
+    plan = planner.plan("A", 5)
+    assert plan.strategy == FULL and plan.explored
+    planner.observe_full("A", 0.010, 1000)
+    # The path reads are learned next
+    assert planner.plan("A", 5).strategy == PATHS
+    planner.observe_path(0.002)
+    plan = planner.plan("A", 4)
+    assert (plan.strategy, plan.paths_cost, plan.full_cost) == (
+        PATHS, pytest.approx(0.008), pytest.approx(0.010))
+    assert not plan.explored
+    assert planner.plan("A", 6).strategy == FULL
+
+    # Devices never read whole are estimated from the others and their size
+    planner.observe_size("B", 100)
+    plan = planner.plan("B", 2)
+    assert plan.strategy == FULL
+    assert plan.full_cost == pytest.approx(0.001)
+    assert planner.plan("C", 6).full_cost == pytest.approx(0.010)
+
+    # Latencies are smoothed
+    planner.observe_full("A", 0.020, 1000)
+    assert planner.estimates("A") == (pytest.approx(0.002),
+                                      pytest.approx(0.012))
+    stats = planner.stats
+    assert stats.plans == 7
+    assert stats.strategies == {FULL: 4, PATHS: 3}
+    assert stats.last_plan.device_id == "C"
+
+
+def test_read_planner_exploration():
+    planner = ReadPlanner(explore_every=3)
+    planner.observe_full("A", 0.010, 1000)
+    planner.observe_path(0.001)
+    strategies = [planner.plan("A", 2).strategy for _ in range(6)]
+    assert strategies == [PATHS, PATHS, FULL, PATHS, PATHS, FULL]
+    assert planner.stats.explorations == 2
+
+
+def test_read_planner_max_devices():
+    planner = ReadPlanner(max_devices=2)
+    planner.observe_full("A", 0.010, 10)
+    planner.observe_full("B", 0.030, 10)
+    planner.plan("A", 2)
+    # B, the least recently used device, is dropped with its latency
+    planner.observe_size("C", 10)
+    assert list(planner._devices) == ["A", "C"]
+    assert planner.stats.evictions == 1
+    assert planner.estimates("B")[1] == pytest.approx(0.010)
+    assert planner.plan("C", 2).full_cost == pytest.approx(0.010)
+
+
+@pytest.mark.asyncio
+async def test_get_device_properties(web_proxy_mocks):
+    url = f"http://localhost:{PORT_VALID_MOCK}"
+    names = ["deviceId", "heartbeatInterval"]
+    with SyncKaraboProxy(url) as client:
+        properties = client.get_device_properties("MOTOR_1", names)
+        assert list(properties) == names
+        assert properties["heartbeatInterval"].value == 20
+        assert client.read_planner_stats.last_plan.strategy == FULL
+        client.get_device_properties("MOTOR_1", names)
+        assert client.read_planner_stats.last_plan.strategy == PATHS
+        path_latency, full_latency = client._read_planner.estimates(
+            "MOTOR_1")
+        assert path_latency > 0 and full_latency > 0
+    with SyncKaraboProxy(url) as client:
+        with pytest.raises(RuntimeError, match="'missing' not found"):
+            client.get_device_properties("MOTOR_1", ["deviceId", "missing"])
+
+    async with AsyncKaraboProxy(url, decoding="lazy") as client:
+        properties = await client.get_device_properties("MOTOR_1", names)
+        assert properties["heartbeatInterval"].value == 20
+        properties = await client.get_device_properties("MOTOR_1", names)
+        assert len(properties) == 2
+        assert client.read_planner_stats.strategies == {FULL: 1, PATHS: 1}
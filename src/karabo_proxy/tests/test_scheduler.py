@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+
+from ..async_karabo_proxy import AsyncKaraboProxy
+from ..scheduler import Priority, RequestScheduler, current_priority, priority
+from .mock_web_proxy import PORT_VALID_MOCK
+
+
+async def _run(scheduler, prio, name, order, delay=0.01):
+    async with scheduler.slot(prio):
+        order.append(name)
+        await asyncio.sleep(delay)
+
+
+def test_priority_context():
+    assert current_priority() is None
+    with priority(Priority.HIGH):
+        with priority(Priority.LOW, override=False):
+            assert current_priority() == Priority.HIGH
+        with priority(Priority.LOW):
+            assert current_priority() == Priority.LOW
+        assert current_priority() == Priority.HIGH
+    assert current_priority() is None
+
+
+@pytest.mark.asyncio
+async def test_scheduler_priority_order():
+    scheduler = RequestScheduler(max_in_flight=1, aging=100.0)
+    order = []
+    first = asyncio.ensure_future(_run(scheduler, Priority.LOW, "first",
+                                       order))
+    await asyncio.sleep(0)
+    tasks = [asyncio.ensure_future(_run(scheduler, prio, name, order))
+             for prio, name in ((Priority.LOW, "low"),
+                                (Priority.NORMAL, "normal"),
+                                (Priority.HIGH, "high"))]
+    await asyncio.sleep(0)
+    assert scheduler.stats[Priority.LOW].queued == 1
+    assert scheduler.stats[Priority.HIGH].max_queued == 1
+    await asyncio.gather(first, *tasks)
+    assert order == ["first", "high", "normal", "low"]
+    assert scheduler.in_flight == 0
+    assert all(stats.queued == 0 for stats in scheduler.stats.values())
+    assert scheduler.stats[Priority.LOW].dispatched == 2
+    assert scheduler.stats[Priority.LOW].max_wait >= 0.03
+
+
+@pytest.mark.asyncio
+async def test_scheduler_aging():
+    # A low priority request waiting long enough goes before the high
+    # priority requests arriving later
+    scheduler = RequestScheduler(max_in_flight=1, aging=0.01)
+    order = []
+    first = asyncio.ensure_future(_run(scheduler, Priority.HIGH, "first",
+                                       order, delay=0.05))
+    await asyncio.sleep(0)
+    low = asyncio.ensure_future(_run(scheduler, Priority.LOW, "low", order))
+    await asyncio.sleep(0.04)
+    high = asyncio.ensure_future(_run(scheduler, Priority.HIGH, "high",
+                                      order))
+    await asyncio.gather(first, low, high)
+    assert order == ["first", "low", "high"]
+
+
+@pytest.mark.asyncio
+async def test_scheduler_cancellation():
+    scheduler = RequestScheduler(max_in_flight=1)
+    order = []
+    first = asyncio.ensure_future(_run(scheduler, Priority.NORMAL, "first",
+                                       order, delay=0.05))
+    await asyncio.sleep(0)
+    cancelled = asyncio.ensure_future(_run(scheduler, Priority.HIGH,
+                                           "cancelled", order))
+    last = asyncio.ensure_future(_run(scheduler, Priority.LOW, "last",
+                                      order))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    await asyncio.gather(first, last)
+    assert order == ["first", "last"]
+    assert scheduler.in_flight == 0
+    assert scheduler.stats[Priority.HIGH].queued == 0
+    assert scheduler.stats[Priority.HIGH].dispatched == 0
+
+
+@pytest.mark.asyncio
+async def test_client_priorities(web_proxy_mocks):
+    scheduler = RequestScheduler(max_in_flight=1, aging=100.0)
+    async with AsyncKaraboProxy(f"http://localhost:{PORT_VALID_MOCK}",
+                                scheduler=scheduler) as client:
+        blocking = asyncio.ensure_future(
+            client.execute_slot("MOTOR_1", "sleep", {"seconds": 0.2}))
+        await asyncio.sleep(0.05)
+        with priority(Priority.LOW):
+            background = asyncio.ensure_future(client.get_topology())
+        await asyncio.sleep(0)
+        # Writes are HIGH by default
+        write = asyncio.ensure_future(client.execute_slot("MOTOR_1",
+                                                          "divide"))
+        done, _ = await asyncio.wait({background, write},
+                                     return_when=asyncio.FIRST_COMPLETED)
+        assert done == {write}
+        await asyncio.gather(blocking, background)
+        stats = client.scheduler_stats
+        assert stats["LOW"].dispatched == 1
+        assert stats["HIGH"].dispatched == 2
+        assert stats["LOW"].max_wait > stats["HIGH"].max_wait > 0.1
@@ -0,0 +1,79 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from ..schema_cache import MappedSchema, SchemaCache, schema_cache_key
+
+SCHEMA = {
+    "deviceId": {"displayedName": "DeviceID",
+                 "description": "The device instance ID",
+                 "assignment": "OPTIONAL"},
+    "heartbeatInterval": {"displayedName": "Heartbeat interval",
+                          "defaultValue": 20},
+    "näme": {"displayedName": "Non ASCII"},
+}
+
+
+def _put_schema(directory):
+    SchemaCache(directory).put("SimpleDevice", "abc", SCHEMA)
+
+
+def test_schema_cache_key():
+    assert schema_cache_key({"serverId": "A_SERVER"}) is None
+    class_id, fingerprint = schema_cache_key(
+        {"classId": "SimpleDevice", "serverId": "A_SERVER"})
+    assert class_id == "SimpleDevice"
+    # Same class served by another server gets a distinct fingerprint
+    _, other_fingerprint = schema_cache_key(
+        {"classId": "SimpleDevice", "serverId": "ANOTHER_SERVER"})
+    assert fingerprint != other_fingerprint
+
+
+def test_put_and_get(tmp_path):
+    cache = SchemaCache(str(tmp_path))
+    assert cache.get("SimpleDevice", "abc") is None
+    cache.put("SimpleDevice", "abc", SCHEMA)
+
+    # A new cache instance - as in another process - maps the file
+    schema = SchemaCache(str(tmp_path)).get("SimpleDevice", "abc")
+    assert isinstance(schema, MappedSchema)
+    assert list(schema.keys()) == list(SCHEMA.keys())
+    # Nothing is decoded until accessed
+    assert schema._decoded == {}
+    assert schema["heartbeatInterval"] == SCHEMA["heartbeatInterval"]
+    assert list(schema._decoded) == ["heartbeatInterval"]
+    assert dict(schema) == SCHEMA
+    assert cache.get("SimpleDevice", "other") is None
+
+
+def test_max_mapped(tmp_path):
+    cache = SchemaCache(str(tmp_path), max_mapped=2)
+    for fingerprint in ("a", "b", "c"):
+        cache.put("SimpleDevice", fingerprint, SCHEMA)
+    first = cache.get("SimpleDevice", "a")
+    cache.get("SimpleDevice", "b")
+    assert cache.get("SimpleDevice", "a") is first
+    # b, the least recently used mapping, is dropped
+    cache.get("SimpleDevice", "c")
+    assert list(cache._mapped) == [cache._path("SimpleDevice", "a"),
+                                   cache._path("SimpleDevice", "c")]
+    # Dropped mappings are mapped again on demand
+    assert dict(cache.get("SimpleDevice", "b")) == SCHEMA
+
+
+def test_invalid_files_are_misses(tmp_path):
+    cache = SchemaCache(str(tmp_path))
+    cache.put("SimpleDevice", "abc", SCHEMA)
+    path = cache._path("SimpleDevice", "abc")
+    with open(path, "r+b") as schema_file:
+        schema_file.truncate(os.path.getsize(path) - 5)
+    assert SchemaCache(str(tmp_path)).get("SimpleDevice", "abc") is None
+    open(path, "wb").close()
+    assert SchemaCache(str(tmp_path)).get("SimpleDevice", "abc") is None
+
+
+def test_concurrent_writers(tmp_path):
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        list(executor.map(_put_schema, [str(tmp_path)] * 8))
+    assert os.listdir(tmp_path) == ["SimpleDevice-abc.schema"]
+    assert dict(SchemaCache(str(tmp_path)).get("SimpleDevice", "abc")) == (
+        SCHEMA)
@@ -0,0 +1,73 @@
+import pytest
+
+from ..async_karabo_proxy import AsyncKaraboProxy
+from ..snapshot import (
+    ConfigurationSnapshot, restore_changes, snapshot_values,
+    writable_properties)
+from ..sync_karabo_proxy import SyncKaraboProxy
+from .mock_web_proxy import PORT_INVALID_MOCK, PORT_VALID_MOCK
+
+
+def test_diff():
+    before = ConfigurationSnapshot(configurations={
+        "DEV_1": {"a": 1, "b": [1.0, 2.0], "c": float("nan")},
+        "DEV_2": {"a": "x"},
+        "DEV_3": {"a": 1}})
+    after = ConfigurationSnapshot(configurations={
+        "DEV_1": {"a": 1, "b": [1.0, 3.0], "c": float("nan"), "d": 4},
+        "DEV_2": {"a": "x"},
+        "DEV_4": {}})
+    diff = before.diff(after)
+    assert diff
+    assert diff.changed == {"DEV_1": {"b": ([1.0, 2.0], [1.0, 3.0])}}
+    assert diff.only_before == ["DEV_3"]
+    assert diff.only_after == ["DEV_4"]
+    assert not before.diff(before)
+
+
+def test_restore_changes():
+    schema = {"a": {"accessMode": "RECONFIGURABLE"},
+              "b": {"accessMode": "READONLY"},
+              "c": {"accessMode": "RECONFIGURABLE"},
+              "d": {}}
+    assert writable_properties(schema) == ["a", "c"]
+    changes = restore_changes({"a": 1, "b": 2, "c": 3, "d": 4},
+                              {"a": 1, "b": 5, "c": 6, "d": 7},
+                              writable_properties(schema))
+    assert changes == {"c": 3}
+
+
+@pytest.mark.asyncio
+async def test_snapshot_and_restore(web_proxy_mocks):
+    async_cli = AsyncKaraboProxy(f"http://localhost:{PORT_VALID_MOCK}")
+    sync_cli = SyncKaraboProxy(f"http://localhost:{PORT_VALID_MOCK}")
+    device_ids = [f"DEVICE_{i}" for i in range(20)]
+
+    snapshot = await async_cli.get_configuration_snapshot(device_ids)
+    assert snapshot.device_ids == device_ids
+    assert snapshot.configurations["DEVICE_3"]["heartbeatInterval"] == 20
+    assert snapshot.errors == {}
+    # Matches the live state: nothing to restore
+    assert await async_cli.restore_configuration_snapshot(snapshot) == {}
+    assert not snapshot.diff(sync_cli.get_configuration_snapshot(device_ids))
+
+    # Only the reconfigurable properties that differ are restored
+    snapshot.configurations["DEVICE_1"]["heartbeatInterval"] = 30
+    snapshot.configurations["DEVICE_2"]["deviceId"] = "ANOTHER_ID"
+    results = await async_cli.restore_configuration_snapshot(snapshot)
+    assert list(results) == ["DEVICE_1"]
+    assert results["DEVICE_1"].success
+    results = sync_cli.restore_configuration_snapshot(snapshot)
+    assert list(results) == ["DEVICE_1"]
+    assert results["DEVICE_1"].success
+
+    # Devices whose configuration cannot be retrieved are reported
+    invalid_cli = SyncKaraboProxy(f"http://localhost:{PORT_INVALID_MOCK}")
+    snapshot = invalid_cli.get_configuration_snapshot(["DEVICE_1"])
+    assert snapshot.configurations == {}
+    assert "not online or not alive" in snapshot.errors["DEVICE_1"]
+
+
+def test_snapshot_values():
+    config = {"a": {"value": 1, "timestamp": 1.0, "tid": 0}}
+    assert snapshot_values(config) == {"a": 1}
@@ -0,0 +1,124 @@
+import asyncio
+from typing import List
+
+import pytest
+
+from ..async_karabo_proxy import AsyncKaraboProxy
+from ..subscriptions import (
+    SUBSCRIBE_POLLING, SUBSCRIBE_SSE, SUBSCRIBE_WEBSOCKET, PropertyChange,
+    Subscription, parse_change)
+from ..transports import AsyncTransport, EventStreamChannel
+from ..transports.aiohttp_transport import AiohttpTransport
+from .mock_web_proxy import PORT_INVALID_MOCK, PORT_VALID_MOCK, PUSHED_CHANGES
+
+KEYS = [("MOTOR_1", "actualPosition"), ("MOTOR_2", "actualPosition")]
+
+
+class _RequestOnlyTransport(AsyncTransport):
+    """A transport without push channels."""
+
+    def __init__(self):
+        self._transport = AiohttpTransport()
+
+    async def request(self, *args, **kwargs):
+        return await self._transport.request(*args, **kwargs)
+
+    async def close(self):
+        await self._transport.close()
+
+
+async def _take(subscription: Subscription, n: int) -> List[PropertyChange]:
+    changes = []
+    async for change in subscription:
+        changes.append(change)
+        if len(changes) == n:
+            break
+    return changes
+
+
+@pytest.mark.asyncio
+async def test_event_stream_channel():
+    async def lines():
+        for line in (b": comment\n", b"event: change\r\n", b"data: a\n",
+                     b"data:b\n", b"\n", b"\n", "data: c\n", "", b"data: d"):
+            yield line
+
+    closed = []
+
+    async def close():
+        closed.append(True)
+
+    channel = EventStreamChannel(lines(), close)
+    assert await channel.receive() == "a\nb"
+    assert await channel.receive() == "c"
+    # Unterminated event
+    assert await channel.receive() is None
+    await channel.close()
+    assert closed
+
+    with pytest.raises(RuntimeError, match="Invalid response format"):
+        parse_change('{"device_id": "A", "path": "x", "value": 1}')
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("transport,mode,expected", [
+    ("aiohttp", "auto", SUBSCRIBE_WEBSOCKET),
+    ("aiohttp", "sse", SUBSCRIBE_SSE),
+    ("httpx", "auto", SUBSCRIBE_SSE),
+])
+async def test_push_subscription(web_proxy_mocks, transport, mode, expected):
+    url = f"http://localhost:{PORT_VALID_MOCK}"
+    async with AsyncKaraboProxy(url, transport=transport) as client:
+        async with client.subscribe(KEYS, mode=mode,
+                                    reconnect_delay=0.01) as subscription:
+            changes = await asyncio.wait_for(
+                _take(subscription, 2 * (1 + 2 * PUSHED_CHANGES)), 10)
+        stats = subscription.stats
+    # The current values are read first
+    assert {(c.device_id, c.path) for c in changes[:2]} == set(KEYS)
+    assert {c.source for c in changes[:2]} == {SUBSCRIBE_POLLING}
+    assert [c.info.value for c in changes[:2]] == [28, 28]
+    pushed = changes[2:]
+    assert {c.source for c in pushed} == {expected}
+    for key in KEYS:
+        values = [c.info.value for c in pushed if (c.device_id, c.path) == key]
+        assert values == [*range(PUSHED_CHANGES), *range(PUSHED_CHANGES)]
+    assert stats.mode == expected
+    # The server closes the channels after pushing its changes
+    assert stats.reconnects >= 1
+    # The values read after reconnecting are older than the pushed ones
+    assert stats.duplicates >= 2
+    assert stats.fallbacks == ([SUBSCRIBE_WEBSOCKET]
+                               if transport == "httpx" else [])
+
+
+@pytest.mark.asyncio
+async def test_polling_subscription(web_proxy_mocks):
+    url = f"http://localhost:{PORT_VALID_MOCK}"
+    # The train id of the "tid1" property advances on every read
+    keys = [("POLLED_1", "tid1"), ("POLLED_1", "heartbeatInterval")]
+    async with AsyncKaraboProxy(url, transport=_RequestOnlyTransport()) as \
+            client:
+        async with client.subscribe(keys, poll_interval=0.01) as subscription:
+            changes = await asyncio.wait_for(_take(subscription, 4), 10)
+        stats = subscription.stats
+    assert stats.mode == SUBSCRIBE_POLLING
+    assert stats.fallbacks == [SUBSCRIBE_WEBSOCKET, SUBSCRIBE_SSE]
+    assert [c.path for c in changes[2:]] == ["tid1", "tid1"]
+    assert changes[2].info.tid < changes[3].info.tid
+    # The heartbeatInterval doesn't change
+    assert stats.duplicates >= 2 and stats.polls >= 3
+
+    url = f"http://localhost:{PORT_INVALID_MOCK}"
+    async with AsyncKaraboProxy(url) as client:
+        subscription = client.subscribe(KEYS, poll_interval=0.01)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(subscription.__anext__(), 0.5)
+        await subscription.close()
+    stats = subscription.stats
+    assert stats.fallbacks == [SUBSCRIBE_WEBSOCKET, SUBSCRIBE_SSE]
+    assert stats.errors > 2 and stats.changes == 0
+    assert "Invalid response format" in stats.last_error
+
+    with pytest.raises(ValueError, match="Unknown subscription mode"):
+        client.subscribe(KEYS, mode="long-polling")
@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+from ..async_karabo_proxy import AsyncKaraboProxy
+from ..decoding import DecodeOffload
+from ..sync_karabo_proxy import SyncKaraboProxy
+from ..tracing import Tracer
+from .mock_web_proxy import PORT_VALID_MOCK
+
+
+def _spans(path):
+    with open(path) as f:
+        events = json.load(f)["traceEvents"]
+    assert all(event["ph"] == "X" and event["dur"] >= 0 for event in events)
+    return [event["name"] for event in events]
+
+
+@pytest.mark.asyncio
+async def test_async_tracing(web_proxy_mocks, tmp_path):
+    path = tmp_path / "trace.json"
+    async with AsyncKaraboProxy(f"http://localhost:{PORT_VALID_MOCK}",
+                                tracer=Tracer(str(path))) as client:
+        await client.get_device_config_path("MOTOR_1", "heartbeatInterval")
+        await client.execute_slot("MOTOR_1", "divide", {"dividend": 3})
+    spans = _spans(path)
+    assert spans.count("get_device_config_path") == 1
+    assert spans.count("execute_slot") == 1
+    for phase in ("dns", "connect", "send", "wait", "receive", "request",
+                  "decode", "construct"):
+        assert phase in spans
+    # The connection is reused by the second request
+    assert spans.count("connect") == 1
+    assert spans.count("request") == 2
+
+    # The payloads decoded off the event loop are traced too
+    path = tmp_path / "offloaded.json"
+    async with AsyncKaraboProxy(f"http://localhost:{PORT_VALID_MOCK}",
+                                tracer=Tracer(str(path)),
+                                decode_offload=DecodeOffload(threshold=0)
+                                ) as client:
+        await client.get_device_configuration("MOTOR_1")
+    spans = _spans(path)
+    assert spans.count("decode") == 1
+    assert "construct" in spans
+
+
+@pytest.mark.parametrize("backend", ["requests", "urllib3", "httpx"])
+def test_sync_tracing(web_proxy_mocks, tmp_path, backend):
+    path = tmp_path / "trace.json"
+    with SyncKaraboProxy(f"http://localhost:{PORT_VALID_MOCK}",
+                         transport=backend,
+                         tracer=Tracer(str(path))) as client:
+        client.get_devices()
+        client.get_configuration_snapshot(["MOTOR_1", "MOTOR_2"])
+    spans = _spans(path)
+    assert spans.count("get_device_configuration") == 2
+    assert spans.count("decode") == 3
+    assert spans.count("wait") == spans.count("receive") == 3
+    if backend == "httpx":
+        # The connection phases are only traced with httpx and aiohttp
+        assert "connect" in spans
+
+
+def test_tracing_disabled():
+    client = SyncKaraboProxy("http://localhost")
+    assert "get_devices" not in vars(client)
+    assert client._transport.tracer is None
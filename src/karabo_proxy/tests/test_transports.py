@@ -0,0 +1,233 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import karabo_proxy
+
+from ..async_karabo_proxy import AsyncKaraboProxy
+from ..data.topology import TopologyInfo
+from ..sync_karabo_proxy import SyncKaraboProxy
+from ..transports import (
+    AsyncTransport, SyncTransport, Timeout, create_async_transport,
+    create_sync_transport)
+from .mock_web_proxy import PORT_VALID_MOCK
+
+# Port of the HTTP/2 (h2c) server of the prior knowledge test
+PORT_H2C = 8585
+
+
+def _imported_modules(statements: str) -> set:
+    """Returns the modules imported by a fresh interpreter after running the
+    given statements."""
+    package_parent = os.path.dirname(
+        os.path.dirname(os.path.abspath(karabo_proxy.__file__)))
+    output = subprocess.check_output(
+        [sys.executable, "-c",
+         f"import sys\n{statements}\nprint(' '.join(sys.modules))"],
+        cwd=package_parent, text=True)
+    return set(output.split())
+
+
+def test_lazy_imports():
+    modules = _imported_modules("import karabo_proxy")
+    for module in ("aiohttp", "requests", "numpy", "orjson",
+                   "multiprocessing", "concurrent.futures"):
+        assert module not in modules
+
+    modules = _imported_modules(
+        "from karabo_proxy import SyncKaraboProxy\n"
+        "SyncKaraboProxy('http://localhost')")
+    assert "requests" in modules
+    assert "aiohttp" not in modules
+    # Only the alignment of samples uses NumPy
+    assert "numpy" not in modules
+    # Nor does the sync client need the async helpers, the process pools of
+    # the decoding offload or orjson before encoding a payload. Of the
+    # backends, httpx imports asyncio itself.
+    for module in ("asyncio", "multiprocessing",
+                   "concurrent.futures.process", "orjson"):
+        assert module not in modules
+
+    modules = _imported_modules(
+        "from karabo_proxy import AsyncKaraboProxy\n"
+        "AsyncKaraboProxy('http://localhost')")
+    assert "aiohttp" in modules
+    assert "requests" not in modules
+    assert "numpy" not in modules
+
+
+def test_create_transport():
+    transport = create_sync_transport()
+    assert create_sync_transport(transport) is transport
+    assert isinstance(create_async_transport(), AsyncTransport)
+    with pytest.raises(ValueError, match="Unknown transport backend"):
+        create_sync_transport("aiohttp")
+    with pytest.raises(ValueError, match="Unknown transport backend"):
+        create_async_transport("requests")
+
+
+# Backend name -> module required by the backend
+SYNC_BACKENDS = {"requests": "requests", "httpx": "httpx",
+                 "urllib3": "urllib3", "http2": "h2"}
+ASYNC_BACKENDS = {"aiohttp": "aiohttp", "httpx": "httpx", "http2": "h2"}
+
+
+@pytest.mark.parametrize("backend", SYNC_BACKENDS)
+def test_sync_backends(web_proxy_mocks, backend):
+    pytest.importorskip(SYNC_BACKENDS[backend])
+    with SyncKaraboProxy(f"http://localhost:{PORT_VALID_MOCK}",
+                         transport=backend) as client:
+        assert isinstance(client._transport, SyncTransport)
+        assert type(client.get_topology()) is TopologyInfo
+        result = client.execute_slot(
+            "MOTOR_1", "divide", {"dividend": 15, "divisor": 6})
+        assert result.reply["quotient"] == 2
+        with pytest.raises(TimeoutError, match="Timeout execute slot sleep"):
+            client.execute_slot("any_works", "sleep", {"seconds": 1},
+                                timeout=0.2)
+        with pytest.raises(TimeoutError):
+            client.execute_slot("any_works", "sleep", {"seconds": 1},
+                                timeout=Timeout(read=0.2))
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("backend", ASYNC_BACKENDS)
+async def test_async_backends(web_proxy_mocks, backend):
+    pytest.importorskip(ASYNC_BACKENDS[backend])
+    async with AsyncKaraboProxy(f"http://localhost:{PORT_VALID_MOCK}",
+                                transport=backend) as client:
+        assert type(await client.get_topology()) is TopologyInfo
+        result = await client.execute_slot(
+            "MOTOR_1", "divide", {"dividend": 15, "divisor": 6})
+        assert result.reply["quotient"] == 2
+        with pytest.raises(TimeoutError, match="Timeout execute slot sleep"):
+            await client.execute_slot("any_works", "sleep", {"seconds": 1},
+                                      timeout=0.2)
+        with pytest.raises(TimeoutError):
+            await client.execute_slot("any_works", "sleep", {"seconds": 1},
+                                      timeout=Timeout(read=0.2))
+
+
+@pytest.mark.asyncio
+async def test_http2_fallback(web_proxy_mocks):
+    pytest.importorskip("h2")
+    # The mock only speaks HTTP/1.1: the first request falls back to it
+    # and all of the following go straight to HTTP/1.1.
+    url = f"http://localhost:{PORT_VALID_MOCK}"
+    async with AsyncKaraboProxy(url, transport="http2") as client:
+        await client.get_topology()
+        fallback = client._transport._fallback
+        assert fallback._http1_origins == {url}
+        assert fallback._h2_origins == set()
+        assert type(await client.get_topology()) is TopologyInfo
+
+
+@pytest.mark.asyncio
+async def test_http2_fallback_safe_methods(web_proxy_mocks):
+    pytest.importorskip("h2")
+    # Slots aren't executed over HTTP/2 until the origin is known to speak it
+    url = f"http://localhost:{PORT_VALID_MOCK}"
+    async with AsyncKaraboProxy(url, transport="http2") as client:
+        result = await client.execute_slot("MOTOR_1", "divide",
+                                           {"dividend": 15, "divisor": 6})
+        assert result.reply == {"quotient": 2, "remainder": 3}
+        fallback = client._transport._fallback
+        assert fallback._http1_origins == set()
+        assert fallback._h2_origins == set()
+        await client.get_topology()
+        assert fallback._http1_origins == {url}
+
+
+def test_http2_fallback_origins():
+    pytest.importorskip("h2")
+    from httpx import URL
+
+    from ..transports.httpx_transport import _Http2Fallback
+
+    fallback = _Http2Fallback()
+    h2c, http1 = URL("http://h2c:80/a"), URL("http://http1:80/a")
+    assert fallback.use_prior_knowledge("GET", h2c)
+    assert not fallback.use_prior_knowledge("PUT", h2c)
+    assert not fallback.use_prior_knowledge("GET", URL("https://h2c/a"))
+    fallback.on_success(h2c)
+    assert fallback.use_prior_knowledge("PUT", h2c)
+    # A lost connection of an HTTP/2 origin isn't a rejection
+    assert not fallback.should_fall_back(h2c)
+    assert fallback.use_prior_knowledge("GET", h2c)
+    assert fallback.should_fall_back(http1)
+    assert not fallback.use_prior_knowledge("GET", http1)
+
+
+async def _h2c_app(scope, receive, send):
+    if scope["type"] != "http":
+        return
+    await send({"type": "http.response.start", "status": 200,
+                "headers": [(b"content-type", b"application/json")]})
+    await send({"type": "http.response.body",
+                "body": json.dumps({"http_version": scope["http_version"]
+                                    }).encode()})
+
+
+@pytest.mark.asyncio
+async def test_http2_prior_knowledge():
+    pytest.importorskip("h2")
+    hypercorn_asyncio = pytest.importorskip("hypercorn.asyncio")
+    from hypercorn.config import Config
+
+    config = Config()
+    config.bind = [f"127.0.0.1:{PORT_H2C}"]
+    shutdown = asyncio.Event()
+    server = asyncio.ensure_future(hypercorn_asyncio.serve(
+        _h2c_app, config, shutdown_trigger=shutdown.wait))
+    transport = create_async_transport("http2")
+    try:
+        url = f"http://127.0.0.1:{PORT_H2C}/"
+        for _ in range(100):
+            try:
+                _, writer = await asyncio.open_connection(
+                    "127.0.0.1", PORT_H2C)
+            except OSError:
+                await asyncio.sleep(0.05)
+            else:
+                writer.close()
+                break
+        resp = await transport.request("GET", url, {})
+        # The server speaks HTTP/2: the request isn't sent again
+        assert json.loads(resp.body) == {"http_version": "2"}
+        fallback = transport._fallback
+        assert fallback._h2_origins == {url[:-1]}
+        assert fallback._http1_origins == set()
+        # Known to speak HTTP/2, the origin gets the other methods over it
+        resp = await transport.request("PUT", url, {}, b"{}")
+        assert json.loads(resp.body) == {"http_version": "2"}
+    finally:
+        await transport.close()
+        shutdown.set()
+        await server
+
+
+@pytest.mark.asyncio
+async def test_async_warm_up(web_proxy_mocks):
+    async with AsyncKaraboProxy(
+            f"http://localhost:{PORT_VALID_MOCK}") as client:
+        metrics = await client.warm_up(connections=3)
+        assert metrics.connections == 3
+        assert not metrics.errors
+        assert metrics.latencies == sorted(metrics.latencies)
+        connector = client._transport._session.connector
+        # The connections are kept alive for the following requests
+        assert sum(len(conns) for conns in connector._conns.values()) == 3
+        assert type(await client.get_topology()) is TopologyInfo
+
+
+def test_sync_warm_up(web_proxy_mocks):
+    with SyncKaraboProxy(f"http://localhost:{PORT_VALID_MOCK}") as client:
+        metrics = client.warm_up(connections=2)
+        assert metrics.connections == 2
+    metrics = SyncKaraboProxy("http://localhost:1").warm_up(connections=2)
+    assert metrics.connections == 0
+    assert len(metrics.errors) == 2
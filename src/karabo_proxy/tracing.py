@@ -0,0 +1,196 @@
+#
+# Tracing of the operations of the clients in the Chrome trace event format,
+# viewable with chrome://tracing or https://ui.perfetto.dev.
+#
+# Tracing costs nothing when disabled: the clients only instrument their
+# methods when created with a Tracer.
+#
+import functools
+import inspect
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from contextvars import ContextVar, Token
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Time the current operation's payload was decoded, as given by
+# time.perf_counter_ns; the rest of the operation is the construction of its
+# result.
+_decoded_at = ContextVar("_decoded_at", default=None)
+
+# Category of the spans of the client methods and of their phases
+CATEGORY_OPERATION = "operation"
+CATEGORY_PHASE = "phase"
+
+
+class Tracer:
+    """Records spans and writes them to a file in the Chrome trace event
+    format.
+
+    Spans are recorded per thread or, in the async client, per task, so
+    that the spans of concurrent operations don't overlap in the viewer.
+
+    Parameters:
+    path(str): the file the trace is written to by save - and when closing
+    the client.
+
+    max_events(int): the maximum number of spans kept; later spans are
+    dropped.
+    """
+
+    def __init__(self, path: str, max_events: int = 1_000_000):
+        self.path = path
+        self.max_events = max_events
+        self.dropped = 0
+        self._events: List[Dict[str, Any]] = []
+        self._pid = os.getpid()
+        self._origin = time.perf_counter_ns()
+        self._lock = threading.Lock()
+        # Thread or task -> small integer identifying it in the trace
+        self._track_ids: Dict[int, int] = {}
+
+    def add_span(self, name: str, category: str, start: int, end: int,
+                 args: Optional[Dict[str, Any]] = None):
+        """Records a span from start to end, as given by
+        time.perf_counter_ns."""
+        if len(self._events) >= self.max_events:
+            self.dropped += 1
+            return
+        event = {"name": name, "cat": category, "ph": "X",
+                 "ts": (start - self._origin) / 1000,
+                 "dur": (end - start) / 1000,
+                 "pid": self._pid, "tid": self._track_id()}
+        if args:
+            event["args"] = args
+        self._events.append(event)
+
+    @property
+    def events(self) -> List[Dict[str, Any]]:
+        return list(self._events)
+
+    def save(self):
+        """Writes the spans recorded so far to the trace file."""
+        with self._lock:
+            trace = {"traceEvents": list(self._events),
+                     "displayTimeUnit": "ms"}
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(trace, f)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def _track_id(self) -> int:
+        # Without asyncio imported - e.g. by the sync client - there is no
+        # task to trace
+        asyncio = sys.modules.get("asyncio")
+        try:
+            task = asyncio.current_task() if asyncio is not None else None
+        except RuntimeError:
+            task = None
+        key = id(task) if task is not None else threading.get_ident()
+        track_id = self._track_ids.get(key)
+        if track_id is None:
+            with self._lock:
+                track_id = self._track_ids.setdefault(
+                    key, len(self._track_ids) + 1)
+        return track_id
+
+
+# The methods of the clients traced as operations
+TRACED_OPERATIONS = [
+    "warm_up", "get_topology", "get_devices", "get_device_configuration",
+    "set_device_configuration", "get_device_config_path",
+    "get_device_properties",
+    "set_device_config_path", "get_device_schema", "execute_slot",
+    "add_injected_property", "get_injected_property",
+    "set_injected_property", "delete_injected_property",
+    "add_injected_properties", "get_injected_properties",
+    "set_injected_properties", "delete_injected_properties",
+    "get_configuration_snapshot", "restore_configuration_snapshot",
+    "execute_slots", "read_aligned",
+]
+
+
+class PhaseTimes:
+    """Collects the phases of an HTTP request from the hooks of an HTTP
+    library and records them as spans."""
+
+    def __init__(self):
+        self._starts: Dict[str, int] = {}
+        self._spans: List[Tuple[str, int, int]] = []
+
+    def start(self, phase: str):
+        self._starts[phase] = time.perf_counter_ns()
+
+    def end(self, phase: str):
+        start = self._starts.pop(phase, None)
+        if start is not None:
+            self._spans.append((phase, start, time.perf_counter_ns()))
+
+    def record(self, tracer: "Tracer"):
+        for phase, start, end in self._spans:
+            tracer.add_span(phase, CATEGORY_PHASE, start, end)
+
+
+def instrument(client: Any, tracer: Tracer):
+    """Replaces the methods of a client - only on that instance - by
+    versions recording spans: one per operation, the HTTP request and the
+    decoding of its payload as phases of the operation, and the
+    construction of the result once the payload has been decoded."""
+    for name in TRACED_OPERATIONS:
+        setattr(client, name, _traced(getattr(client, name), name,
+                                      CATEGORY_OPERATION, tracer))
+    client._request = _traced(client._request, "request", CATEGORY_PHASE,
+                              tracer)
+    # The async client decodes the large payloads off its event loop
+    for name in ("_handle_get_response", "_handle_write_response",
+                 "_decode_offloaded"):
+        if hasattr(client, name):
+            setattr(client, name, _traced(getattr(client, name), "decode",
+                                          CATEGORY_PHASE, tracer))
+
+
+def _traced(method: Callable, name: str, category: str,
+            tracer: Tracer) -> Callable:
+    is_operation = category == CATEGORY_OPERATION
+
+    def begin() -> Tuple[int, Optional[Token]]:
+        return (time.perf_counter_ns(),
+                _decoded_at.set(None) if is_operation else None)
+
+    def finish(start: int, token: Optional[Token]):
+        end = time.perf_counter_ns()
+        if is_operation:
+            decoded_at = _decoded_at.get()
+            if decoded_at is not None:
+                tracer.add_span("construct", CATEGORY_PHASE, decoded_at, end)
+            _decoded_at.reset(token)
+        elif name == "decode":
+            _decoded_at.set(end)
+        tracer.add_span(name, category, start, end)
+
+    if inspect.iscoroutinefunction(method):
+        @functools.wraps(method)
+        async def traced_coroutine(*args, **kwargs):
+            start, token = begin()
+            try:
+                return await method(*args, **kwargs)
+            finally:
+                finish(start, token)
+        return traced_coroutine
+
+    @functools.wraps(method)
+    def traced(*args, **kwargs):
+        start, token = begin()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            finish(start, token)
+    return traced
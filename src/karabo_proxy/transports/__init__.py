@@ -0,0 +1,252 @@
+#
+# HTTP transports used by the Sync and Async WebProxy clients.
+#
+# The backends are only imported when a transport using them is created, so
+# that the cost of importing an HTTP library is only paid by the processes
+# that actually use it.
+#
+import importlib
+import time
+from dataclasses import dataclass, field
+from typing import (
+    AsyncIterable, Awaitable, Callable, Dict, List, Optional, Tuple, Union)
+
+# Backend name -> (module in this package, transport class)
+_ASYNC_BACKENDS = {
+    "aiohttp": ("aiohttp_transport", "AiohttpTransport"),
+    "httpx": ("httpx_transport", "HttpxAsyncTransport"),
+    "http2": ("httpx_transport", "Http2AsyncTransport"),
+}
+
+_SYNC_BACKENDS = {
+    "requests": ("requests_transport", "RequestsTransport"),
+    "httpx": ("httpx_transport", "HttpxSyncTransport"),
+    "urllib3": ("urllib3_transport", "Urllib3Transport"),
+    "http2": ("httpx_transport", "Http2SyncTransport"),
+}
+
+DEFAULT_ASYNC_BACKEND = "aiohttp"
+DEFAULT_SYNC_BACKEND = "requests"
+
+
+@dataclass(frozen=True)
+class Timeout:
+    """Timeouts, in seconds, of an HTTP request; None disables a timeout.
+
+    total: time to receive the whole response.
+    connect: time to establish a connection with the server.
+    read: time between receiving any two chunks of data from the server.
+    """
+    total: Optional[float] = None
+    connect: Optional[float] = None
+    read: Optional[float] = None
+
+    def socket_timeouts(self) -> Tuple[Optional[float], Optional[float]]:
+        """The (connect, read) timeouts bounded by the total timeout, for
+        backends that don't support a total timeout."""
+        return (_min_timeout(self.connect, self.total),
+                _min_timeout(self.read, self.total))
+
+
+TimeoutArg = Union[Timeout, float, None]
+
+
+def as_timeout(timeout: TimeoutArg) -> Optional[Timeout]:
+    """Converts a timeout argument - a Timeout or a number of seconds for the
+    total timeout - to a Timeout."""
+    if timeout is None or isinstance(timeout, Timeout):
+        return timeout
+    return Timeout(total=float(timeout))
+
+
+@dataclass
+class TransportResponse:
+    """Status and body of the response to an HTTP request."""
+    status: int
+    reason: str
+    body: bytes
+
+
+@dataclass
+class WarmUpMetrics:
+    """Outcome of warming up the connections of a client."""
+    # Number of connections opened
+    connections: int = 0
+    # Duration of the warm-up, in seconds
+    elapsed: float = 0.0
+    # Durations of the successful warm-up requests, in seconds, from the
+    # fastest to the slowest
+    latencies: List[float] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+
+
+class PushChannel:
+    """A channel of the messages pushed by a server - the events of a
+    server-sent events stream or the messages of a websocket."""
+
+    async def send(self, message: str):
+        """Sends a message to the server, if the channel is bidirectional."""
+        raise NotImplementedError
+
+    async def receive(self) -> Optional[str]:
+        """The next message, or None once the server closed the channel.
+
+        Raises ConnectionError if the connection is lost."""
+        raise NotImplementedError
+
+    async def close(self):
+        """Closes the channel."""
+
+
+class EventStreamChannel(PushChannel):
+    """PushChannel of a server-sent events stream read line by line; the
+    data of each event is a message, the other fields are ignored."""
+
+    def __init__(self, lines: AsyncIterable[Union[bytes, str]],
+                 close: Callable[[], Awaitable[None]]):
+        self._lines = lines.__aiter__()
+        self._close = close
+
+    async def receive(self) -> Optional[str]:
+        data = []
+        async for line in self._lines:
+            if isinstance(line, bytes):
+                line = line.decode("utf-8")
+            line = line.rstrip("\r\n")
+            if not line:
+                # Blank lines dispatch the events
+                if data:
+                    return "\n".join(data)
+                continue
+            name, _, value = line.partition(":")
+            if name == "data":
+                data.append(value[1:] if value.startswith(" ") else value)
+        # An event not terminated by a blank line is dropped
+        return None
+
+    async def close(self):
+        await self._close()
+
+
+class AsyncTransport:
+    """Interface of the transports used by the AsyncKaraboProxy."""
+
+    # Tracer the transport records the phases of its requests to, if it
+    # supports it - see karabo_proxy.tracing
+    tracer = None
+
+    async def request(self, method: str, url: str, headers: Dict[str, str],
+                      body: Optional[bytes] = None,
+                      timeout: Optional[Timeout] = None) -> TransportResponse:
+        """Sends an HTTP request and returns its response once its body has
+        been fully received.
+
+        Raises TimeoutError if the connect or read timeouts expire; the total
+        timeout is enforced by the client. Without a timeout, the backend's
+        default timeouts apply."""
+        raise NotImplementedError
+
+    def timed_out(self, method: str, url: str, body: Optional[bytes],
+                  start: float):
+        """Called by the client when its total timeout cancelled a request
+        sent at start, as given by time.monotonic. Other cancellations, e.g.
+        of the losing request of a hedged pair, are not notified."""
+
+    async def open_event_stream(
+            self, url: str, headers: Dict[str, str],
+            timeout: Optional[Timeout] = None) -> PushChannel:
+        """Opens a server-sent events stream.
+
+        Raises NotImplementedError if the transport doesn't support it and
+        RuntimeError if the server doesn't answer with an event stream."""
+        raise NotImplementedError
+
+    async def open_websocket(
+            self, url: str, headers: Dict[str, str],
+            timeout: Optional[Timeout] = None) -> PushChannel:
+        """Opens a websocket - url is the http(s) URL of its handshake.
+
+        Raises NotImplementedError if the transport doesn't support it and
+        RuntimeError if the server refuses the handshake."""
+        raise NotImplementedError
+
+    async def close(self):
+        """Releases the connections held by the transport."""
+
+
+class SyncTransport:
+    """Interface of the transports used by the SyncKaraboProxy."""
+
+    # Tracer the transport records the phases of its requests to, if it
+    # supports it - see karabo_proxy.tracing
+    tracer = None
+
+    def request(self, method: str, url: str, headers: Dict[str, str],
+                body: Optional[bytes] = None,
+                timeout: Optional[Timeout] = None) -> TransportResponse:
+        """Sends an HTTP request and returns its response once its body has
+        been fully received.
+
+        Raises TimeoutError if any of the timeouts expire. Without a timeout,
+        the backend's default timeouts apply."""
+        raise NotImplementedError
+
+    def close(self):
+        """Releases the connections held by the transport."""
+
+
+def create_async_transport(
+        transport: Union[str, AsyncTransport, None] = None) -> AsyncTransport:
+    """Returns the given transport or a new instance of the transport of a
+    backend given by name ("aiohttp", "httpx" or "http2")."""
+    if isinstance(transport, AsyncTransport):
+        return transport
+    return _load_backend(_ASYNC_BACKENDS,
+                         transport or DEFAULT_ASYNC_BACKEND)()
+
+
+def create_sync_transport(
+        transport: Union[str, SyncTransport, None] = None) -> SyncTransport:
+    """Returns the given transport or a new instance of the transport of a
+    backend given by name ("requests", "httpx", "urllib3" or "http2")."""
+    if isinstance(transport, SyncTransport):
+        return transport
+    return _load_backend(_SYNC_BACKENDS,
+                         transport or DEFAULT_SYNC_BACKEND)()
+
+
+def check_total_timeout(timeout: Optional[Timeout], start: float):
+    """Raises TimeoutError if the total timeout of a request started at start
+    (as given by time.monotonic) expired."""
+    if (timeout is not None and timeout.total is not None
+            and time.monotonic() - start > timeout.total):
+        raise TimeoutError(
+            f"No complete response within {timeout.total} s")
+
+
+def is_event_stream(status: int, content_type: Optional[str]) -> bool:
+    """Whether a response opens a server-sent events stream."""
+    return status == 200 and (content_type or "").split(";")[0].strip() == (
+        "text/event-stream")
+
+
+def _min_timeout(timeout: Optional[float],
+                 total: Optional[float]) -> Optional[float]:
+    if timeout is None:
+        return total
+    if total is None:
+        return timeout
+    return min(timeout, total)
+
+
+def _load_backend(backends: Dict[str, tuple], name: str) -> type:
+    if name not in backends:
+        raise ValueError(f"Unknown transport backend '{name}': supported "
+                         f"backends are {', '.join(backends)}.")
+    module_name, class_name = backends[name]
+    try:
+        module = importlib.import_module(f".{module_name}", __name__)
+    except ImportError as ie:
+        raise ImportError(f"Transport backend '{name}' is not available: "
+                          f"{ie}. Please install '{ie.name}'.") from ie
+    return getattr(module, class_name)
@@ -0,0 +1,228 @@
+import asyncio
+from typing import Any, AsyncGenerator, Dict, Optional
+
+from aiohttp import (
+    AsyncResolver, ClientError, ClientSession, ClientTimeout,
+    ClientWebSocketResponse, TCPConnector, ThreadedResolver, TraceConfig,
+    WSMsgType, WSServerHandshakeError)
+
+from ..tracing import PhaseTimes
+from . import (
+    AsyncTransport, EventStreamChannel, PushChannel, Timeout,
+    TransportResponse, is_event_stream)
+
+# Time, in seconds, host name resolutions are cached by default
+DNS_CACHE_TTL = 300.0
+
+
+class AiohttpTransport(AsyncTransport):
+    """Transport based on aiohttp.
+
+    The transport keeps a session - and its pool of keep-alive connections -
+    per event loop. The session is closed when the transport is closed or
+    when its event loop shuts down, e.g. at the end of asyncio.run; if the
+    transport is then used from a new event loop a new session is created.
+
+    Host names are resolved asynchronously with aiodns, if installed, and the
+    resolutions are cached.
+
+    Parameters:
+    dns_ttl(float): the time, in seconds, host name resolutions are cached;
+    None caches them forever. Ignored if session_kwargs has a connector.
+
+    session_kwargs: extra keyword arguments for the aiohttp ClientSession.
+    """
+
+    def __init__(self, dns_ttl: Optional[float] = DNS_CACHE_TTL,
+                 **session_kwargs: Any):
+        self._dns_ttl = dns_ttl
+        self._session_kwargs = session_kwargs
+        self._session: Optional[ClientSession] = None
+        self._session_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._session_closer: Optional[AsyncGenerator[None, None]] = None
+
+    async def request(self, method: str, url: str, headers: Dict[str, str],
+                      body: Optional[bytes] = None,
+                      timeout: Optional[Timeout] = None) -> TransportResponse:
+        session = await self._get_session()
+        kwargs = {}
+        phases = None
+        if self.tracer is not None:
+            phases = kwargs["trace_request_ctx"] = PhaseTimes()
+        if timeout is not None:
+            kwargs["timeout"] = ClientTimeout(
+                total=None, connect=timeout.connect, sock_read=timeout.read)
+        # aiohttp's timeout errors derive from asyncio.TimeoutError, which is
+        # only the builtin TimeoutError since Python 3.11.
+        try:
+            async with session.request(method, url, headers=headers,
+                                       data=body, **kwargs) as resp:
+                resp_body = await resp.read()
+                if phases is not None:
+                    phases.end("receive")
+                    phases.record(self.tracer)
+                return TransportResponse(status=resp.status,
+                                         reason=str(resp.reason),
+                                         body=resp_body)
+        except asyncio.TimeoutError as te:
+            raise TimeoutError(str(te) or "Request timed out") from te
+
+    async def open_event_stream(
+            self, url: str, headers: Dict[str, str],
+            timeout: Optional[Timeout] = None) -> PushChannel:
+        session = await self._get_session()
+        # The stream is open-ended: only the connection is timed out
+        connect = timeout.connect if timeout is not None else None
+        try:
+            resp = await session.get(
+                url, headers={**headers, "accept": "text/event-stream"},
+                timeout=ClientTimeout(total=None, connect=connect))
+        except asyncio.TimeoutError as te:
+            raise TimeoutError(str(te) or "Request timed out") from te
+        except ClientError as ce:
+            raise ConnectionError(str(ce)) from ce
+        if not is_event_stream(resp.status, resp.headers.get("content-type")):
+            resp.release()
+            raise RuntimeError(f"No event stream: {resp.reason} "
+                               f"({resp.status})")
+
+        async def close():
+            resp.close()
+
+        return EventStreamChannel(_lines(resp.content), close)
+
+    async def open_websocket(
+            self, url: str, headers: Dict[str, str],
+            timeout: Optional[Timeout] = None) -> PushChannel:
+        session = await self._get_session()
+        try:
+            websocket = await session.ws_connect(url, headers=headers)
+        except WSServerHandshakeError as he:
+            raise RuntimeError(f"No websocket: {he.message} "
+                               f"({he.status})") from he
+        except asyncio.TimeoutError as te:
+            raise TimeoutError(str(te) or "Request timed out") from te
+        except ClientError as ce:
+            raise ConnectionError(str(ce)) from ce
+        return _WebSocketChannel(websocket)
+
+    async def close(self):
+        if self._session_closer is not None:
+            await self._session_closer.aclose()
+        self._session = None
+        self._session_loop = None
+        self._session_closer = None
+
+    async def _get_session(self) -> ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session_loop is not loop or self._session.closed:
+            await self.close()
+            session_kwargs = dict(self._session_kwargs)
+            if "connector" not in session_kwargs:
+                session_kwargs["connector"] = TCPConnector(
+                    resolver=_create_resolver(), use_dns_cache=True,
+                    ttl_dns_cache=self._dns_ttl)
+            if self.tracer is not None:
+                session_kwargs["trace_configs"] = [
+                    *session_kwargs.get("trace_configs", []),
+                    _phases_trace_config()]
+            self._session = ClientSession(**session_kwargs)
+            self._session_loop = loop
+            # The event loop finalizes its pending asynchronous generators
+            # when shutting down, which closes the session.
+            self._session_closer = _close_on_shutdown(self._session)
+            await self._session_closer.__anext__()
+        return self._session
+
+
+class _WebSocketChannel(PushChannel):
+
+    def __init__(self, websocket: ClientWebSocketResponse):
+        self._websocket = websocket
+
+    async def send(self, message: str):
+        try:
+            await self._websocket.send_str(message)
+        except ClientError as ce:
+            raise ConnectionError(str(ce)) from ce
+
+    async def receive(self) -> Optional[str]:
+        while True:
+            message = await self._websocket.receive()
+            if message.type == WSMsgType.TEXT:
+                return message.data
+            if message.type == WSMsgType.BINARY:
+                return message.data.decode("utf-8")
+            if message.type == WSMsgType.ERROR:
+                raise ConnectionError(str(self._websocket.exception()))
+            if message.type in (WSMsgType.CLOSE, WSMsgType.CLOSING,
+                                WSMsgType.CLOSED):
+                return None
+
+    async def close(self):
+        await self._websocket.close()
+
+
+async def _lines(content) -> AsyncGenerator[bytes, None]:
+    """The lines of a response body, as they are received."""
+    try:
+        async for line in content:
+            yield line
+    except ClientError as ce:
+        raise ConnectionError(str(ce)) from ce
+
+
+def _phases_trace_config() -> TraceConfig:
+    """Collects the phases of the requests in the PhaseTimes passed as their
+    trace_request_ctx."""
+    def on(callback):
+        async def handler(session, context, params):
+            if isinstance(context.trace_request_ctx, PhaseTimes):
+                callback(context.trace_request_ctx)
+        return handler
+
+    def on_connected(phases: PhaseTimes):
+        phases.end("connect")
+        phases.start("send")
+
+    def on_sent(phases: PhaseTimes):
+        # The headers are sent before the body, if any
+        phases.end("send")
+        phases.start("wait")
+
+    def on_response(phases: PhaseTimes):
+        phases.end("wait")
+        phases.start("receive")
+
+    trace_config = TraceConfig()
+    trace_config.on_request_start.append(on(lambda p: p.start("send")))
+    trace_config.on_connection_queued_start.append(
+        on(lambda p: p.start("queueing")))
+    trace_config.on_connection_queued_end.append(
+        on(lambda p: p.end("queueing")))
+    trace_config.on_connection_create_start.append(
+        on(lambda p: p.start("connect")))
+    trace_config.on_connection_create_end.append(on(on_connected))
+    trace_config.on_dns_resolvehost_start.append(on(lambda p: p.start("dns")))
+    trace_config.on_dns_resolvehost_end.append(on(lambda p: p.end("dns")))
+    trace_config.on_request_headers_sent.append(on(on_sent))
+    trace_config.on_request_chunk_sent.append(on(on_sent))
+    trace_config.on_request_end.append(on(on_response))
+    trace_config.freeze()
+    return trace_config
+
+
+def _create_resolver():
+    try:
+        return AsyncResolver()
+    except RuntimeError:
+        # aiodns is not installed
+        return ThreadedResolver()
+
+
+async def _close_on_shutdown(
+        session: ClientSession) -> AsyncGenerator[None, None]:
+    try:
+        yield
+    finally:
+        await session.close()
@@ -0,0 +1,298 @@
+#
+# Recording of the requests of a client and their responses, with their
+# latencies, to a cassette file, and replay of the cassette by a transport
+# that needs no network - for reproducible benchmarks of the clients.
+#
+# Cassettes are gzipped json lines: a header line followed by a line per
+# interaction. The headers of the requests - holding the access token - are
+# not recorded, and request bodies are only recorded as a digest, which is
+# enough to tell apart writes of different values.
+#
+import asyncio
+import base64
+import gzip
+import hashlib
+import json
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+from . import (
+    AsyncTransport, SyncTransport, Timeout, TransportResponse,
+    create_async_transport, create_sync_transport)
+
+CASSETTE_VERSION = 1
+
+# Reason of the responses to the requests missing from a cassette
+NOT_RECORDED = "Not Recorded"
+
+
+@dataclass
+class Interaction:
+    """A request and its response."""
+    method: str
+    # Path and query of the URL of the request
+    path: str
+    # Digest of the body of the request, if any
+    body_digest: Optional[str]
+    # None if the request timed out
+    status: Optional[int]
+    reason: str
+    body: bytes
+    # When the request was sent, relative to the start of the recording, and
+    # how long it took, in seconds
+    started: float
+    latency: float
+
+    def to_json(self) -> Dict:
+        data = asdict(self)
+        try:
+            data["body"] = self.body.decode("utf-8")
+        except UnicodeDecodeError:
+            del data["body"]
+            data["body_b64"] = base64.b64encode(self.body).decode("ascii")
+        return data
+
+    @classmethod
+    def from_json(cls, data: Dict) -> "Interaction":
+        if "body_b64" in data:
+            data["body"] = base64.b64decode(data.pop("body_b64"))
+        else:
+            data["body"] = data["body"].encode("utf-8")
+        return cls(**data)
+
+
+class Cassette:
+    """The interactions of a recording."""
+
+    def __init__(self, interactions: Optional[List[Interaction]] = None):
+        self.interactions = interactions or []
+        self._origin = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, method: str, url: str, body: Optional[bytes],
+               start: float, response: Optional[TransportResponse]):
+        """Records a request sent at start, as given by time.monotonic, and
+        its response - None if it timed out."""
+        interaction = Interaction(
+            method=method, path=request_path(url),
+            body_digest=body_digest(body),
+            status=None if response is None else response.status,
+            reason="" if response is None else response.reason,
+            body=b"" if response is None else response.body,
+            started=start - self._origin,
+            latency=time.monotonic() - start)
+        with self._lock:
+            self.interactions.append(interaction)
+
+    def save(self, path: str):
+        with self._lock:
+            interactions = list(self.interactions)
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            f.write(json.dumps({"version": CASSETTE_VERSION}) + "\n")
+            for interaction in interactions:
+                f.write(json.dumps(interaction.to_json()) + "\n")
+
+    @classmethod
+    def load(cls, path: str) -> "Cassette":
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            if header.get("version") != CASSETTE_VERSION:
+                raise RuntimeError(f"Unsupported cassette version "
+                                   f"{header.get('version')} in '{path}'.")
+            return cls([Interaction.from_json(json.loads(line))
+                        for line in f if line.strip()])
+
+
+def request_path(url: str) -> str:
+    """The path and the query of a URL - which identify a request to any
+    WebProxy."""
+    parts = urlsplit(url)
+    return f"{parts.path}?{parts.query}" if parts.query else parts.path
+
+
+def body_digest(body: Optional[bytes]) -> Optional[str]:
+    if body is None:
+        return None
+    return hashlib.sha1(body).hexdigest()
+
+
+class RecordingAsyncTransport(AsyncTransport):
+    """Sends the requests with another transport and records them, with
+    their responses, to a cassette saved when the transport is closed.
+
+    Parameters:
+    path(str): the cassette file.
+
+    transport(str or AsyncTransport): the transport sending the requests, as
+    accepted by the AsyncKaraboProxy.
+    """
+
+    def __init__(self, path: str,
+                 transport: Union[str, AsyncTransport, None] = None):
+        self.path = path
+        self.cassette = Cassette()
+        self._transport = create_async_transport(transport)
+
+    @property
+    def tracer(self):
+        return self._transport.tracer
+
+    @tracer.setter
+    def tracer(self, tracer):
+        self._transport.tracer = tracer
+
+    async def request(self, method: str, url: str, headers: Dict[str, str],
+                      body: Optional[bytes] = None,
+                      timeout: Optional[Timeout] = None) -> TransportResponse:
+        start = time.monotonic()
+        try:
+            response = await self._transport.request(method, url, headers,
+                                                     body, timeout)
+        except (asyncio.TimeoutError, TimeoutError):
+            self.cassette.record(method, url, body, start, None)
+            raise
+        # Cancelled requests are not recorded, unless the total timeout of
+        # the client cancelled them - see timed_out
+        self.cassette.record(method, url, body, start, response)
+        return response
+
+    def timed_out(self, method: str, url: str, body: Optional[bytes],
+                  start: float):
+        self.cassette.record(method, url, body, start, None)
+
+    async def close(self):
+        await self._transport.close()
+        self.cassette.save(self.path)
+
+
+class RecordingSyncTransport(SyncTransport):
+    """Sends the requests with another transport and records them, with
+    their responses, to a cassette saved when the transport is closed.
+
+    Parameters:
+    path(str): the cassette file.
+
+    transport(str or SyncTransport): the transport sending the requests, as
+    accepted by the SyncKaraboProxy.
+    """
+
+    def __init__(self, path: str,
+                 transport: Union[str, SyncTransport, None] = None):
+        self.path = path
+        self.cassette = Cassette()
+        self._transport = create_sync_transport(transport)
+
+    @property
+    def tracer(self):
+        return self._transport.tracer
+
+    @tracer.setter
+    def tracer(self, tracer):
+        self._transport.tracer = tracer
+
+    def request(self, method: str, url: str, headers: Dict[str, str],
+                body: Optional[bytes] = None,
+                timeout: Optional[Timeout] = None) -> TransportResponse:
+        start = time.monotonic()
+        try:
+            response = self._transport.request(method, url, headers, body,
+                                               timeout)
+        except TimeoutError:
+            self.cassette.record(method, url, body, start, None)
+            raise
+        self.cassette.record(method, url, body, start, response)
+        return response
+
+    def close(self):
+        self._transport.close()
+        self.cassette.save(self.path)
+
+
+class Replayer:
+    """Serves the interactions of a cassette matching requests: the
+    responses recorded for the same request are served in turn, starting
+    over once all were served."""
+
+    def __init__(self, cassette: Cassette, latency_scale: float = 1.0):
+        self.latency_scale = latency_scale
+        self._interactions: Dict[Tuple, List[Interaction]] = {}
+        self._served: Dict[Tuple, int] = {}
+        self._lock = threading.Lock()
+        for interaction in cassette.interactions:
+            key = (interaction.method, interaction.path,
+                   interaction.body_digest)
+            self._interactions.setdefault(key, []).append(interaction)
+
+    def next(self, method: str, url: str,
+             body: Optional[bytes]) -> Optional[Interaction]:
+        """The interaction to replay for a request, if any was recorded."""
+        key = (method, request_path(url), body_digest(body))
+        interactions = self._interactions.get(key)
+        if not interactions:
+            return None
+        with self._lock:
+            served = self._served.get(key, 0)
+            self._served[key] = served + 1
+        return interactions[served % len(interactions)]
+
+    def delay(self, interaction: Optional[Interaction]) -> float:
+        if interaction is None:
+            return 0.0
+        return interaction.latency * self.latency_scale
+
+
+def _replayed_response(
+        interaction: Optional[Interaction]) -> TransportResponse:
+    if interaction is None:
+        return TransportResponse(status=404, reason=NOT_RECORDED, body=b"")
+    if interaction.status is None:
+        raise TimeoutError("The recorded request timed out")
+    return TransportResponse(status=interaction.status,
+                             reason=interaction.reason, body=interaction.body)
+
+
+class ReplayAsyncTransport(AsyncTransport):
+    """Replays a cassette instead of sending requests, responding after the
+    recorded latencies scaled by latency_scale - 0 to respond at once.
+    Requests missing from the cassette get 404 responses."""
+
+    def __init__(self, path: str, latency_scale: float = 1.0):
+        self._replayer = Replayer(Cassette.load(path), latency_scale)
+
+    async def request(self, method: str, url: str, headers: Dict[str, str],
+                      body: Optional[bytes] = None,
+                      timeout: Optional[Timeout] = None) -> TransportResponse:
+        interaction = self._replayer.next(method, url, body)
+        delay = self._replayer.delay(interaction)
+        if delay > 0.0:
+            await asyncio.sleep(delay)
+        return _replayed_response(interaction)
+
+
+class ReplaySyncTransport(SyncTransport):
+    """Replays a cassette instead of sending requests, responding after the
+    recorded latencies scaled by latency_scale - 0 to respond at once.
+    Requests missing from the cassette get 404 responses.
+
+    A request whose replayed latency exceeds its total timeout raises
+    TimeoutError once the timeout expired."""
+
+    def __init__(self, path: str, latency_scale: float = 1.0):
+        self._replayer = Replayer(Cassette.load(path), latency_scale)
+
+    def request(self, method: str, url: str, headers: Dict[str, str],
+                body: Optional[bytes] = None,
+                timeout: Optional[Timeout] = None) -> TransportResponse:
+        interaction = self._replayer.next(method, url, body)
+        delay = self._replayer.delay(interaction)
+        if (timeout is not None and timeout.total is not None
+                and delay > timeout.total):
+            time.sleep(timeout.total)
+            raise TimeoutError(
+                f"No complete response within {timeout.total} s")
+        if delay > 0.0:
+            time.sleep(delay)
+        return _replayed_response(interaction)
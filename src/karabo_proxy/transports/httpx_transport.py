@@ -0,0 +1,306 @@
+import asyncio
+import time
+from typing import Any, AsyncGenerator, Callable, Dict, List, Optional, Set
+
+import httpx
+
+from ..tracing import PhaseTimes
+from . import (
+    AsyncTransport, EventStreamChannel, PushChannel, SyncTransport, Timeout,
+    TransportResponse, check_total_timeout, is_event_stream)
+
+# Steps of the requests reported by httpcore -> phases traced
+_TRACED_STEPS = {
+    "connect_tcp": "connect",
+    "start_tls": "tls",
+    "send_request_headers": "send",
+    "send_request_body": "send",
+    "receive_response_headers": "wait",
+    "receive_response_body": "receive",
+}
+
+# Errors of servers that don't speak HTTP/2 when receiving its preface:
+# they either answer with an HTTP/1.1 error or reset the connection.
+_H2_REJECTED = (httpx.RemoteProtocolError, httpx.ReadError, httpx.WriteError)
+
+# Methods of the requests finding out whether an origin speaks HTTP/2, as
+# they may be retried over HTTP/1.1: the PUTs of the WebProxy execute slots,
+# which can't be assumed idempotent.
+_PROBING_METHODS = frozenset(("GET", "HEAD", "OPTIONS"))
+
+
+class _Http2Fallback:
+    """Book-keeping of the origins reached over HTTP/2 or HTTP/1.1.
+
+    Over TLS, the HTTP version is negotiated through ALPN by a client that
+    supports both versions. Plain "http://" origins are first tried with
+    HTTP/2 prior knowledge (h2c), by the requests of safe methods only
+    until one succeeds: a server that doesn't speak HTTP/2 takes the
+    preface for an invalid HTTP/1.1 request and closes or resets the
+    connection, before any response. The origin is then served over
+    HTTP/1.1 from then on and the request retried - it never reached the
+    application, and is safe anyway. The requests of other methods go over
+    HTTP/1.1 until the origin is known to speak HTTP/2: a rejection can't
+    be told from a connection lost while they are processed. Once an origin
+    answered over HTTP/2, its connection errors are never taken for a
+    rejection.
+    """
+
+    def __init__(self):
+        self._h2_origins: Set[str] = set()
+        self._http1_origins: Set[str] = set()
+
+    def use_prior_knowledge(self, method: str, url: httpx.URL) -> bool:
+        if url.scheme != "http":
+            return False
+        origin = self._origin(url)
+        if origin in self._h2_origins:
+            return True
+        return (origin not in self._http1_origins
+                and method in _PROBING_METHODS)
+
+    def on_success(self, url: httpx.URL):
+        self._h2_origins.add(self._origin(url))
+
+    def should_fall_back(self, url: httpx.URL) -> bool:
+        """Called when a prior knowledge request got no response: whether
+        the server rejected HTTP/2, the request to be retried over
+        HTTP/1.1."""
+        origin = self._origin(url)
+        if origin in self._h2_origins:
+            return False
+        self._http1_origins.add(origin)
+        return True
+
+    @staticmethod
+    def _origin(url: httpx.URL) -> str:
+        return f"{url.scheme}://{url.host}:{url.port}"
+
+
+class HttpxAsyncTransport(AsyncTransport):
+    """Asynchronous transport based on httpx. As for the aiohttp transport,
+    the clients - and their connection pools - are bound to the event loop
+    they were created on and replaced when the transport is used from
+    another loop.
+
+    Parameters:
+    http2(bool): multiplex requests over HTTP/2 connections, falling back to
+    HTTP/1.1 for servers that don't support it. Requires the 'h2' package.
+
+    client_kwargs: extra keyword arguments for the httpx AsyncClient.
+    """
+
+    def __init__(self, http2: bool = False, **client_kwargs: Any):
+        self._client_kwargs = client_kwargs
+        self._fallback = _Http2Fallback() if http2 else None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._h2c_client: Optional[httpx.AsyncClient] = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._clients_closer: Optional[AsyncGenerator[None, None]] = None
+
+    async def request(self, method: str, url: str, headers: Dict[str, str],
+                      body: Optional[bytes] = None,
+                      timeout: Optional[Timeout] = None) -> TransportResponse:
+        await self._create_clients()
+        request_url = httpx.URL(url)
+        kwargs = _request_kwargs(headers, body, timeout)
+        phases = None
+        if self.tracer is not None:
+            phases = PhaseTimes()
+            trace = _trace_callback(phases)
+
+            async def async_trace(event_name: str, info: Dict[str, Any]):
+                trace(event_name, info)
+
+            kwargs["extensions"] = {"trace": async_trace}
+        try:
+            if (self._fallback is not None
+                    and self._fallback.use_prior_knowledge(
+                        method, request_url)):
+                try:
+                    resp = await self._h2c_client.request(
+                        method, request_url, **kwargs)
+                    self._fallback.on_success(request_url)
+                    return _to_transport_response(resp, phases, self.tracer)
+                except _H2_REJECTED:
+                    if not self._fallback.should_fall_back(request_url):
+                        raise
+            resp = await self._client.request(method, request_url, **kwargs)
+        except httpx.TimeoutException as te:
+            raise TimeoutError(str(te)) from te
+        return _to_transport_response(resp, phases, self.tracer)
+
+    async def open_event_stream(
+            self, url: str, headers: Dict[str, str],
+            timeout: Optional[Timeout] = None) -> PushChannel:
+        await self._create_clients()
+        # The stream is open-ended: only the connection is timed out
+        connect = timeout.connect if timeout is not None else None
+        request = self._client.build_request(
+            "GET", url, headers={**headers, "accept": "text/event-stream"},
+            timeout=httpx.Timeout(None, connect=connect))
+        try:
+            resp = await self._client.send(request, stream=True)
+        except httpx.TimeoutException as te:
+            raise TimeoutError(str(te)) from te
+        except httpx.TransportError as te:
+            raise ConnectionError(str(te)) from te
+        if not is_event_stream(resp.status_code,
+                               resp.headers.get("content-type")):
+            await resp.aclose()
+            raise RuntimeError(f"No event stream: {resp.reason_phrase} "
+                               f"({resp.status_code})")
+        return EventStreamChannel(_lines(resp), resp.aclose)
+
+    async def _create_clients(self):
+        """Creates the clients, if not created for the running loop - the
+        clients of another loop being closed first."""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            await self.close()
+            http2 = self._fallback is not None
+            self._client = httpx.AsyncClient(http2=http2,
+                                             **self._client_kwargs)
+            if http2:
+                self._h2c_client = httpx.AsyncClient(
+                    http1=False, http2=True, **self._client_kwargs)
+            self._client_loop = loop
+            # As for the sessions of the aiohttp transport: the event loop
+            # finalizes its pending asynchronous generators when shutting
+            # down, which closes the clients while their loop is running.
+            self._clients_closer = _close_on_shutdown(
+                [self._client, self._h2c_client])
+            await self._clients_closer.__anext__()
+
+    async def close(self):
+        if self._clients_closer is not None:
+            await self._clients_closer.aclose()
+        self._client = None
+        self._h2c_client = None
+        self._client_loop = None
+        self._clients_closer = None
+
+
+class HttpxSyncTransport(SyncTransport):
+    """Synchronous transport based on httpx.
+
+    Parameters:
+    http2(bool): multiplex requests over HTTP/2 connections, falling back to
+    HTTP/1.1 for servers that don't support it. Requires the 'h2' package.
+
+    client_kwargs: extra keyword arguments for the httpx Client.
+
+    The total timeout of a request bounds its connect and read timeouts and
+    is checked once the response has been received.
+    """
+
+    def __init__(self, http2: bool = False, **client_kwargs: Any):
+        self._fallback = _Http2Fallback() if http2 else None
+        self._client = httpx.Client(http2=http2, **client_kwargs)
+        self._h2c_client = None
+        if http2:
+            self._h2c_client = httpx.Client(http1=False, http2=True,
+                                            **client_kwargs)
+
+    def request(self, method: str, url: str, headers: Dict[str, str],
+                body: Optional[bytes] = None,
+                timeout: Optional[Timeout] = None) -> TransportResponse:
+        start = time.monotonic()
+        request_url = httpx.URL(url)
+        kwargs = _request_kwargs(headers, body, timeout)
+        phases = None
+        if self.tracer is not None:
+            phases = PhaseTimes()
+            kwargs["extensions"] = {"trace": _trace_callback(phases)}
+        try:
+            if (self._fallback is not None
+                    and self._fallback.use_prior_knowledge(
+                        method, request_url)):
+                try:
+                    resp = self._h2c_client.request(method, request_url,
+                                                    **kwargs)
+                    self._fallback.on_success(request_url)
+                    check_total_timeout(timeout, start)
+                    return _to_transport_response(resp, phases, self.tracer)
+                except _H2_REJECTED:
+                    if not self._fallback.should_fall_back(request_url):
+                        raise
+            resp = self._client.request(method, request_url, **kwargs)
+        except httpx.TimeoutException as te:
+            raise TimeoutError(str(te)) from te
+        check_total_timeout(timeout, start)
+        return _to_transport_response(resp, phases, self.tracer)
+
+    def close(self):
+        self._client.close()
+        if self._h2c_client is not None:
+            self._h2c_client.close()
+
+
+class Http2AsyncTransport(HttpxAsyncTransport):
+    """HttpxAsyncTransport multiplexing requests over HTTP/2."""
+
+    def __init__(self, **client_kwargs: Any):
+        super().__init__(http2=True, **client_kwargs)
+
+
+class Http2SyncTransport(HttpxSyncTransport):
+    """HttpxSyncTransport multiplexing requests over HTTP/2."""
+
+    def __init__(self, **client_kwargs: Any):
+        super().__init__(http2=True, **client_kwargs)
+
+
+async def _close_on_shutdown(
+        clients: List[Optional[httpx.AsyncClient]]
+) -> AsyncGenerator[None, None]:
+    try:
+        yield
+    finally:
+        for client in clients:
+            if client is not None:
+                await client.aclose()
+
+
+async def _lines(resp: httpx.Response) -> AsyncGenerator[str, None]:
+    """The lines of a streamed response body, as they are received."""
+    try:
+        async for line in resp.aiter_lines():
+            yield line
+    except httpx.TransportError as te:
+        raise ConnectionError(str(te)) from te
+
+
+def _request_kwargs(headers: Dict[str, str], body: Optional[bytes],
+                    timeout: Optional[Timeout]) -> Dict[str, Any]:
+    kwargs = {"headers": headers, "content": body}
+    if timeout is not None:
+        connect, read = timeout.socket_timeouts()
+        kwargs["timeout"] = httpx.Timeout(None, connect=connect, read=read)
+    return kwargs
+
+
+def _trace_callback(
+        phases: PhaseTimes) -> Callable[[str, Dict[str, Any]], None]:
+    """Collects the phases of a request from the trace events of httpcore,
+    e.g. "http11.send_request_headers.started"."""
+    def trace(event_name: str, info: Dict[str, Any]):
+        *_, step, state = event_name.split(".")
+        phase = _TRACED_STEPS.get(step)
+        if phase is None:
+            return
+        if state == "started":
+            phases.start(phase)
+        else:
+            phases.end(phase)
+    return trace
+
+
+def _to_transport_response(resp: httpx.Response,
+                           phases: Optional[PhaseTimes],
+                           tracer: Any) -> TransportResponse:
+    if phases is not None:
+        phases.record(tracer)
+    return TransportResponse(status=resp.status_code,
+                             reason=resp.reason_phrase,
+                             body=resp.content)
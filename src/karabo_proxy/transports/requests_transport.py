@@ -0,0 +1,54 @@
+import time
+from typing import Dict, Optional
+
+import requests
+
+from ..tracing import PhaseTimes
+from . import SyncTransport, Timeout, TransportResponse, check_total_timeout
+
+
+class RequestsTransport(SyncTransport):
+    """Transport based on requests. Connections are kept alive in the pool
+    of a requests Session.
+
+    The total timeout of a request bounds its connect and read timeouts and
+    is checked once the response has been received.
+
+    Traced requests have two phases: wait, until the response headers are
+    received - including connecting and sending the request, which requests
+    doesn't expose - and receive, the reading of the body.
+    """
+
+    def __init__(self):
+        self._session = requests.Session()
+
+    def request(self, method: str, url: str, headers: Dict[str, str],
+                body: Optional[bytes] = None,
+                timeout: Optional[Timeout] = None) -> TransportResponse:
+        start = time.monotonic()
+        phases = None
+        if self.tracer is not None:
+            phases = PhaseTimes()
+            phases.start("wait")
+        try:
+            # The body of a traced request is read separately
+            resp = self._session.request(
+                method, url, headers=headers, data=body,
+                timeout=None if timeout is None else timeout.socket_timeouts(),
+                stream=phases is not None)
+            if phases is not None:
+                phases.end("wait")
+                phases.start("receive")
+            content = resp.content
+        except requests.exceptions.Timeout as te:
+            raise TimeoutError(str(te)) from te
+        if phases is not None:
+            phases.end("receive")
+            phases.record(self.tracer)
+        check_total_timeout(timeout, start)
+        return TransportResponse(status=resp.status_code,
+                                 reason=str(resp.reason),
+                                 body=content)
+
+    def close(self):
+        self._session.close()
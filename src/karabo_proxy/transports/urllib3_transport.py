@@ -0,0 +1,57 @@
+from typing import Dict, Optional
+
+import urllib3
+
+from ..tracing import PhaseTimes
+from . import SyncTransport, Timeout, TransportResponse
+
+
+class Urllib3Transport(SyncTransport):
+    """Transport based directly on urllib3, without the overhead of
+    requests. As with requests, failed requests are not retried.
+
+    Traced requests have two phases: wait, until the response headers are
+    received - including connecting and sending the request - and receive,
+    the reading of the body.
+    """
+
+    def __init__(self):
+        self._pool_manager = urllib3.PoolManager(retries=False)
+
+    def request(self, method: str, url: str, headers: Dict[str, str],
+                body: Optional[bytes] = None,
+                timeout: Optional[Timeout] = None) -> TransportResponse:
+        kwargs = {}
+        if timeout is not None:
+            kwargs["timeout"] = urllib3.Timeout(
+                total=timeout.total, connect=timeout.connect,
+                read=timeout.read)
+        phases = None
+        if self.tracer is not None:
+            phases = PhaseTimes()
+            phases.start("wait")
+            # The body of a traced request is read separately
+            kwargs["preload_content"] = False
+        try:
+            resp = self._pool_manager.request(method, url, headers=headers,
+                                              body=body, redirect=False,
+                                              **kwargs)
+            if phases is not None:
+                phases.end("wait")
+                phases.start("receive")
+                try:
+                    data = resp.data
+                finally:
+                    resp.release_conn()
+                phases.end("receive")
+                phases.record(self.tracer)
+            else:
+                data = resp.data
+        except urllib3.exceptions.TimeoutError as te:
+            raise TimeoutError(str(te)) from te
+        return TransportResponse(status=resp.status,
+                                 reason=str(resp.reason),
+                                 body=data)
+
+    def close(self):
+        self._pool_manager.clear()